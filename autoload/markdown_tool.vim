@@ -0,0 +1,318 @@
+"---------------------------------------------------------------
+" Plugin:      https://github.com/dpretet/vim-markdow-tool
+" Description: A simple plugin to assist writing in markdown
+" Maintainer:  Damien Pretet https://github.com/dpretet
+"---------------------------------------------------------------
+
+" Sourced on the first call to a markdown_tool# function, from a command,
+" the markdown FileType or the pre-warm timer. Only then the Python
+" interpreter starts and the Python part of the plugin is loaded.
+
+" Calling it is enough to load the plugin, by sourcing this file
+function! markdown_tool#Load()
+endfunction
+
+" Require Python3
+if !has("python3")
+    echo "vim has to be compiled with +python3 to run markdown-tool plugin"
+    finish
+endif
+
+" Save compatible mode
+let s:save_cpo = &cpo
+" Reset compatible mode to default value
+set cpo&vim
+
+"--------------------------------------------------------
+" Load here the python part of the plugin
+"--------------------------------------------------------
+
+" Get current plugin directory
+let s:plugin_root_dir = fnamemodify(resolve(expand('<sfile>:p')), ':h')
+
+" Load python module
+python3 << EOF
+import sys
+from os.path import normpath, join
+import vim
+plugin_root_dir = vim.eval('s:plugin_root_dir')
+python_root_dir = normpath(join(plugin_root_dir, '..', 'python'))
+sys.path.insert(0, python_root_dir)
+import markdown_tool
+EOF
+
+" Release the document index of the buffers wiped out
+augroup markdown_tool_loaded
+    autocmd!
+    autocmd BufWipeout * python3 markdown_tool.drop_index(int(vim.eval("expand('<abuf>')")))
+    autocmd TextChangedI * call markdown_tool#LiveAlignSchedule()
+    autocmd InsertLeave * call markdown_tool#LiveAlign()
+augroup END
+
+" Neovim notifies the changes of g:mardownToolDebug, so the Python side
+" reads it only then. Vim reads it again on each command.
+function! markdown_tool#DebugChanged(dict, key, change)
+    python3 markdown_tool.refresh_debug_level()
+endfunction
+
+if has('nvim')
+    call dictwatcheradd(g:, 'mardownToolDebug', 'markdown_tool#DebugChanged')
+endif
+
+"---------------------------------------------------------
+" Bind the python functions to call them from command mode
+"---------------------------------------------------------
+
+" Run a command of the Python side. Its arguments and a snapshot of the
+" editor state are sent along, encoded in the call itself, so the command
+" doesn't need to ask Vim for them: the cursor, the current line,
+" b:changedtick, the indentation and the plugin options. Single quotes are
+" escaped in the JSON, which then fits in a Python raw string.
+function! s:Run(command, context)
+    let context = extend({
+                \ 'command': a:command,
+                \ 'params': [],
+                \ 'args': [],
+                \ 'bang': 0,
+                \ 'cursor': [line('.'), col('.') - 1],
+                \ 'line': getline('.'),
+                \ 'changedtick': b:changedtick,
+                \ 'path': expand('%:p'),
+                \ 'cwd': getcwd(),
+                \ 'shiftwidth': shiftwidth(),
+                \ 'expandtab': &expandtab,
+                \ 'tabstop': &tabstop,
+                \ 'options': filter(copy(g:), 'v:key =~# "^mardownTool"'),
+                \ }, a:context)
+    execute "python3 markdown_tool.dispatch(r'" .
+                \ substitute(json_encode(context), "'", '\\u0027', 'g') . "')"
+endfunction
+
+function! markdown_tool#AddTask(...)
+    call s:Run('add_task', {'args': a:000})
+endfunction
+
+function! markdown_tool#AddSubTask(...)
+    call s:Run('add_sub_task', {'args': a:000})
+endfunction
+
+function! markdown_tool#ChangeToTask() range
+    call s:Run('change_to_task', {'first': a:firstline, 'last': a:lastline})
+endfunction
+
+function! markdown_tool#StatusNew() range
+    call s:Run('change_status', {'args': [g:mardownToolNewStatus],
+                \ 'first': a:firstline, 'last': a:lastline})
+endfunction
+
+function! markdown_tool#StatusOngoing() range
+    call s:Run('change_status', {'args': [g:mardownToolOngoingStatus],
+                \ 'first': a:firstline, 'last': a:lastline})
+endfunction
+
+function! markdown_tool#StatusDone() range
+    call s:Run('change_status', {'args': [g:mardownToolDoneStatus],
+                \ 'first': a:firstline, 'last': a:lastline})
+endfunction
+
+function! markdown_tool#StatusCancel() range
+    call s:Run('change_status', {'args': [g:mardownToolCancelStatus],
+                \ 'first': a:firstline, 'last': a:lastline})
+endfunction
+
+function! markdown_tool#TaskProgress()
+    call s:Run('task_progress', {})
+endfunction
+
+function! markdown_tool#TaskIndex(...)
+    call s:Run('task_summary', {'args': a:000})
+endfunction
+
+function! markdown_tool#TaskQuery(bang, ...)
+    call s:Run('task_query', {'args': a:000, 'bang': a:bang})
+endfunction
+
+function! markdown_tool#AddTable(...)
+    call s:Run('add_table', {'args': a:000})
+endfunction
+
+function! markdown_tool#AddCode(...)
+    call s:Run('add_code', {'args': a:000})
+endfunction
+
+function! markdown_tool#FormatCode(bang)
+    call s:Run('format_code', {'bang': a:bang})
+endfunction
+
+function! markdown_tool#Prettify()
+    call s:Run('table_transformation', {})
+endfunction
+
+function! markdown_tool#PrettifyAll()
+    call s:Run('prettify_all', {})
+endfunction
+
+function! markdown_tool#AddColumn()
+    call s:Run('table_transformation', {'params': ['add_column']})
+endfunction
+
+function! markdown_tool#AddRow()
+    call s:Run('table_transformation', {'params': ['add_row']})
+endfunction
+
+function! markdown_tool#SwapColumn()
+    call s:Run('table_transformation', {'params': ['swap_column']})
+endfunction
+
+function! markdown_tool#SwapRow()
+    call s:Run('table_transformation', {'params': ['swap_row']})
+endfunction
+
+function! markdown_tool#SortTable(bang, ...)
+    call s:Run('sort_table', {'args': a:000, 'bang': a:bang})
+endfunction
+
+function! markdown_tool#FilterTable(bang, args)
+    call s:Run('filter_table', {'args': a:args, 'bang': a:bang})
+endfunction
+
+function! markdown_tool#ImportCsv(...)
+    call s:Run('import_csv', {'args': a:000})
+endfunction
+
+function! markdown_tool#ExportCsv(...)
+    call s:Run('export_csv', {'args': a:000})
+endfunction
+
+function! markdown_tool#AddLink(...)
+    call s:Run('add_link', {'args': a:000})
+endfunction
+
+function! markdown_tool#AddImage(...)
+    call s:Run('add_image', {'args': a:000})
+endfunction
+
+function! markdown_tool#Toc()
+    call s:Run('insert_toc', {})
+endfunction
+
+function! markdown_tool#TocUpdate()
+    call s:Run('update_toc', {})
+endfunction
+
+function! markdown_tool#CheckLinks()
+    call s:Run('check_links', {})
+endfunction
+
+function! markdown_tool#Backlinks(bang)
+    call s:Run('backlinks', {'bang': a:bang})
+endfunction
+
+function! markdown_tool#RenameNote(...)
+    call s:Run('rename_note', {'args': a:000})
+endfunction
+
+function! markdown_tool#CheckLinksPoll(timer)
+    python3 markdown_tool.check_links_poll()
+endfunction
+
+function! markdown_tool#WorkerPoll(timer)
+    python3 markdown_tool.worker_poll()
+endfunction
+
+" Live table alignment, only on the table lines of markdown buffers,
+" debounced by a timer restarted on each change
+let s:live_align_timer = -1
+
+function! s:LiveAlignEnabled()
+    return g:mardownToolLiveAlign && &filetype =~# '^markdown' &&
+                \ getline('.') =~# '^\s*|'
+endfunction
+
+function! markdown_tool#LiveAlignSchedule()
+    if !s:LiveAlignEnabled()
+        return
+    endif
+    if g:mardownToolLiveAlignDelay <= 0 || !has('timers')
+        call markdown_tool#LiveAlign()
+        return
+    endif
+    call timer_stop(s:live_align_timer)
+    let s:live_align_timer = timer_start(g:mardownToolLiveAlignDelay,
+                \ 'markdown_tool#LiveAlign')
+endfunction
+
+function! markdown_tool#LiveAlign(...)
+    if s:live_align_timer != -1
+        call timer_stop(s:live_align_timer)
+        let s:live_align_timer = -1
+    endif
+    if s:LiveAlignEnabled()
+        call s:Run('live_align', {})
+    endif
+endfunction
+
+" Folding: the foldexpr reads the level of a line from b:markdown_tool_folds,
+" the Python side updating the list once per change of the buffer
+function! s:UpdateFolds()
+    if get(b:, 'markdown_tool_fold_tick', -1) != b:changedtick
+        call s:Run('update_folds', {'full': !exists('b:markdown_tool_folds')})
+    endif
+endfunction
+
+function! markdown_tool#FoldLevel(lnum)
+    call s:UpdateFolds()
+    return get(b:markdown_tool_folds, a:lnum - 1, 0)
+endfunction
+
+" The fold levels of the lines first to last, in a single call
+function! markdown_tool#FoldLevels(first, last)
+    call s:UpdateFolds()
+    return b:markdown_tool_folds[a:first - 1 : a:last - 1]
+endfunction
+
+function! markdown_tool#FoldEnable()
+    setlocal foldmethod=expr foldexpr=markdown_tool#FoldLevel(v:lnum)
+endfunction
+
+" Statistics: the words, the reading time and the tasks of the document,
+" counted by the Python side once per change of the buffer, so a statusline
+" only reads them from b:markdown_tool_stats
+function! markdown_tool#Stats()
+    if &filetype !~# '^markdown'
+        return {}
+    endif
+    if get(b:, 'markdown_tool_stats_tick', -1) != b:changedtick
+        call s:Run('update_stats', {})
+    endif
+    return b:markdown_tool_stats
+endfunction
+
+" The statistics written out, for %{markdown_tool#StatusLine()}
+function! markdown_tool#StatusLine()
+    return get(markdown_tool#Stats(), 'text', '')
+endfunction
+
+function! markdown_tool#Profile(...)
+    call s:Run('profile', {'args': a:000})
+endfunction
+
+function! markdown_tool#ProfileComplete(ArgLead, CmdLine, CursorPos)
+    return "start\nstop\nreset\nreport"
+endfunction
+
+function! markdown_tool#ToHtml(...)
+    call s:Run('to_html', {'args': a:000})
+endfunction
+
+function! markdown_tool#Preview(...)
+    call s:Run('preview', {'args': a:000})
+endfunction
+
+function! markdown_tool#PreviewComplete(ArgLead, CmdLine, CursorPos)
+    return "stop"
+endfunction
+
+" Restore compatible mode
+let &cpo = s:save_cpo
+unlet s:save_cpo
@@ -4,11 +4,8 @@
 " Maintainer:  Damien Pretet https://github.com/dpretet
 "---------------------------------------------------------------
 
-" Require Python3
-if !has("python3")
-    echo "vim has to be compiled with +python3 to run markdown-tool plugin"
-    finish
-endif
+" Python3 support is checked when the plugin is loaded, in the autoload
+" part: in Neovim, has("python3") already starts a Python process
 
 " Check plugin has been loaded before
 if exists('loaded_markdown_tool') || &cp
@@ -25,190 +22,216 @@ set cpo&vim
 "--------------------------------------------------------
 " Plugin variable
 "--------------------------------------------------------
-if !has('g:mardownToolNewStatus')
+if !exists('g:mardownToolNewStatus')
     let g:mardownToolNewStatus = " "
 endif
 
-if !has('g:mardownToolOngoingStatus')
+if !exists('g:mardownToolOngoingStatus')
     let g:mardownToolOngoingStatus = "-"
 endif
 
-if !has('g:mardownToolDoneStatus')
+if !exists('g:mardownToolDoneStatus')
     let g:mardownToolDoneStatus = "X"
 endif
 
-if !has('g:mardownToolCancelStatus')
+if !exists('g:mardownToolCancelStatus')
     let g:mardownToolCancelStatus = "C"
 endif
 
-if !has('g:mardownToolDebug')
+if !exists('g:mardownToolDebug')
     let g:mardownToolDebug = 0
 endif
-"--------------------------------------------------------
-" Load here the python part of the plugin
-"--------------------------------------------------------
 
-" Get current plugin directory
-let s:plugin_root_dir = fnamemodify(resolve(expand('<sfile>:p')), ':h')
-
-" Load python module
-python3 << EOF
-import sys
-from os.path import normpath, join
-import vim
-plugin_root_dir = vim.eval('s:plugin_root_dir')
-python_root_dir = normpath(join(plugin_root_dir, '..', 'python'))
-sys.path.insert(0, python_root_dir)
-import markdown_tool
-EOF
-
-"---------------------------------------------------------
-" Bind the python functions to call them from command mode
-"---------------------------------------------------------
-
-" Bind python functions into Vim functions
-
-function! MdAddTask(...)
-    let task_desc = ""
-    if a:0 > 0
-        let task_desc = a:1
-    endif
-    python3 markdown_tool.add_task()
-    unlet task_desc
-endfunction
+" Mark a task done when all its subtasks are done, once its progress
+" is annotated with MdTaskProgress
+if !exists('g:mardownToolTaskAutoComplete')
+    let g:mardownToolTaskAutoComplete = 0
+endif
 
-function! MdAddSubTask(...)
-    let task_desc = ""
-    if a:0 > 0
-        let task_desc = a:1
-    endif
-    python3 markdown_tool.add_sub_task()
-    unlet task_desc
-endfunction
+" Number of processes parsing the project files for the task index,
+" 0 to use all the CPUs
+if !exists('g:mardownToolTaskWorkers')
+    let g:mardownToolTaskWorkers = 0
+endif
 
-function! MdChangeToTask()
-    python3 markdown_tool.change_to_task()
-endfunction
+if !exists('g:mardownToolCacheDir')
+    let g:mardownToolCacheDir = "~/.cache/vim-markdown-tool"
+endif
 
+" Links checker: results lifetime (in seconds), number of web requests
+" running at a time, in total and per host, and request timeout (in seconds)
+if !exists('g:mardownToolLinkTTL')
+    let g:mardownToolLinkTTL = 86400
+endif
 
-function! MdStatusNew()
-    let task_status = g:mardownToolNewStatus
-    python3 markdown_tool.change_status()
-    unlet task_status
-endfunction
+if !exists('g:mardownToolLinkWorkers')
+    let g:mardownToolLinkWorkers = 16
+endif
 
+if !exists('g:mardownToolLinkPerHost')
+    let g:mardownToolLinkPerHost = 2
+endif
 
-function! MdStatusOngoing()
-    let task_status = g:mardownToolOngoingStatus
-    python3 markdown_tool.change_status()
-    unlet task_status
-endfunction
+if !exists('g:mardownToolLinkTimeout')
+    let g:mardownToolLinkTimeout = 10
+endif
 
+" Background worker: the long commands (MdPrettifyAll, MdTocUpdate,
+" MdImportCsv, MdTaskSummary, MdTaskQuery) estimated to last longer than
+" the threshold (in ms) run in a separate Python process. 0 sends them
+" always to the worker, -1 never.
+if !exists('g:mardownToolWorkerThreshold')
+    let g:mardownToolWorkerThreshold = 200
+endif
 
-function! MdStatusDone()
-    let task_status = g:mardownToolDoneStatus
-    python3 markdown_tool.change_status()
-    unlet task_status
-endfunction
+" Python interpreter running the worker
+if !exists('g:mardownToolWorkerPython')
+    let g:mardownToolWorkerPython = "python3"
+endif
 
+" Live table alignment: align the table under the cursor while typing,
+" once the typing pauses for the delay (in ms) and when leaving insert mode
+if !exists('g:mardownToolLiveAlign')
+    let g:mardownToolLiveAlign = 0
+endif
 
-function! MdStatusCancel()
-    let task_status = g:mardownToolCancelStatus
-    python3 markdown_tool.change_status()
-    unlet task_status
-endfunction
+if !exists('g:mardownToolLiveAlignDelay')
+    let g:mardownToolLiveAlignDelay = 150
+endif
 
-function! MdAddTable(...)
-    let description = a:000
-    python3 markdown_tool.add_table()
-    let description = a:000
-endfunction
+" Live preview: port of the server on localhost, 0 for a free one, and
+" whether to open the preview in the browser
+if !exists('g:mardownToolPreviewPort')
+    let g:mardownToolPreviewPort = 0
+endif
 
-function! MdAddCode(...)
-    let lang = ""
-    if a:0 > 0
-        let lang = a:1
-    endif
-    python3 markdown_tool.add_code()
-    unlet lang
-endfunction
+if !exists('g:mardownToolPreviewOpen')
+    let g:mardownToolPreviewOpen = 1
+endif
 
-function! MdPrettify()
-    python3 markdown_tool.table_transformation()
-endfunction
+" Fold the sections, the lists, the fenced code and the tables of the
+" markdown buffers
+if !exists('g:mardownToolFolding')
+    let g:mardownToolFolding = 0
+endif
 
-function! MdAddColumn()
-    let description = a:000
-    python3 markdown_tool.table_transformation('add_column')
-    unlet description
-endfunction
+" Reading speed (in words per minute) of the reading time given by
+" markdown_tool#Stats() and markdown_tool#StatusLine()
+if !exists('g:mardownToolReadingSpeed')
+    let g:mardownToolReadingSpeed = 200
+endif
 
-function! MdAddRow()
-    let description = a:000
-    python3 markdown_tool.table_transformation('add_row')
-endfunction
+" Code formatters: the command formatting each language, run by the shell,
+" reading the code on its standard input and printing it formatted, the
+" number of formatters running at a time, 0 for the number of CPUs, and
+" their timeout (in seconds)
+if !exists('g:mardownToolCodeFormatters')
+    let g:mardownToolCodeFormatters = {}
+endif
 
-function! MdSwapColumn()
-    python3 markdown_tool.table_transformation('swap_column')
-endfunction
+if !exists('g:mardownToolCodeWorkers')
+    let g:mardownToolCodeWorkers = 4
+endif
 
-function! MdSwapRow()
-    python3 markdown_tool.table_transformation('swap_row')
-endfunction
+if !exists('g:mardownToolCodeTimeout')
+    let g:mardownToolCodeTimeout = 10
+endif
 
-function! MdAddLink(...)
-    let link = a:000
-    let clip = @+
-    python3 markdown_tool.add_link()
-    unlet link
-    unlet clip
-endfunction
+" Start Python and load the plugin in background once Vim started,
+" so the first command doesn't wait for it
+if !exists('g:mardownToolPrewarm')
+    let g:mardownToolPrewarm = 0
+endif
 
-function! MdAddImage(...)
-    let link = a:000
-    python3 markdown_tool.add_image()
-    unlet link
-endfunction
+"--------------------------------------------------------
+" Load the plugin on demand
+"--------------------------------------------------------
 
-function! MdToHtml()
-    " TODO: %!markdown + simple CSS
+" The Python part of the plugin is loaded by autoload/markdown_tool.vim,
+" on the first command or when a markdown file is opened, so editing
+" other files doesn't start the Python interpreter
+
+function! s:Prewarm(timer)
+    call markdown_tool#Load()
 endfunction
 
+augroup markdown_tool
+    autocmd!
+    autocmd FileType markdown,markdown.* call markdown_tool#Load()
+    autocmd FileType markdown,markdown.* if g:mardownToolFolding |
+                \ call markdown_tool#FoldEnable() | endif
+    if g:mardownToolPrewarm && has('timers')
+        autocmd VimEnter * call timer_start(0, function('s:Prewarm'))
+    endif
+augroup END
+
 " Register the function as a command callable from command mode
 
-command! -nargs=? MdAddTask call MdAddTask(<q-args>)
+command! -nargs=? MdAddTask call markdown_tool#AddTask(<q-args>)
+
+command! -nargs=? MdAddSubTask call markdown_tool#AddSubTask(<q-args>)
+
+command! -nargs=0 -range MdChangeToTask <line1>,<line2>call markdown_tool#ChangeToTask()
+
+command! -nargs=0 -range MdStatusNew <line1>,<line2>call markdown_tool#StatusNew()
+
+command! -nargs=0 -range MdStatusOngoing <line1>,<line2>call markdown_tool#StatusOngoing()
+
+command! -nargs=0 -range MdStatusDone <line1>,<line2>call markdown_tool#StatusDone()
+
+command! -nargs=0 -range MdStatusCancel <line1>,<line2>call markdown_tool#StatusCancel()
+
+command! -nargs=0 MdTaskProgress call markdown_tool#TaskProgress()
+
+command! -nargs=? -complete=dir MdTaskIndex call markdown_tool#TaskIndex(<f-args>)
+
+command! -nargs=* -bang MdTaskQuery call markdown_tool#TaskQuery(<bang>0, <f-args>)
+
+command! -nargs=* MdAddTable call markdown_tool#AddTable(<q-args>)
+
+command! -nargs=? MdAddCode call markdown_tool#AddCode(<q-args>)
+
+command! -nargs=0 -bang MdFormatCode call markdown_tool#FormatCode(<bang>0)
+
+command! -nargs=0 MdPrettify call markdown_tool#Prettify()
+
+command! -nargs=0 MdPrettifyAll call markdown_tool#PrettifyAll()
+
+command! -nargs=* MdAddColumn call markdown_tool#AddColumn()
+
+command! -nargs=* MdAddRow call markdown_tool#AddRow()
 
-command! -nargs=? MdAddSubTask call MdAddSubTask(<q-args>)
+command! -nargs=0 MdSwapColumn call markdown_tool#SwapColumn()
 
-command! -nargs=0 MdChangeToTask call MdChangeToTask()
+command! -nargs=0 MdSwapRow call markdown_tool#SwapRow()
 
-command! -nargs=0 MdStatusNew call MdStatusNew()
+command! -nargs=* -bang MdSortTable call markdown_tool#SortTable(<bang>0, <f-args>)
 
-command! -nargs=0 MdStatusOngoing call MdStatusOngoing()
+command! -nargs=+ -bang MdFilterTable call markdown_tool#FilterTable(<bang>0, <q-args>)
 
-command! -nargs=0 MdStatusDone call MdStatusDone()
+command! -nargs=* -complete=file MdImportCsv call markdown_tool#ImportCsv(<f-args>)
 
-command! -nargs=0 MdStatusCancel call MdStatusCancel()
+command! -nargs=+ -complete=file MdExportCsv call markdown_tool#ExportCsv(<f-args>)
 
-command! -nargs=* MdAddTable call MdAddTable(<q-args>)
+command! -nargs=* MdAddLink call markdown_tool#AddLink(<q-args>)
 
-command! -nargs=? MdAddCode call MdAddCode(<q-args>)
+command! -nargs=* MdAddImage call markdown_tool#AddImage(<q-args>)
 
-command! -nargs=0 MdPrettify call MdPrettify()
+command! -nargs=0 MdToc call markdown_tool#Toc()
 
-command! -nargs=* MdAddColumn call MdAddColumn()
+command! -nargs=0 MdTocUpdate call markdown_tool#TocUpdate()
 
-command! -nargs=* MdAddRow call MdAddRow()
+command! -nargs=0 MdCheckLinks call markdown_tool#CheckLinks()
 
-command! -nargs=0 MdSwapColumn call MdSwapColumn()
+command! -nargs=0 -bang MdBacklinks call markdown_tool#Backlinks(<bang>0)
 
-command! -nargs=0 MdSwapRow call MdSwapRow()
+command! -nargs=1 -complete=file MdRenameNote call markdown_tool#RenameNote(<f-args>)
 
-command! -nargs=* MdAddLink call MdAddLink(<q-args>)
+command! -nargs=* -complete=custom,markdown_tool#ProfileComplete MdProfile call markdown_tool#Profile(<f-args>)
 
-command! -nargs=* MdAddImage call MdAddImage(<q-args>)
+command! -nargs=? -complete=file MdToHtml call markdown_tool#ToHtml(<f-args>)
 
-command! -nargs=0 MdToHtml call MdToHtml()
+command! -nargs=? -complete=custom,markdown_tool#PreviewComplete MdPreview call markdown_tool#Preview(<f-args>)
 
 " Restore compatible mode
 let &cpo = s:save_cpo
@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Plugin:      https://github.com/dpretet/vim-markdow-tool
+Description: Command line interface, to run the plugin transformations on
+             whole projects, in CI or in pre-commit hooks
+Maintainer:  Damien Pretet https://github.com/dpretet
+
+The files are walked lazily and processed one at a time by a pool of
+processes, each reading, transforming and writing back its files, so the
+memory used doesn't depend on the size of the tree. The files found
+unchanged by prettify and toc are remembered with their modification time
+and size, and skipped by the next runs until they change.
+
+This module doesn't depend on Vim.
+"""
+
+import argparse
+import asyncio
+import difflib
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+
+import markdown_core
+import markdown_index
+import markdown_tasks
+
+# Below this number of files, a process pool costs more than it saves
+POOL_THRESHOLD = 32
+
+# Number of files sent at once to a process of the pool
+CHUNK_SIZE = 8
+
+# Version of the cache of the files already clean, bump it when the
+# transformations change
+CACHE_VERSION = 1
+
+DEFAULT_CACHE_DIR = "~/.cache/vim-markdown-tool"
+
+# Transformation of each command rewriting the files
+TRANSFORMATIONS = {
+    "prettify": markdown_core.prettify_document,
+    "toc": markdown_core.update_document_toc,
+}
+
+
+def iter_files(paths):
+    """
+    Walk the paths given on the command line, files or directories, and
+    yield the markdown files with their modification time and size
+    """
+
+    for path in paths:
+        if os.path.isdir(path):
+            yield from markdown_tasks.iter_markdown_files(path)
+            continue
+        try:
+            stat = os.stat(path)
+        except OSError:
+            print("markdown-tool: can't find " + path, file=sys.stderr)
+            continue
+        yield (path, stat.st_mtime_ns, stat.st_size)
+
+
+def read_lines(path):
+    """
+    Read a file
+
+    Returns:
+        - its lines, the line ending used and whether the last line
+          ends with it
+    """
+
+    with open(path, encoding="utf-8", newline="") as source:
+        text = source.read()
+    newline = "\r\n" if "\r\n" in text else "\n"
+    return (markdown_index.split_lines(text), newline, text.endswith("\n"))
+
+
+def write_lines(path, lines, newline, final_newline):
+    text = newline.join(lines)
+    if final_newline and lines:
+        text += newline
+    with open(path, "w", encoding="utf-8", newline="") as target:
+        target.write(text)
+
+
+def transform_file(job):
+    """
+    Apply a transformation to a file, run by the processes of the pool
+
+    Arguments:
+        - job: the command, the path and the mode, "write" to rewrite
+          the file, "check" to only report it, "diff" to print the changes
+
+    Returns:
+        - the path, True if the file changed or would change, the diff,
+          the new (mtime, size) of the file, and an error message or None
+    """
+
+    (name, path, mode) = job
+    try:
+        (lines, newline, final_newline) = read_lines(path)
+        new_lines = TRANSFORMATIONS[name](lines)
+        if new_lines == lines:
+            stat = os.stat(path)
+            return (path, False, "", (stat.st_mtime_ns, stat.st_size), None)
+
+        diff = ""
+        if mode == "diff":
+            diff = "\n".join(difflib.unified_diff(
+                lines, new_lines, path, path, lineterm=""))
+        if mode != "write":
+            return (path, True, diff, None, None)
+
+        write_lines(path, new_lines, newline, final_newline)
+        stat = os.stat(path)
+        return (path, True, diff, (stat.st_mtime_ns, stat.st_size), None)
+    except (OSError, UnicodeDecodeError) as error:
+        return (path, False, "", None, str(error))
+
+
+def check_file(path):
+    """
+    Check the local links of a file, run by the processes of the pool
+
+    Returns:
+        - the path, the problems found, the web links still to check,
+          and an error message or None
+    """
+
+    import markdown_links
+
+    try:
+        (lines, _, _) = read_lines(path)
+    except (OSError, UnicodeDecodeError) as error:
+        return (path, [], [], str(error))
+
+    index = markdown_index.DocumentIndex(lines)
+    links = markdown_links.extract_links(index)
+    (problems, web_links) = markdown_links.local_problems(
+        links, index.anchors(), os.path.dirname(os.path.abspath(path)))
+    return (path, problems, web_links, None)
+
+
+def run_jobs(function, jobs, workers):
+    """
+    Run a function on each job, in a process pool when there are enough
+    jobs. The jobs are consumed lazily and the results yielded in order.
+    """
+
+    jobs = iter(jobs)
+    first = list(itertools.islice(jobs, POOL_THRESHOLD))
+
+    if workers == 1 or len(first) < POOL_THRESHOLD:
+        yield from map(function, itertools.chain(first, jobs))
+        return
+
+    with multiprocessing.Pool(workers or None) as pool:
+        yield from pool.imap(function, itertools.chain(first, jobs),
+                             CHUNK_SIZE)
+
+
+class CleanCache(object):
+    """
+    The files found unchanged by a command, with their modification time
+    and size, stored in the cache directory
+    """
+
+    __slots__ = ("path", "files")
+
+    def __init__(self, cache_dir, name):
+        self.path = ""
+        self.files = {}
+        if not cache_dir:
+            return
+        self.path = os.path.join(os.path.expanduser(cache_dir),
+                                 "cli-" + name + ".json")
+        try:
+            with open(self.path, encoding="utf-8") as source:
+                (version, files) = json.load(source)
+            if version == CACHE_VERSION:
+                self.files = files
+        except (OSError, ValueError, TypeError):
+            pass
+
+    def is_clean(self, path, mtime, size):
+        return self.files.get(os.path.abspath(path)) == [mtime, size]
+
+    def set_clean(self, path, stat):
+        self.files[os.path.abspath(path)] = list(stat)
+
+    def forget(self, path):
+        self.files.pop(os.path.abspath(path), None)
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + ".tmp", "w", encoding="utf-8") as target:
+            json.dump([CACHE_VERSION, self.files], target)
+        os.replace(self.path + ".tmp", self.path)
+
+
+def transform(options):
+    """
+    Run prettify or toc on the files
+
+    Returns:
+        - the exit status: 1 if files changed with --check or --diff,
+          2 if files couldn't be processed
+    """
+
+    mode = "diff" if options.diff else "check" if options.check else "write"
+    cache = CleanCache(options.cache_dir, options.command)
+
+    def jobs():
+        for (path, mtime, size) in iter_files(options.paths):
+            if not cache.is_clean(path, mtime, size):
+                yield (options.command, path, mode)
+
+    changed = 0
+    errors = 0
+    results = run_jobs(transform_file, jobs(), options.jobs)
+    for (path, is_changed, diff, stat, error) in results:
+        if error is not None:
+            print("markdown-tool: " + path + ": " + error, file=sys.stderr)
+            errors += 1
+            continue
+        if stat is not None:
+            cache.set_clean(path, stat)
+        else:
+            cache.forget(path)
+        if not is_changed:
+            continue
+        changed += 1
+        if diff:
+            print(diff)
+        elif mode == "check":
+            print("would update " + path)
+        else:
+            print("updated " + path)
+
+    cache.save()
+
+    if errors:
+        return 2
+    if changed and mode != "write":
+        return 1
+    return 0
+
+
+def check(options):
+    """
+    Check the links of the files, the web links only with --web
+
+    Returns:
+        - the exit status: 1 if broken links were found
+    """
+
+    import markdown_links
+
+    found = []
+    web = []
+    errors = 0
+
+    paths = (path for (path, _, _) in iter_files(options.paths))
+    for (path, problems, web_links, error) in run_jobs(check_file, paths,
+                                                       options.jobs):
+        if error is not None:
+            print("markdown-tool: " + path + ": " + error, file=sys.stderr)
+            errors += 1
+            continue
+        found.extend((path, problem) for problem in problems)
+        if options.web:
+            web.extend((path, link) for link in web_links)
+
+    if web:
+        cache = markdown_links.LinkCache(
+            os.path.join(os.path.expanduser(options.cache_dir),
+                         "links.json") if options.cache_dir else "",
+            options.ttl)
+        urls = sorted(set(link.target for (_, link) in web))
+        results = asyncio.run(markdown_links.check_urls(
+            urls, cache, options.requests, options.per_host,
+            options.timeout))
+        cache.save()
+        for (path, link) in web:
+            found.extend((path, problem) for problem in
+                         markdown_links.web_problems([link], results))
+
+    found.sort(key=lambda item: (item[0], item[1].row, item[1].col))
+    for (path, problem) in found:
+        print("%s:%d:%d: %s %s" % (path, problem.row + 1, problem.col + 1,
+                                   problem.severity, problem.message))
+
+    if errors:
+        return 2
+    if any(problem.severity == markdown_links.ERROR
+           for (_, problem) in found):
+        return 1
+    return 0
+
+
+def tasks(options):
+    """
+    Search the tasks of a project, with the criteria of MdTaskQuery,
+    or count them by status with --summary
+    """
+
+    (statuses, pattern, root, text) = markdown_core.parse_task_query(
+        options.query)
+    root = os.path.abspath(os.path.expanduser(root or options.root))
+
+    index = markdown_tasks.TaskIndex(root)
+    cache_dir = ""
+    if options.cache_dir:
+        cache_dir = os.path.expanduser(options.cache_dir)
+        index = markdown_tasks.load_index(cache_dir, root)
+    if index.refresh(options.jobs) and cache_dir:
+        markdown_tasks.save_index(cache_dir, index)
+
+    if options.summary:
+        counts = [str(index.counts.get(status, 0)) + " " + name
+                  for (name, status) in markdown_core.STATUSES.items()]
+        print(", ".join(counts) + " (" + str(sum(index.counts.values())) +
+              " tasks in " + str(len(index.files)) + " files)")
+        return 0
+
+    for (path, row, status, description) in index.query(statuses, pattern,
+                                                        text):
+        print("%s:%d: [%s] %s" % (os.path.join(root, path), row + 1, status,
+                                  description))
+    return 0
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="markdown-tool",
+        description="Prettify the tables, update the tables of content, "
+                    "check the links and search the tasks of markdown files")
+    parser.add_argument("-j", "--jobs", type=int, default=0,
+                        help="number of processes, all the CPUs by default")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR,
+                        help="cache directory, empty to disable the cache "
+                             "(default: %(default)s)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    for (name, text) in (("prettify", "prettify the tables"),
+                         ("toc", "update the tables of content")):
+        command = commands.add_parser(name, help=text)
+        command.add_argument("paths", nargs="*", default=["."],
+                             help="files or directories, . by default")
+        command.add_argument("--check", action="store_true",
+                             help="only list the files to update, and exit "
+                                  "with 1 if any")
+        command.add_argument("--diff", action="store_true",
+                             help="print the changes instead of writing "
+                                  "them, and exit with 1 if any")
+        command.set_defaults(run=transform)
+
+    command = commands.add_parser("check", help="check the links")
+    command.add_argument("paths", nargs="*", default=["."],
+                         help="files or directories, . by default")
+    command.add_argument("--web", action="store_true",
+                         help="request the web links too")
+    command.add_argument("--requests", type=int, default=16,
+                         help="web requests at a time (default: %(default)s)")
+    command.add_argument("--per-host", type=int, default=2,
+                         help="web requests at a time on a host "
+                              "(default: %(default)s)")
+    command.add_argument("--timeout", type=int, default=10,
+                         help="web request timeout, in seconds "
+                              "(default: %(default)s)")
+    command.add_argument("--ttl", type=int, default=86400,
+                         help="lifetime of the web links results, in "
+                              "seconds (default: %(default)s)")
+    command.set_defaults(run=check)
+
+    command = commands.add_parser(
+        "tasks", help="search the tasks",
+        description="Search the tasks of a project. The query words are "
+                    "status:new,ongoing, path:glob, root:dir or words to "
+                    "find in the tasks.")
+    command.add_argument("query", nargs="*", help="criteria of the search")
+    command.add_argument("--root", default=".",
+                         help="project directory, . by default")
+    command.add_argument("--summary", action="store_true",
+                         help="count the tasks of each status")
+    command.set_defaults(run=tasks)
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    return options.run(options)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,830 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Plugin:      https://github.com/dpretet/vim-markdow-tool
+Description: Transformations of markdown documents, tables, tasks and
+             table of content, shared by the Vim plugin and the CLI
+Maintainer:  Damien Pretet https://github.com/dpretet
+
+This module doesn't depend on Vim and only works on lists of strings.
+"""
+
+import math
+import re
+
+import markdown_index
+from markdown_index import LazyPattern
+from markdown_table import Table, LEFT, CENTER, RIGHT
+
+# Task status characters, by name, when not configured
+STATUSES = {"new": " ", "ongoing": "-", "done": "X", "cancel": "C"}
+
+LIST_ITEM_RE = LazyPattern(r"^(\s*)([-*+]|\d+[.)])(?:\s+(.*))?$")
+# The pipes of a table row, skipping the escaped characters and the code
+# spans, which may hold pipes: an opening run of backticks is closed by a
+# run of the same length, else it's taken literally
+CELL_TOKEN_RE = LazyPattern(r"\\.|(`+)(?!`).*?(?<!`)\1(?!`)|`+|\|")
+TABLE_SEPARATOR_RE = LazyPattern(
+    r"^\s*\|?(\s*:?-+:?\s*\|)*\s*:?-+:?\s*\|?\s*$")
+HUMAN_SIZE_RE = LazyPattern(r"^([-+]?\d+(?:\.\d*)?)\s*([kmgtpe]?)i?b?$",
+                            re.IGNORECASE)
+
+# Sort kinds: text, numeric or human-readable sizes like 2.5M or 10 KiB
+TEXT_SORT = ""
+NUMERIC_SORT = "n"
+HUMAN_SORT = "h"
+
+# Number of cells read to guess the kind of a column
+SORT_SAMPLES = 32
+
+
+def line_end(line):
+    """
+    Return the cursor column of the last character of a line, the position
+    `normal! $` would move to. Vim cursor columns are byte indexes.
+    """
+
+    return max(len(line.encode("utf-8")) - 1, 0)
+
+
+def line_to_task(line):
+    """
+    Turn a line into a task. A list item gets the brackets after its
+    marker, a simple line is prefixed with - [ ]
+
+    Returns:
+        - the task, or None if the line is already a task
+    """
+
+    if markdown_index.TASK_RE.match(line):
+        return None
+
+    match = LIST_ITEM_RE.match(line)
+    if match:
+        (indent, marker, text) = match.groups()
+    else:
+        text = line.lstrip()
+        (indent, marker) = (line[:len(line) - len(text)], "-")
+
+    task = indent + marker + " [ ]"
+    if text:
+        task += " " + text
+    return task
+
+
+def line_with_status(line, task_status):
+    """
+    Change the status of a task, the symbol between its brackets
+
+    Returns:
+        - the task updated, or None if the line is not a task
+    """
+
+    match = markdown_index.TASK_RE.match(line)
+    if not match:
+        return None
+    return line[:match.start(1)] + task_status + line[match.end(1):]
+
+
+def table_clean_args(desc):
+    """
+    Handle the arguments passed to AddTable() and prepare
+    them for processing
+    """
+
+    # Handle as well comma and space to separate descriptions
+    if '' in desc[0]:
+        desc = ''
+    elif "," in desc[0]:
+        desc = desc[0].split(",")
+    else:
+        desc = desc[0].split(" ")
+
+    # Clean up the arguments
+    for i in range(len(desc)):
+        desc[i] = desc[i].strip()
+
+    return desc
+
+
+def table_init(dims):
+    """
+    From description passed by the user, draft a first table
+    based on list of string. Headers remain blank if was not specified,
+    and add separation with rows
+    """
+
+    # Default dimension of the table, will be adjusted by the user arguments
+    column_num = 3
+    row_num = 5
+    # The output table to return
+    table = Table()
+    # A flag indicating we need to create a table only from dimension,
+    # no header description has been passed
+    init_with_dim = 0
+
+    # Check first if the arguments could be the table dimensions
+    # In this case, handle a dimension passed by the user, like 2 x 3
+    # He didn't provide the columns' header
+    if len(dims) == 2 and\
+       dims[0].isnumeric() and dims[1].isnumeric():
+
+        init_with_dim = 1
+        column_num = int(dims[0])
+        row_num = int(dims[1])
+    # Here assume the arguments are the headers description if arguments passed
+    elif len(dims) > 0:
+        column_num = len(dims)
+    # Else if nothing passed, assume it's init with default dimensions
+    else:
+        init_with_dim = 1
+
+    # Init the table content, blank cells are rendered with
+    # the default column width
+    for i in range(column_num):
+        # +1 for the headers
+        cells = [""] * (row_num+1)
+        # Append the header description
+        if not init_with_dim:
+            cells[0] = dims[i]
+        table.insert_column(i, cells)
+
+    return table
+
+
+def table_prettifier(table, justify="left"):
+    """
+    Prettify the table to drop into the document. Adapt the
+    column width
+
+    Arguments:
+        - table: a Table, or a list of list of strings:
+             - First dimension: the columns
+             - Second dimensions: the column's content
+        - justify: the justification of the columns without alignment
+          marker in the separator line, "left", "center" or "right"
+
+    Returns:
+        - the table lines, as a list of strings
+    """
+
+    if not isinstance(table, Table):
+        table = Table(table)
+
+    return table.render(justify)
+
+
+def is_table_separator(line):
+    """
+    Check a line is the separator between the header and the rows
+    of a table, like |----|:---:|
+    """
+
+    return TABLE_SEPARATOR_RE.match(line) is not None
+
+
+def locate_cursor(row, col, table_start, table_end, line):
+    """
+    Determine from the table location and the cursor position
+    the cursor index inside table (in terms of column/row)
+
+    Arguments:
+        - row, col: the cursor position
+        - table_start, table_end: first and last line of the table
+        - line: the content of the cursor line
+    """
+
+    # Relative position of the cursor into the table
+    row_num = 0
+    col_num = 0
+
+    # Compute the height, and relative position into the table
+    nb_row = table_end - table_start - 1
+    cursor_row = table_end - row + 1
+
+    # If cursor is located in header or separator, consider it's
+    # ouside the table
+    if (row == table_start or row == table_start + 1):
+        row_num = -1
+    # Else compute position, relative to the header separator, indexed from 1
+    else:
+        row_num = nb_row - cursor_row
+
+    # To locate the cursor in the table's row, we count the number
+    # of separator. Any line can be used
+    pipes = cell_pipes(line)
+    nb_col = len(pipes)
+    col_num = nb_col - sum(1 for pipe in pipes if pipe > col)
+
+    if col_num == nb_col:
+        col_num = nb_col - 1
+
+    return row_num, col_num
+
+
+def grab_table(lines):
+    """
+    From the lines identified in the buffer,
+    extract the the content.
+
+    Arguments:
+        - lines: the table lines, as a list of strings
+
+    Returns:
+        a Table, storing the content column by column and the alignment
+        specified by the separator line
+    """
+
+    rows = []
+    align = None
+
+    for line in lines:
+        # Skip the separator between the header and the rows,
+        # but keep the alignment it specifies
+        if is_table_separator(line):
+            if align is None:
+                align = separator_alignment(line)
+            continue
+        rows.append(line.strip())
+
+    # Most tables have all their rows between pipes, without escaped pipe
+    # or code span: their cells are split at once, then each column
+    # sliced, else the rows are split one by one
+    nb_pipes = rows[0].count("|")
+    if nb_pipes > 1 and all(
+            row.count("|") == nb_pipes and row[0] == "|" == row[-1] and
+            "\\" not in row and "`" not in row for row in rows):
+        nb_col = nb_pipes - 1
+        cells = "|".join([row[1:-1] for row in rows]).split("|")
+        content = [cells[col::nb_col] for col in range(nb_col)]
+    else:
+        extracted = [table_row_cells(row) for row in rows]
+        # Organize the array to describe content column by column,
+        # padding the rows too short
+        nb_col = len(extracted[0])
+        for (i, cells) in enumerate(extracted):
+            if len(cells) != nb_col:
+                extracted[i] = cells[:nb_col] + [""] * (nb_col - len(cells))
+        content = [list(column) for column in zip(*extracted)]
+
+    if align is not None:
+        align = align[:nb_col] + [None] * (nb_col - len(align))
+
+    return Table(content, align)
+
+
+def cell_pipes(line):
+    """
+    Find the pipes separating the cells of a table row, the ones escaped
+    with a backslash or inside a code span being part of a cell
+
+    Returns:
+        - the indexes of the pipes in the line
+    """
+
+    if "\\" not in line and "`" not in line:
+        return [i for (i, char) in enumerate(line) if char == "|"]
+    return [match.start() for match in CELL_TOKEN_RE.finditer(line)
+            if match.group() == "|"]
+
+
+def table_row_cells(line):
+    """
+    Split a table row into its cells, the pipes at the start and the end
+    of the row being optional. The empty cells are kept.
+
+    Returns:
+        - the cells, not stripped
+    """
+
+    line = line.strip()
+    if "\\" not in line and "`" not in line:
+        cells = line.split("|")
+        closed = line.endswith("|")
+    else:
+        pipes = cell_pipes(line)
+        cells = [line[start + 1:end] for (start, end) in
+                 zip([-1] + pipes, pipes + [len(line)])]
+        closed = bool(pipes) and pipes[-1] == len(line) - 1
+
+    if closed:
+        cells.pop()
+    if line.startswith("|") and cells:
+        del cells[0]
+    return cells
+
+
+def separator_alignment(line):
+    """
+    Read the alignment of each column from the separator line
+    (:--- left, :---: center, ---: right)
+
+    Returns:
+        - a list of LEFT, CENTER, RIGHT, or None when not specified
+    """
+
+    align = []
+    for col in line.strip().strip("|").split("|"):
+        col = col.strip()
+        if col.startswith(":") and col.endswith(":"):
+            align.append(CENTER)
+        elif col.endswith(":"):
+            align.append(RIGHT)
+        elif col.startswith(":"):
+            align.append(LEFT)
+        else:
+            align.append(None)
+    return align
+
+
+def csv_delimiter(arg, path=""):
+    """
+    Get the CSV delimiter from the command argument, defaulting to a tab
+    for .tsv files and the + register, else to a comma
+    """
+
+    if arg in ("tab", "\\t", "\t"):
+        return "\t"
+    if arg:
+        return arg
+    if not path or path.lower().endswith(".tsv"):
+        return "\t"
+    return ","
+
+
+def add_column(content, col_index, col_info=[]):
+    """
+    From the position of the cursor add a column
+
+    Arguments:
+        - the table content, a Table
+        - cursor index for col
+        - optional information to append from command line
+    Returns:
+        - the table content, a Table
+    """
+
+    content.insert_column(col_index)
+    return content
+
+
+def add_row(content, row_index, row_info=[]):
+    """
+    From the position of the cursor, add a row
+
+    Arguments:
+        - the table content, a Table
+        - cursor index for col
+        - cursor index for row
+    Returns:
+        - the table content, a Table
+    """
+
+    content.insert_row(row_index+1)
+    return content
+
+
+def swap_column(content, col_index, col_info=[]):
+    """
+    Swap column position into the table
+
+    Arguments:
+        - the table content, a Table
+        - cursor index for col
+        - optional information to append from command line
+    Returns:
+        - the table content, a Table
+    """
+
+    nb_col = content.nb_cols
+
+    if col_index == nb_col:
+        to_swap = col_index - 2
+    else:
+        to_swap = col_index
+
+    content.move_column(to_swap, col_index - 1)
+    return content
+
+
+def swap_row(content, row_index, row_info=[]):
+    """
+    Swap row position into the table
+
+    Arguments:
+        - the table content, a Table
+        - cursor index for col
+        - cursor index for row
+    Returns:
+        - the table content, a Table
+    """
+
+    if row_index == content.nb_rows - 1:
+        content.move_row(row_index, row_index-1)
+    else:
+        content.move_row(row_index, row_index+1)
+
+    return content
+
+
+def is_web_link(link):
+    """
+    Check a link is a web address by checking existence of
+    http, https, www into the string
+
+    Arguments:
+        - link: a string describing the link
+
+    Returns:
+        - 1 if is a web address otherwise 0
+    """
+
+    is_web = 0
+    keywords = ["http", "www.", "://", "git@git"]
+
+    for keyword in keywords:
+        if keyword in link:
+            is_web = 1
+
+    return is_web
+
+
+def table_blocks(index):
+    """
+    Return the tables of a document index which can be prettified: the
+    blocks whose second line is a header separator
+    """
+
+    return [table for table in index.blocks_of(markdown_index.TABLE)
+            if table.end - table.start > 1 and
+            is_table_separator(index.lines[table.start + 1])]
+
+
+def prettify_tables(lines, tables, offset=0):
+    """
+    Prettify tables in place into a list of lines
+
+    Arguments:
+        - lines: the lines holding the tables, modified in place
+        - tables: the table blocks, sorted by line
+        - offset: the document line of lines[0], the blocks being
+          located in the whole document
+
+    Returns:
+        - the number of table rows prettified, and the list of the
+          first lines of the malformed tables skipped
+    """
+
+    nb_rows = 0
+    skipped = []
+
+    # Start from the last table so the offsets of the others stay valid
+    for table in reversed(tables):
+        start = table.start - offset
+        end = table.end - offset
+        try:
+            content = grab_table(lines[start:end])
+        except IndexError:
+            skipped.append(table.start)
+            continue
+        lines[start:end] = table_prettifier(content)
+        nb_rows += end - start
+
+    skipped.reverse()
+    return (nb_rows, skipped)
+
+
+def prettify_document(lines):
+    """
+    Prettify all the tables of a document
+
+    Returns:
+        - the new lines of the document
+    """
+
+    lines = list(lines)
+    index = markdown_index.DocumentIndex(lines)
+    prettify_tables(lines, table_blocks(index))
+    return lines
+
+
+def realign_table(lines, table=None, aligned=None):
+    """
+    Align a table being edited. When the Table and the lines of its last
+    alignment are given, only the rows which changed since are parsed,
+    the Table keeping track of the column widths, and only these rows are
+    rendered again unless a column width changed.
+
+    Arguments:
+        - lines: the current lines of the table
+        - table: the Table of the last alignment, updated in place
+        - aligned: the lines of the last alignment
+
+    Returns:
+        - the Table and its aligned lines, or None if the table has no
+          header separator or a row has not as many cells as the header,
+          like while a column is being added
+    """
+
+    if len(lines) < 2 or not is_table_separator(lines[1]):
+        return None
+
+    if table is None or aligned is None or len(aligned) != len(lines) or \
+            lines[1] != aligned[1]:
+        table = grab_table(lines)
+        for line in lines:
+            if not is_table_separator(line) and \
+                    len(table_row_cells(line)) != table.nb_cols:
+                return None
+        return (table, table_prettifier(table))
+
+    for (i, line) in enumerate(lines):
+        if i == 1 or line == aligned[i]:
+            continue
+        cells = table_row_cells(line)
+        if len(cells) != table.nb_cols:
+            return None
+        # The separator is not a row of the Table
+        row = i - 1 if i else 0
+        for (col, cell) in enumerate(cells):
+            if cell.strip() != table.cell(col, row):
+                table.set_cell(col, row, cell)
+
+    return (table, table_prettifier(table))
+
+
+def cursor_cell(line, col):
+    """
+    Locate a cursor in a table row
+
+    Arguments:
+        - line: the row
+        - col: the cursor column, in characters
+
+    Returns:
+        - the index of the cell, and the position of the cursor from the
+          start of the cell content, its first non blank character
+    """
+
+    pipes = cell_pipes(line)
+    leading = line.lstrip().startswith("|")
+    # A cursor on a pipe is at the end of the cell before it
+    before = sum(1 for pipe in pipes if pipe < col)
+    cell = max(before - 1 if leading else before, 0)
+
+    start = pipes[before - 1] + 1 if before else 0
+    end = pipes[before] if before < len(pipes) else len(line)
+    content = start + len(line[start:end]) - len(line[start:end].lstrip())
+    return (cell, max(col - min(content, end), 0))
+
+
+def cell_cursor(line, cell, offset):
+    """
+    Column of the cursor in a table row, from its cell and its position
+    into the cell content, as returned by cursor_cell. The cursor stays
+    into the cell, at most before its closing pipe.
+    """
+
+    pipes = cell_pipes(line)
+    if not line.lstrip().startswith("|"):
+        pipes.insert(0, -1)
+    start = pipes[cell] + 1 if cell < len(pipes) else len(line)
+    end = pipes[cell + 1] if cell + 1 < len(pipes) else len(line)
+    content = start + len(line[start:end]) - len(line[start:end].lstrip())
+    return min(min(content, end) + offset, end)
+
+
+def table_column(table, column):
+    """
+    Find a column of a table from its number, counted from 1, or from its
+    header, compared without case
+
+    Returns:
+        - the column index, or None if not found
+    """
+
+    if column.isdigit():
+        col = int(column) - 1
+        return col if 0 <= col < table.nb_cols else None
+
+    for col in range(table.nb_cols):
+        if table.cell(col, 0).lower() == column.lower():
+            return col
+    return None
+
+
+def parse_sort_args(args):
+    """
+    Read the arguments of a table sort: the column, a number or a header,
+    and the options, a word made of n (numeric), h (human-readable sizes)
+    and r (descending order)
+
+    Returns:
+        - the column ("" when not given), the sort kind (None to guess it)
+          and whether the order is descending
+    """
+
+    column = ""
+    kind = None
+    reverse = False
+
+    for arg in args:
+        if arg and all(char in "nhr" for char in arg):
+            if NUMERIC_SORT in arg:
+                kind = NUMERIC_SORT
+            if HUMAN_SORT in arg:
+                kind = HUMAN_SORT
+            reverse = reverse or "r" in arg
+        else:
+            column = arg
+
+    return (column, kind, reverse)
+
+
+def number_key(cell):
+    """
+    Value of a number like 12, -3.5 or 1e6. NaN, the infinities and the
+    digits grouped with underscores, accepted by float(), are not numbers
+    of a table: one of them would break the order of the sort.
+    """
+
+    if "_" in cell:
+        return None
+    try:
+        value = float(cell)
+    except ValueError:
+        return None
+    return value if math.isfinite(value) else None
+
+
+def human_size_key(cell):
+    """
+    Value of a size like 512, 2.5M, 10 KiB or 3GB, the units being
+    powers of 1024
+    """
+
+    match = HUMAN_SIZE_RE.match(cell)
+    if match is None:
+        return None
+    unit = " kmgtpe".index(match.group(2).lower() or " ")
+    return float(match.group(1)) * 1024 ** unit
+
+
+SORT_KEYS = {NUMERIC_SORT: number_key, HUMAN_SORT: human_size_key}
+
+
+def column_sort_kind(cells):
+    """
+    Guess how to sort a column from a sample of its non-empty cells,
+    spread over the column: numeric if most of them are numbers, human if
+    most of them are sizes, else text
+    """
+
+    # The first non-empty cell of each stride
+    step = max(len(cells) // SORT_SAMPLES, 1)
+    sample = []
+    for start in range(0, len(cells), step):
+        for row in range(start, min(start + step, len(cells))):
+            if cells[row]:
+                sample.append(cells[row])
+                break
+        if len(sample) == SORT_SAMPLES:
+            break
+    if not sample:
+        return TEXT_SORT
+
+    for kind in (NUMERIC_SORT, HUMAN_SORT):
+        parsed = sum(1 for cell in sample
+                     if SORT_KEYS[kind](cell) is not None)
+        if parsed * 4 >= len(sample) * 3:
+            return kind
+    return TEXT_SORT
+
+
+def sort_table(table, col, kind=None, reverse=False):
+    """
+    Sort the rows of a table on a column, the header staying first. The
+    sort is stable, and the key of each cell computed once.
+
+    Arguments:
+        - col: the column index
+        - kind: TEXT_SORT, NUMERIC_SORT, HUMAN_SORT, or None to guess it
+          from the column content
+        - reverse: sort in descending order
+
+    Returns:
+        - the kind of sort applied
+    """
+
+    cells = table.columns[col][1:]
+    if kind is None:
+        kind = column_sort_kind(cells)
+
+    if kind == TEXT_SORT:
+        keys = cells
+    else:
+        # The cells which are not numbers go after the numbers, in both
+        # orders, so the descending order negates the numbers
+        parse = SORT_KEYS[kind]
+        sign = -1 if reverse else 1
+        reverse = False
+        keys = []
+        for cell in cells:
+            value = parse(cell)
+            keys.append((0, sign * value) if value is not None else (1, 0))
+
+    order = sorted(range(len(keys)), key=keys.__getitem__, reverse=reverse)
+    table.select_rows([0] + [row + 1 for row in order])
+    return kind
+
+
+def filter_table(table, col, pattern, invert=False):
+    """
+    Keep the rows of a table whose cell in a column matches a regular
+    expression, or doesn't match it when inverted. The header is kept.
+
+    Returns:
+        - the number of rows removed
+    """
+
+    regex = re.compile(pattern)
+    column = table.columns[col]
+    rows = [0] + [row for row in range(1, len(column))
+                  if (regex.search(column[row]) is None) == invert]
+    removed = len(column) - len(rows)
+    table.select_rows(rows)
+    return removed
+
+
+def toc_update(index):
+    """
+    Compute the table of content of a document, to write between its
+    markers
+
+    Returns:
+        - the first and last lines between the markers, and the lines of
+          the table of content, or None if the document has no markers
+    """
+
+    location = index.toc_range()
+    if location is None:
+        return None
+
+    (start, end) = location
+    headings = list(index.blocks_of(markdown_index.HEADING))
+    return (start + 1, end, markdown_index.toc_lines(headings))
+
+
+def update_document_toc(lines):
+    """
+    Refresh the table of content of a document, if it has one
+
+    Returns:
+        - the new lines of the document
+    """
+
+    update = toc_update(markdown_index.DocumentIndex(lines))
+    if update is None:
+        return list(lines)
+    (start, end, toc) = update
+    return lines[:start] + toc + lines[end:]
+
+
+def parse_task_query(args, statuses=STATUSES):
+    """
+    Read the criteria of a task query:
+
+        - status:ongoing, or status:new,ongoing for several statuses
+        - path:ops/**, a glob on the path relative to the project
+        - root:~/docs, the project directory
+        - any other word must be found in the task description
+
+    Arguments:
+        - args: the words of the query
+        - statuses: the status characters, by name
+
+    Returns:
+        - the statuses, the path pattern, the root and the text to
+          search, each one None when not specified ("" for the root)
+    """
+
+    status_chars = None
+    pattern = None
+    root = ""
+    words = []
+
+    for arg in args:
+        (key, _, value) = arg.partition(":")
+        if key == "status" and value:
+            status_chars = [statuses.get(name, name)
+                            for name in value.split(",")]
+        elif key == "path" and value:
+            pattern = value
+        elif key == "root" and value:
+            root = value
+        else:
+            words.append(arg)
+
+    text = " ".join(words) if words else None
+    return (status_chars, pattern, root, text)
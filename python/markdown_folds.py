@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Plugin:      https://github.com/dpretet/vim-markdow-tool
+Description: Fold levels of markdown documents: sections, lists, fenced
+             code and tables
+Maintainer:  Damien Pretet https://github.com/dpretet
+
+The levels of all the lines are computed from the block index, and kept
+with the blocks they were computed from. After an edit, only the blocks
+the index parsed again are computed again, then the following ones as long
+as the section level they are in changed, so Vim's foldexpr only has to
+read a level from a list.
+
+This module doesn't depend on Vim and only works on lists of strings.
+"""
+
+import markdown_index
+from markdown_index import HEADING, FENCE, TABLE, LIST, TASKLIST
+
+
+def item_indent(line):
+    """
+    Indentation of a list item, tabs expanded, or None if the line is
+    not an item
+    """
+
+    if not markdown_index.LIST_RE.match(line):
+        return None
+    line = line.expandtabs(4)
+    return len(line) - len(line.lstrip())
+
+
+def list_levels(lines, depth):
+    """
+    Fold levels of the lines of a list. An item folds with the lines
+    following it, its sub items, as indented by MdAddSubTask, and its
+    continuation lines. An item without them stays in the fold of its
+    parent.
+
+    Arguments:
+        - lines: the lines of the list
+        - depth: the level of the section holding the list
+
+    Returns:
+        - the level of each line
+    """
+
+    indents = [item_indent(line) for line in lines]
+    levels = []
+    # Indentation of the items holding the line
+    stack = []
+
+    for (i, indent) in enumerate(indents):
+        if indent is None:
+            levels.append(depth + len(stack))
+            continue
+
+        while stack and indent <= stack[-1]:
+            stack.pop()
+        following = indents[i + 1] if i + 1 < len(indents) else indent
+        if following is None or following > indent:
+            levels.append(">%d" % (depth + len(stack) + 1))
+        else:
+            levels.append(depth + len(stack))
+        stack.append(indent)
+
+    return levels
+
+
+def block_levels(block, lines, depth):
+    """
+    Fold levels of the lines of a block
+
+    Arguments:
+        - block: the block, from the document index
+        - lines: the lines of the document
+        - depth: the level of the section holding the block
+
+    Returns:
+        - the level of each line of the block, a number, or ">n" for the
+          first line of a fold of level n
+    """
+
+    nb_lines = block.end - block.start
+    if block.kind == HEADING:
+        return [">%d" % block.level]
+    if block.kind in (FENCE, TABLE) and nb_lines > 1:
+        return [">%d" % (depth + 1)] + [depth + 1] * (nb_lines - 1)
+    if block.kind in (LIST, TASKLIST):
+        return list_levels(lines[block.start:block.end], depth)
+    return [depth] * nb_lines
+
+
+class FoldLevels(object):
+    """
+    Fold levels of the lines of a document, updated from its block index
+
+    Attributes:
+        - levels: the level of each line
+        - blocks: the blocks of the index the levels were computed from
+        - starts: the first line of each block then
+        - depths: the level of the section holding each block
+    """
+
+    __slots__ = ("levels", "blocks", "starts", "depths")
+
+    def __init__(self):
+        self.levels = []
+        self.blocks = []
+        self.starts = []
+        self.depths = []
+
+    def update(self, index):
+        """
+        Compute again the levels of the lines which changed in the index
+        since the last update. The index keeps the Block objects of the
+        lines which didn't change, the ones following an edit shifted.
+
+        Returns:
+            - first, end, new_end: the levels [first, end) of the previous
+              version are replaced by the levels [first, new_end)
+        """
+
+        (old_blocks, blocks) = (self.blocks, index.blocks)
+        (old_starts, starts) = (self.starts, index.starts)
+        shift = len(blocks) - len(old_blocks)
+        delta = len(index.lines) - len(self.levels)
+
+        # Blocks unchanged before the edit, and after it, shifted
+        k = 0
+        limit = min(len(old_blocks), len(blocks))
+        while (k < limit and blocks[k] is old_blocks[k] and
+               starts[k] == old_starts[k]):
+            k += 1
+        kept = 0
+        limit -= k
+        while (kept < limit and blocks[-1 - kept] is old_blocks[-1 - kept]
+               and starts[-1 - kept] == old_starts[-1 - kept] + delta):
+            kept += 1
+
+        depth = 0
+        first = 0
+        if k:
+            last = blocks[k - 1]
+            depth = last.level if last.kind == HEADING else self.depths[k - 1]
+            first = last.end
+
+        # From the first block changed, up to a block unchanged entered at
+        # the same section level. The blank lines are in the section.
+        levels = []
+        depths = []
+        row = first
+        j = k
+        while j < len(blocks) and (j < len(blocks) - kept or
+                                   depth != self.depths[j - shift]):
+            block = blocks[j]
+            levels.extend([depth] * (block.start - row))
+            levels.extend(block_levels(block, index.lines, depth))
+            depths.append(depth)
+            if block.kind == HEADING:
+                depth = block.level
+            row = block.end
+            j += 1
+
+        new_end = blocks[j].start if j < len(blocks) else len(index.lines)
+        levels.extend([depth] * (new_end - row))
+        end = new_end - delta
+
+        self.levels[first:end] = levels
+        self.depths[k:j - shift] = depths
+        self.blocks = list(blocks)
+        self.starts = list(starts)
+        return (first, end, new_end)
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Plugin:      https://github.com/dpretet/vim-markdow-tool
+Description: Formatting of the fenced code blocks with external formatters
+Maintainer:  Damien Pretet https://github.com/dpretet
+
+Each fenced block whose language has a formatter is piped through it, like
+'formatprg': the code on the standard input, the formatted code on the
+standard output. Formatters run concurrently in a bounded pool of threads,
+each one waiting on its process. The hash of the code they return is kept
+in an on-disk cache, so formatting again a document only runs the
+formatters on the blocks changed since.
+
+This module doesn't depend on Vim.
+"""
+
+import hashlib
+import json
+import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import markdown_index
+
+# Maximum number of formatted blocks remembered by the cache
+CACHE_SIZE = 10000
+
+
+class CodeBlock(object):
+    """
+    The content of a fenced code block
+
+    Attributes:
+        - start: line of the opening fence, indexed from 0
+        - end: line of the closing fence
+        - lang: the language, first word of the fence info string
+        - indent: indentation of the fence, removed from the code
+        - code: the lines between the fences
+    """
+
+    __slots__ = ("start", "end", "lang", "indent", "code")
+
+    def __init__(self, start, end, lang, indent, code):
+        self.start = start
+        self.end = end
+        self.lang = lang
+        self.indent = indent
+        self.code = code
+
+
+class FormatResult(object):
+    """
+    The outcome of the formatting of a code block
+
+    Attributes:
+        - block: the CodeBlock formatted
+        - lines: the lines formatted, fence indentation restored, None if
+          the formatter failed
+        - cached: True if the block was already formatted
+        - error: why the formatter failed
+    """
+
+    __slots__ = ("block", "lines", "cached", "error")
+
+    def __init__(self, block, lines=None, cached=False, error=""):
+        self.block = block
+        self.lines = lines
+        self.cached = cached
+        self.error = error
+
+
+def code_blocks(index):
+    """
+    Find the fenced code blocks of the document with a language and some
+    code. A fence left open up to the end of the document is skipped.
+    """
+
+    blocks = []
+    lines = index.lines
+
+    for block in index.blocks_of(markdown_index.FENCE):
+        lang = block.info.split(" ")[0].lstrip("{.").rstrip("}")
+        opening = lines[block.start]
+        marker = opening.lstrip()[:block.level]
+        if (not lang or block.end - block.start < 3 or
+                not markdown_index.is_closing_fence(lines[block.end - 1],
+                                                    marker)):
+            continue
+        indent = len(opening) - len(opening.lstrip(" "))
+        # The code is indented up to the fence indentation
+        code = []
+        for line in lines[block.start + 1:block.end - 1]:
+            spaces = len(line) - len(line.lstrip(" "))
+            code.append(line[min(spaces, indent):])
+        blocks.append(CodeBlock(block.start, block.end - 1, lang, indent,
+                                code))
+
+    return blocks
+
+
+def code_digest(command, code):
+    """
+    Hash of a formatter command and of the code it formats
+    """
+
+    return hashlib.blake2b(
+        (command + "\x00" + "\n".join(code)).encode("utf-8"),
+        digest_size=16).hexdigest()
+
+
+class FormatCache(object):
+    """
+    On-disk cache of the code already formatted, as the hashes of the code
+    and of the formatter command. The hashes used last are kept.
+    """
+
+    __slots__ = ("path", "entries")
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if path and os.path.isfile(path):
+            try:
+                with open(path, encoding="utf-8") as source:
+                    self.entries = dict.fromkeys(json.load(source))
+            except (OSError, ValueError, TypeError):
+                self.entries = {}
+
+    def __contains__(self, digest):
+        return digest in self.entries
+
+    def add(self, digest):
+        # Moved last, the oldest hashes being dropped first
+        self.entries.pop(digest, None)
+        self.entries[digest] = None
+
+    def save(self):
+        """
+        Write the cache, keeping the CACHE_SIZE hashes used last
+        """
+
+        if not self.path:
+            return
+        digests = list(self.entries)[-CACHE_SIZE:]
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as target:
+            json.dump(digests, target)
+        os.replace(tmp_path, self.path)
+
+
+def run_formatter(command, code, cwd=None, timeout=10):
+    """
+    Pipe code through a formatter command, run by the shell
+
+    Returns:
+        - the lines formatted
+
+    Raises:
+        - OSError, subprocess.SubprocessError or ValueError if the
+          formatter failed, timed out or printed nothing
+    """
+
+    process = subprocess.run(
+        command, shell=True, cwd=cwd, input="\n".join(code) + "\n",
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        encoding="utf-8", timeout=timeout)
+
+    if process.returncode:
+        errors = process.stderr.strip().splitlines()
+        raise ValueError("exit status " + str(process.returncode) +
+                         (": " + errors[-1] if errors else ""))
+    if not process.stdout.strip():
+        raise ValueError("no output")
+    return process.stdout.rstrip("\n").split("\n")
+
+
+def format_block(block, command, cache, cwd, timeout, force=False):
+    """
+    Format a code block, unless the cache knows it's already formatted
+    """
+
+    digest = code_digest(command, block.code)
+    if cache is not None and not force and digest in cache:
+        cache.add(digest)
+        return FormatResult(block, cached=True)
+
+    try:
+        code = run_formatter(command, block.code, cwd, timeout)
+    except (OSError, ValueError, subprocess.SubprocessError) as error:
+        return FormatResult(block, error=str(error))
+
+    if cache is not None:
+        cache.add(code_digest(command, code))
+    indent = " " * block.indent
+    lines = [indent + line if line.strip() else line for line in code]
+    return FormatResult(block, lines)
+
+
+def format_blocks(blocks, formatters, cache=None, cwd=None, workers=4,
+                  timeout=10, force=False):
+    """
+    Format the code blocks having a formatter, workers blocks at a time
+
+    Arguments:
+        - blocks: the CodeBlocks of the document
+        - formatters: the formatter command of each language
+        - cache: the FormatCache, None to format all the blocks
+        - cwd: directory the formatters run from
+        - workers: maximum number of formatters running at a time
+        - timeout: timeout of a formatter, in seconds
+        - force: format the blocks found in the cache too
+
+    Returns:
+        - the FormatResults, in the order of the blocks
+    """
+
+    blocks = [block for block in blocks if formatters.get(block.lang)]
+    if not blocks:
+        return []
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(
+            lambda block: format_block(block, formatters[block.lang], cache,
+                                       cwd, timeout, force), blocks))
+
+    if cache is not None:
+        cache.save()
+    return results
+
+
+def apply_results(lines, results, offset=0):
+    """
+    Replace the code of the blocks formatted in a list of lines, from the
+    last block to the first so the rows of the others don't move
+
+    Arguments:
+        - lines: the lines of the document, from offset
+        - results: the FormatResults
+        - offset: the first line of the document in lines
+
+    Returns:
+        - the number of blocks changed
+    """
+
+    changed = 0
+    for result in reversed(results):
+        if result.lines is None:
+            continue
+        (start, end) = (result.block.start + 1 - offset,
+                        result.block.end - offset)
+        if lines[start:end] != result.lines:
+            lines[start:end] = result.lines
+            changed += 1
+    return changed
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Plugin:      https://github.com/dpretet/vim-markdow-tool
+Description: Graph of the links between the markdown files of a project
+Maintainer:  Damien Pretet https://github.com/dpretet
+
+The graph stores the local links of each file with the modification time
+and the size of the file, so a refresh only parses again the files which
+changed, and indexes them by the file they point to, to find the backlinks
+of a note without reading the project. It's saved on disk between two
+sessions, with only the rows of the links and the paths they point to,
+interned so each path is stored once: loading the graph of thousands of
+notes takes a few milliseconds.
+
+Renaming a note rewrites the links to it in the other notes, and the
+relative links of the note itself when it moves to another directory.
+
+This module doesn't depend on Vim.
+"""
+
+import os
+import pickle
+import re
+import sys
+import urllib.parse
+
+import markdown_index
+import markdown_links
+import markdown_tasks
+
+# Version of the file format, bump it when the graph content changes
+GRAPH_VERSION = 1
+
+# A link target: the path, then the query and the anchor
+TARGET_RE = re.compile(r"([^?#]*)(.*)$")
+UNSAFE_RE = re.compile(r"[\s()<>]")
+
+
+def note_links(lines):
+    """
+    Find the links of a document to local files
+
+    Returns:
+        - a list of (row, col, target) tuples, indexed from 0, the target
+          as written in the document
+    """
+
+    links = []
+    index = markdown_index.DocumentIndex(lines)
+    for link in markdown_links.extract_links(index):
+        target = link.target
+        if ("://" in target or target.startswith(("mailto:", "/")) or
+                not TARGET_RE.match(target).group(1)):
+            continue
+        links.append((link.row, link.col, target))
+    return links
+
+
+def resolve(source, target):
+    """
+    Path of the file a link points to, relative to the project like
+    the path of the file containing the link
+    """
+
+    path = urllib.parse.unquote(TARGET_RE.match(target).group(1))
+    return os.path.normpath(os.path.join(os.path.dirname(source), path))
+
+
+def retarget(target, path):
+    """
+    Replace the path of a link target by the one given, relative to the
+    file containing the link, keeping its query, its anchor, and the way
+    it was written: ./ prefix and URL quoting, required by some paths
+    """
+
+    (old_path, rest) = TARGET_RE.match(target).groups()
+    path = path.replace(os.sep, "/")
+    # Spaces and parentheses would end the link
+    if urllib.parse.unquote(old_path) != old_path or UNSAFE_RE.search(path):
+        path = urllib.parse.quote(path)
+    if old_path.startswith("./") and not path.startswith("../"):
+        path = "./" + path
+    return path + rest
+
+
+def rename_links(lines, source, old, new):
+    """
+    Rewrite the links of a document to a note renamed. If the document is
+    the note renamed, its relative links are rewritten as well when it
+    moves to another directory.
+
+    Arguments:
+        - lines: the lines of the document
+        - source: the path of the document, relative to the project
+        - old, new: the paths of the note before and after renaming
+
+    Returns:
+        - the new lines, and the number of links rewritten
+    """
+
+    moved = source == old
+    directory = os.path.dirname(new if moved else source)
+    same_directory = os.path.dirname(old) == os.path.dirname(new)
+
+    edits = []
+    for (row, col, target) in note_links(lines):
+        path = resolve(source, target)
+        if path == old:
+            path = new
+        elif not moved or same_directory:
+            continue
+        new_target = retarget(target, os.path.relpath(path, directory or "."))
+        if new_target != target:
+            edits.append((row, col, target, new_target))
+
+    lines = list(lines)
+    # From the end of the lines, the columns of the links before stay valid
+    for (row, col, target, new_target) in sorted(edits, reverse=True):
+        line = lines[row]
+        start = line.find(target, col)
+        lines[row] = line[:start] + new_target + line[start + len(target):]
+
+    return (lines, len(edits))
+
+
+def parse_file(path):
+    """
+    Read a file and find its local links
+
+    Returns:
+        - the path, its modification time and size, and its links
+    """
+
+    stat = os.stat(path)
+    with open(path, encoding="utf-8", errors="replace",
+              newline="") as source:
+        lines = markdown_index.split_lines(source.read())
+    return (path, stat.st_mtime_ns, stat.st_size, note_links(lines))
+
+
+def try_parse_file(path):
+    """
+    Parse a file, returning None if it can't be read anymore
+    """
+
+    try:
+        return parse_file(path)
+    except OSError:
+        return None
+
+
+class LinkGraph(object):
+    """
+    Local links of the markdown files of a project
+
+    Only the files and their links are saved: the files linking to each
+    file are indexed again from them on the first query after loading,
+    the graph being loaded by each session but queried by a few.
+
+    Attributes:
+        - root: the project directory
+        - files: path relative to root: (mtime, size, rows, paths), the
+          rows of the links of the file and the paths they point to
+    """
+
+    __slots__ = ("root", "files", "_incoming")
+
+    def __init__(self, root):
+        self.root = root
+        self.files = {}
+        self._incoming = {}
+
+    def __getstate__(self):
+        return (self.root, self.files)
+
+    def __setstate__(self, state):
+        (self.root, self.files) = state
+        self._incoming = None
+
+    @property
+    def incoming(self):
+        """
+        Path relative to root: set of the files linking to it
+        """
+
+        if self._incoming is None:
+            self._incoming = {}
+            for (path, (_, _, _, paths)) in self.files.items():
+                for linked in paths:
+                    self._incoming.setdefault(linked, set()).add(path)
+        return self._incoming
+
+    def add(self, path, mtime, size, links):
+        """
+        Set the links of a file, given as (row, col, target) tuples,
+        replacing the ones it had
+        """
+
+        if path in self.files:
+            self.remove(path)
+
+        path = sys.intern(path)
+        paths = tuple(sys.intern(resolve(path, target))
+                      for (_, _, target) in links)
+        self.files[path] = (mtime, size, tuple(link[0] for link in links),
+                            paths)
+        if self._incoming is not None:
+            for linked in paths:
+                self._incoming.setdefault(linked, set()).add(path)
+
+    def remove(self, path):
+        (_, _, _, paths) = self.files.pop(path)
+        if self._incoming is None:
+            return
+        for linked in set(paths):
+            sources = self._incoming[linked]
+            sources.discard(path)
+            if not sources:
+                del self._incoming[linked]
+
+    def refresh(self, workers=0):
+        """
+        Parse again the files added or modified since the last refresh,
+        and forget the ones removed
+
+        Arguments:
+            - workers: size of the process pool, 0 for the number of CPUs
+
+        Returns:
+            - the number of files parsed
+        """
+
+        seen = set()
+        to_parse = []
+
+        for (path, mtime, size) in markdown_tasks.iter_markdown_files(
+                self.root):
+            relpath = os.path.relpath(path, self.root)
+            seen.add(relpath)
+            known = self.files.get(relpath)
+            if known is None or known[0] != mtime or known[1] != size:
+                to_parse.append(path)
+
+        for relpath in [path for path in self.files if path not in seen]:
+            self.remove(relpath)
+
+        for (path, mtime, size, links) in markdown_tasks.parse_files(
+                to_parse, workers, try_parse_file):
+            self.add(os.path.relpath(path, self.root), mtime, size, links)
+
+        return len(to_parse)
+
+    def backlinks(self, path):
+        """
+        Find the links of the other files to a file
+
+        Returns:
+            - a list of (path, row) tuples, sorted by file
+        """
+
+        results = []
+        for source in sorted(self.incoming.get(path, ())):
+            if source == path:
+                continue
+            (_, _, rows, paths) = self.files[source]
+            results.extend((source, row) for (row, linked) in zip(rows, paths)
+                           if linked == path)
+        return results
+
+
+def graph_path(cache_dir, root):
+    return markdown_tasks.index_path(cache_dir, root, "links")
+
+
+def load_graph(cache_dir, root):
+    """
+    Load the link graph of a project saved on disk, or a new empty graph
+    """
+
+    try:
+        with open(graph_path(cache_dir, root), "rb") as source:
+            (version, graph) = pickle.load(source)
+        if version == GRAPH_VERSION and graph.root == root:
+            return graph
+    except Exception:
+        # Only a cache: a corrupt file, or a pickle of other versions of
+        # the classes, raising about anything, is built again
+        pass
+    return LinkGraph(root)
+
+
+def save_graph(cache_dir, graph):
+    """
+    Save the link graph of a project on disk
+    """
+
+    path = graph_path(cache_dir, graph.root)
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(path + ".tmp", "wb") as target:
+        pickle.dump((GRAPH_VERSION, graph), target,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + ".tmp", path)
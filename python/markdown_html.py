@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Plugin:      https://github.com/dpretet/vim-markdow-tool
+Description: HTML rendering of markdown documents, block by block
+Maintainer:  Damien Pretet https://github.com/dpretet
+
+A document is rendered from its block index, each block into a single HTML
+element. The HTML of each block is remembered by the hash of its content,
+so rendering a document again after an edit only renders the blocks
+which changed, and a preview only needs to receive these blocks.
+
+This module doesn't depend on Vim and only works on strings.
+"""
+
+import hashlib
+import html
+
+import markdown_core
+import markdown_index
+from markdown_index import LazyPattern
+from markdown_table import LEFT, CENTER, RIGHT
+
+CODE_SPAN_RE = LazyPattern(r"(`+)(.+?)(?<!`)\1(?!`)")
+ESCAPED_RE = LazyPattern(r"\\([\\`*_{}\[\]()#+\-.!|~<>])")
+IMAGE_RE = LazyPattern(r"!\[([^\]]*)\]\(([^)\s]*)[^)]*\)")
+LINK_RE = LazyPattern(r"\[([^\]]*)\]\(([^)\s]*)[^)]*\)")
+AUTOLINK_RE = LazyPattern(r"&lt;(https?://[^\s&]+)&gt;")
+STRONG_RE = LazyPattern(r"(\*\*|__)(?=\S)(.+?)(?<=\S)\1")
+EMPHASIS_RE = LazyPattern(r"(?<![\w*])([*_])(?=\S)(.+?)(?<=\S)\1(?![\w*])")
+STRIKE_RE = LazyPattern(r"~~(?=\S)(.+?)(?<=\S)~~")
+PLACEHOLDER_RE = LazyPattern("\x00(\\d+)\x00")
+TASK_ITEM_RE = LazyPattern(r"^\[(.)\]\s*(.*)$")
+RULE_RE = LazyPattern(r"^ {0,3}([-*_])(?:\s*\1){2,}\s*$")
+SETEXT_RE = LazyPattern(r"^ {0,3}(=+|-+)\s*$")
+TAG_RE = LazyPattern(r"<[^>]*>")
+
+STYLESHEET = """
+body { max-width: 52em; margin: 2em auto; padding: 0 1em; line-height: 1.5;
+       font-family: -apple-system, "Segoe UI", Helvetica, Arial, sans-serif;
+       color: #24292e; }
+h1, h2 { border-bottom: 1px solid #eaecef; padding-bottom: .3em; }
+a { color: #0366d6; text-decoration: none; }
+code, pre { font-family: SFMono-Regular, Consolas, Menlo, monospace;
+            background: #f6f8fa; border-radius: 3px; }
+code { padding: .2em .4em; font-size: 85%; }
+pre { padding: 1em; overflow: auto; }
+pre code { padding: 0; font-size: 100%; }
+table { border-collapse: collapse; margin: 1em 0; }
+th, td { border: 1px solid #dfe2e5; padding: .4em .8em; }
+tr:nth-child(2n) { background: #f6f8fa; }
+blockquote { margin: 0; padding: 0 1em; color: #6a737d;
+             border-left: .25em solid #dfe2e5; }
+li.task { list-style: none; }
+li.task input { margin: 0 .4em 0 -1.4em; }
+img { max-width: 100%; }
+"""
+
+PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>%s</title>
+<style>%s</style>
+</head>
+<body>
+<main id="content">
+%s
+</main>
+%s</body>
+</html>
+"""
+
+
+def render_inline(text):
+    """
+    Render the inline elements of a text: code spans, links, images,
+    emphasis, strikethrough and backslash escapes. The rest is escaped.
+    """
+
+    kept = []
+
+    def keep(fragment):
+        kept.append(fragment)
+        return "\x00" + str(len(kept) - 1) + "\x00"
+
+    # Code spans are taken literally, so extracted first
+    text = CODE_SPAN_RE.sub(lambda match: keep(
+        "<code>" + html.escape(match.group(2).strip()) + "</code>"), text)
+    text = ESCAPED_RE.sub(lambda match: keep(html.escape(match.group(1))),
+                          text)
+
+    text = html.escape(text)
+    text = IMAGE_RE.sub(r'<img src="\2" alt="\1">', text)
+    text = LINK_RE.sub(r'<a href="\2">\1</a>', text)
+    text = AUTOLINK_RE.sub(r'<a href="\1">\1</a>', text)
+    text = STRONG_RE.sub(r"<strong>\2</strong>", text)
+    text = EMPHASIS_RE.sub(r"<em>\2</em>", text)
+    text = STRIKE_RE.sub(r"<del>\1</del>", text)
+
+    return PLACEHOLDER_RE.sub(lambda match: kept[int(match.group(1))], text)
+
+
+def render_heading(block, anchor):
+    return '<h%d id="%s">%s</h%d>' % (block.level, anchor,
+                                      render_inline(block.info), block.level)
+
+
+def render_fence(lines, block):
+    """
+    Render fenced code, with its language as class of the code element
+    """
+
+    marker = markdown_index.FENCE_RE.match(lines[0]).group(1)
+    body = lines[1:]
+    if body and markdown_index.is_closing_fence(body[-1], marker):
+        body = body[:-1]
+
+    language = block.info.split()[0] if block.info else ""
+    attribute = ' class="language-%s"' % html.escape(language) \
+        if language else ""
+    return "<pre><code%s>%s</code></pre>" % (
+        attribute, html.escape("\n".join(body) + "\n" if body else ""))
+
+
+def render_table(lines):
+    """
+    Render a table, with the alignment given by its separator line
+    """
+
+    table = markdown_core.grab_table(lines)
+    styles = {LEFT: ' style="text-align: left"',
+              CENTER: ' style="text-align: center"',
+              RIGHT: ' style="text-align: right"'}
+    align = [styles.get(column_align, "") for column_align in table.align]
+
+    def row(cells, tag):
+        return "<tr>" + "".join(
+            "<%s%s>%s</%s>" % (tag, style, render_inline(cell), tag)
+            for (cell, style) in zip(cells, align)) + "</tr>"
+
+    rows = [row(table.row(i), "td") for i in range(1, table.nb_rows)]
+    return ("<table>\n<thead>\n" + row(table.row(0), "th") +
+            "\n</thead>\n<tbody>\n" + "\n".join(rows) +
+            ("\n" if rows else "") + "</tbody>\n</table>")
+
+
+def render_list(lines):
+    """
+    Render a list, nested by the indentation of its items, the lines
+    which are not items continuing the item before them
+    """
+
+    items = []
+    for line in lines:
+        match = markdown_core.LIST_ITEM_RE.match(line)
+        if match:
+            items.append([len(match.group(1).expandtabs(4)), match.group(2),
+                          match.group(3) or ""])
+        elif items:
+            items[-1][2] += "\n" + line.strip()
+
+    output = []
+    # The lists opened: (indentation of their items, tag)
+    stack = []
+    for (indent, marker, text) in items:
+        tag = "ol" if marker[0].isdigit() else "ul"
+        while stack and indent < stack[-1][0]:
+            output.append("</li>\n</%s>" % stack.pop()[1])
+        if stack and indent == stack[-1][0]:
+            output.append("</li>")
+        else:
+            output.append("<%s>" % tag)
+            stack.append((indent, tag))
+
+        match = TASK_ITEM_RE.match(text)
+        if match:
+            checked = " checked" if match.group(1) in "xX" else ""
+            output.append('<li class="task"><input type="checkbox" '
+                          'disabled%s> %s' % (checked,
+                                              render_inline(match.group(2))))
+        else:
+            output.append("<li>" + render_inline(text))
+
+    while stack:
+        output.append("</li>\n</%s>" % stack.pop()[1])
+    return "\n".join(output)
+
+
+def render_paragraph(lines):
+    """
+    Render a paragraph, or what the block index doesn't distinguish from
+    one: raw HTML, horizontal rules, setext headings and block quotes
+    """
+
+    if lines[0].lstrip().startswith("<"):
+        return '<div class="html">\n' + "\n".join(lines) + "\n</div>"
+
+    if len(lines) == 1 and RULE_RE.match(lines[0]):
+        return "<hr>"
+
+    match = SETEXT_RE.match(lines[-1])
+    if len(lines) > 1 and match:
+        level = 1 if match.group(1)[0] == "=" else 2
+        return "<h%d>%s</h%d>" % (level, render_inline(" ".join(
+            line.strip() for line in lines[:-1])), level)
+
+    if all(line.lstrip().startswith(">") for line in lines):
+        quoted = [line.lstrip()[1:] for line in lines]
+        return "<blockquote>\n%s\n</blockquote>" % render_paragraph(
+            [line[1:] if line.startswith(" ") else line for line in quoted])
+
+    # Two trailing spaces break the line
+    text = "\n".join(line.strip() + ("  " if line.endswith("  ") else "")
+                     for line in lines)
+    return "<p>%s</p>" % render_inline(text).replace("  \n", "<br>\n")
+
+
+def render_block(block, lines, anchor=""):
+    """
+    Render a block of the document index into an HTML element
+
+    Arguments:
+        - block: the block
+        - lines: the lines of the block
+        - anchor: the anchor of a heading
+    """
+
+    if block.kind == markdown_index.HEADING:
+        return render_heading(block, anchor)
+    if block.kind == markdown_index.FENCE:
+        return render_fence(lines, block)
+    if block.kind == markdown_index.TABLE:
+        return render_table(lines)
+    if block.kind in (markdown_index.LIST, markdown_index.TASKLIST):
+        return render_list(lines)
+    return render_paragraph(lines)
+
+
+class HtmlRenderer(object):
+    """
+    Render the documents block by block, the HTML of each block being
+    remembered by the hash of its content, so only the blocks changed
+    since the last rendering are rendered again
+
+    Attributes:
+        - cache: the HTML of the blocks of the last rendering, by hash
+        - rendered: the number of blocks the last rendering had to render
+    """
+
+    __slots__ = ("cache", "rendered")
+
+    def __init__(self):
+        self.cache = {}
+        self.rendered = 0
+
+    def render(self, index):
+        """
+        Render the blocks of a document index
+
+        Returns:
+            - a list of (hash, HTML) of the blocks, in order
+        """
+
+        headings = list(index.blocks_of(markdown_index.HEADING))
+        anchors = dict(zip((block.start for block in headings),
+                           markdown_index.unique_anchors(
+                               block.info for block in headings)))
+
+        blocks = []
+        cache = {}
+        self.rendered = 0
+
+        for block in index.blocks:
+            lines = index.lines[block.start:block.end]
+            anchor = anchors.get(block.start, "")
+            digest = hashlib.blake2b(
+                (block.kind + "\x00" + anchor + "\x00" +
+                 "\n".join(lines)).encode("utf-8"),
+                digest_size=16).hexdigest()
+
+            text = self.cache.get(digest) or cache.get(digest)
+            if text is None:
+                text = render_block(block, lines, anchor)
+                self.rendered += 1
+            cache[digest] = text
+            blocks.append((digest, text))
+
+        # Only keep the blocks still in the document
+        self.cache = cache
+        return blocks
+
+
+def block_diff(old, new):
+    """
+    Compare two versions of a document, as the hashes of their blocks
+
+    Returns:
+        - start, end, new_end: the blocks [start, end) of the old version
+          are replaced by the blocks [start, new_end) of the new one
+    """
+
+    first = 0
+    limit = min(len(old), len(new))
+    while first < limit and old[first] == new[first]:
+        first += 1
+    suffix = 0
+    limit = limit - first
+    while suffix < limit and old[-1 - suffix] == new[-1 - suffix]:
+        suffix += 1
+    return (first, len(old) - suffix, len(new) - suffix)
+
+
+def page(title, blocks, script=""):
+    """
+    Render a whole HTML page from the HTML of the blocks
+    """
+
+    return PAGE % (html.escape(title), STYLESHEET, "\n".join(blocks), script)
+
+
+def document_title(index, default=""):
+    """
+    Title of a document: the text of its first heading, else the default
+    """
+
+    for block in index.blocks_of(markdown_index.HEADING):
+        return html.unescape(TAG_RE.sub("", render_inline(block.info)))
+    return default
@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Plugin:      https://github.com/dpretet/vim-markdow-tool
+Description: Block structure index of a markdown document
+Maintainer:  Damien Pretet https://github.com/dpretet
+
+The document is split in blocks (headings, fenced code, tables, lists and
+paragraphs) in a single pass over its lines. The index is then maintained
+incrementally: when a range of lines is replaced, only the blocks around
+the change are parsed again, until the parser falls back in step with the
+blocks of the previous version.
+
+This module doesn't depend on Vim and only works on lists of strings.
+"""
+
+import re
+from bisect import bisect_right
+from functools import lru_cache
+
+HEADING = "heading"
+FENCE = "fence"
+TABLE = "table"
+LIST = "list"
+TASKLIST = "tasklist"
+PARAGRAPH = "paragraph"
+
+
+class LazyPattern(object):
+    """
+    A regular expression compiled on its first use, so loading the plugin
+    doesn't pay for the patterns of the commands never called. Once
+    compiled, the methods of the pattern are stored on the instance and
+    are found without going through __getattr__ again.
+    """
+
+    METHODS = ("match", "fullmatch", "search", "sub", "subn", "split",
+               "finditer", "findall")
+
+    def __init__(self, pattern, flags=0):
+        self.pattern = pattern
+        self.flags = flags
+
+    def __getattr__(self, name):
+        compiled = re.compile(self.pattern, self.flags)
+        for method in self.METHODS:
+            setattr(self, method, getattr(compiled, method))
+        return getattr(compiled, name)
+
+
+FENCE_RE = LazyPattern(r"^ {0,3}(`{3,}|~{3,})(.*)$")
+HEADING_RE = LazyPattern(r"^ {0,3}(#{1,6})(?:[ \t]+(.*?))?[ \t]*$")
+LIST_RE = LazyPattern(r"^\s*(?:[-*+]|\d+[.)])(?:\s|$)")
+TASK_RE = LazyPattern(r"^\s*(?:[-*+]|\d+[.)])\s+\[(.)\]")
+CLOSING_HASHES_RE = LazyPattern(r"(?:^|[ \t]+)#+[ \t]*$")
+INLINE_LINK_RE = LazyPattern(r"!?\[([^\]]*)\]\([^)]*\)")
+SLUG_STRIP_RE = LazyPattern(r"[^\w\- ]", re.UNICODE)
+
+# Markers around the table of content
+TOC_START = "<!-- toc -->"
+TOC_END = "<!-- /toc -->"
+
+
+class Block(object):
+    """
+    A block of the document
+
+    Attributes:
+        - kind: one of HEADING, FENCE, TABLE, LIST, TASKLIST, PARAGRAPH
+        - start: first line of the block, indexed from 0
+        - end: line following the last one of the block
+        - level: heading level, or fence marker length
+        - info: heading text, or fence language
+    """
+
+    __slots__ = ("kind", "start", "end", "level", "info")
+
+    def __init__(self, kind, start, end, level=0, info=""):
+        self.kind = kind
+        self.start = start
+        self.end = end
+        self.level = level
+        self.info = info
+
+    def same_as(self, other, delta=0):
+        """
+        Check two blocks describe the same content, other being
+        shifted by delta lines
+        """
+        return (self.kind == other.kind and
+                self.start == other.start + delta and
+                self.end == other.end + delta and
+                self.level == other.level and
+                self.info == other.info)
+
+    def __repr__(self):
+        return "Block(%s, %d, %d)" % (self.kind, self.start, self.end)
+
+
+def split_lines(text):
+    """
+    Split a text into lines like Vim reads a file: on "\n" only, the
+    "\r" of the "\r\n" endings dropped, and no empty line after the last
+    newline. Unlike str.splitlines(), "\f", "\v", U+2028... stay in the
+    lines, so their rows are the ones of the buffer.
+    """
+
+    lines = text.split("\n")
+    if not lines[-1]:
+        lines.pop()
+    return [line[:-1] if line.endswith("\r") else line for line in lines]
+
+
+@lru_cache(maxsize=4096)
+def slugify(text):
+    """
+    Compute the anchor GitHub generates for a heading: lower case, links
+    replaced by their text, punctuation removed and spaces turned into
+    hyphens. Memoized, headings rarely change between two calls.
+    """
+
+    text = INLINE_LINK_RE.sub(r"\1", text)
+    return SLUG_STRIP_RE.sub("", text.strip().lower()).replace(" ", "-")
+
+
+def unique_anchors(texts):
+    """
+    Compute the anchors of a sequence of headings, suffixing the duplicates
+    with -1, -2... like GitHub does
+    """
+
+    seen = {}
+    anchors = []
+    for text in texts:
+        slug = slugify(text)
+        anchor = slug
+        while anchor in seen:
+            seen[slug] += 1
+            anchor = slug + "-" + str(seen[slug])
+        seen[anchor] = 0
+        anchors.append(anchor)
+    return anchors
+
+
+def toc_lines(headings):
+    """
+    Render the table of content of a list of heading blocks, a nested
+    list of links to the headings, indented from the highest level found
+    """
+
+    if not headings:
+        return []
+
+    top = min(heading.level for heading in headings)
+    anchors = unique_anchors(heading.info for heading in headings)
+
+    return ["  " * (heading.level - top) + "- [" +
+            INLINE_LINK_RE.sub(r"\1", heading.info) + "](#" + anchor + ")"
+            for (heading, anchor) in zip(headings, anchors)]
+
+
+def is_table_line(line):
+    """
+    A table line starts with |, whatever the indentation
+    """
+    return line.lstrip()[:1] == "|"
+
+
+def is_closing_fence(line, marker):
+    """
+    Check a line closes a fence opened with marker
+    """
+    stripped = line.strip()
+    return (stripped.startswith(marker) and
+            stripped == stripped[0] * len(stripped) and
+            len(line) - len(line.lstrip(" ")) < 4)
+
+
+def starts_block(line):
+    """
+    Check a line interrupts a paragraph by opening another block
+    """
+    return (FENCE_RE.match(line) is not None or
+            HEADING_RE.match(line) is not None or
+            is_table_line(line) or
+            LIST_RE.match(line) is not None)
+
+
+def iter_blocks(lines, start=0):
+    """
+    Parse the lines from start, which must be the first line of a block or
+    a blank line, and yield the blocks in order
+    """
+
+    i = start
+    nb_lines = len(lines)
+
+    while i < nb_lines:
+
+        line = lines[i]
+
+        # Blank lines don't belong to any block
+        if not line.strip():
+            i += 1
+            continue
+
+        # Fenced code, up to the closing fence or the end of the document
+        match = FENCE_RE.match(line)
+        if match:
+            marker = match.group(1)
+            j = i + 1
+            while j < nb_lines and not is_closing_fence(lines[j], marker):
+                j += 1
+            end = min(j + 1, nb_lines)
+            yield Block(FENCE, i, end, len(marker), match.group(2).strip())
+            i = end
+            continue
+
+        # ATX heading, always a single line
+        match = HEADING_RE.match(line)
+        if match:
+            text = CLOSING_HASHES_RE.sub("", match.group(2) or "")
+            yield Block(HEADING, i, i + 1, len(match.group(1)), text)
+            i += 1
+            continue
+
+        j = i + 1
+
+        # Table, all the consecutive lines starting with |
+        if is_table_line(line):
+            while j < nb_lines and is_table_line(lines[j]):
+                j += 1
+            yield Block(TABLE, i, j)
+            i = j
+            continue
+
+        # List, the items and their indented continuation lines
+        if LIST_RE.match(line):
+            kind = TASKLIST if TASK_RE.match(line) else LIST
+            while j < nb_lines:
+                line = lines[j]
+                if not line.strip() or FENCE_RE.match(line):
+                    break
+                if LIST_RE.match(line):
+                    if TASK_RE.match(line):
+                        kind = TASKLIST
+                elif not line[:1].isspace():
+                    break
+                j += 1
+            yield Block(kind, i, j)
+            i = j
+            continue
+
+        # Anything else is a paragraph, up to a blank line or another block
+        while j < nb_lines and lines[j].strip() and not starts_block(lines[j]):
+            j += 1
+        yield Block(PARAGRAPH, i, j)
+        i = j
+
+
+class DocumentIndex(object):
+    """
+    The blocks of a document, sorted by line, with the lines they have been
+    parsed from.
+
+    Attributes:
+        - lines: the document content, a list of strings
+        - blocks: the blocks, ordered by start line
+        - starts: the start line of each block, to bisect into blocks
+        - changedtick: the buffer version the index describes
+    """
+
+    __slots__ = ("lines", "blocks", "starts", "changedtick")
+
+    def __init__(self, lines, changedtick=0):
+        self.lines = list(lines)
+        self.blocks = list(iter_blocks(self.lines))
+        self.starts = [block.start for block in self.blocks]
+        self.changedtick = changedtick
+
+    def block_at(self, row):
+        """
+        Return the block containing the line row (indexed from 0),
+        None if the line is blank or out of the document
+        """
+
+        k = bisect_right(self.starts, row) - 1
+        if k >= 0 and row < self.blocks[k].end:
+            return self.blocks[k]
+        return None
+
+    def table_at(self, row):
+        """
+        Return the table block containing the line row, else None
+        """
+
+        block = self.block_at(row)
+        if block is not None and block.kind == TABLE:
+            return block
+        return None
+
+    def blocks_of(self, *kinds):
+        """
+        Iterate over the blocks of the given kinds
+        """
+
+        return (block for block in self.blocks if block.kind in kinds)
+
+    def anchors(self):
+        """
+        Return the set of the anchors of the headings of the document
+        """
+
+        return set(unique_anchors(block.info
+                                  for block in self.blocks_of(HEADING)))
+
+    def toc_range(self):
+        """
+        Locate the table of content markers
+
+        Returns:
+            - the lines of the start and end markers, None if not found
+        """
+
+        start = None
+        for block in self.blocks_of(PARAGRAPH):
+            for row in range(block.start, block.end):
+                line = self.lines[row].strip()
+                if line == TOC_START:
+                    start = row
+                elif line == TOC_END and start is not None:
+                    return (start, row)
+        return None
+
+    def update(self, first, last, new_lines):
+        """
+        Replace the lines [first, last) by new_lines and parse again
+        only the blocks affected by the change.
+
+        Returns:
+            - the number of lines parsed again
+        """
+
+        delta = len(new_lines) - (last - first)
+        self.lines[first:last] = new_lines
+        new_last = first + len(new_lines)
+
+        # Restart from the block holding the line before the change, its
+        # boundaries can move with the change
+        k = max(bisect_right(self.starts, max(first - 1, 0)) - 1, 0)
+        restart = min(self.blocks[k].start, first) if self.blocks else 0
+
+        # Old blocks past the change, candidates to resynchronize with
+        j = bisect_right(self.starts, last - 1)
+        if j < len(self.blocks) and self.blocks[j].start < last:
+            j += 1
+
+        parsed = []
+        tail = []
+        for block in iter_blocks(self.lines, restart):
+            if block.start >= new_last:
+                # Skip the old blocks now behind the parser
+                while (j < len(self.blocks) and
+                       self.blocks[j].start + delta < block.start):
+                    j += 1
+                if (j < len(self.blocks) and
+                        block.same_as(self.blocks[j], delta)):
+                    tail = self.blocks[j:]
+                    break
+            parsed.append(block)
+
+        for block in tail:
+            block.start += delta
+            block.end += delta
+
+        self.blocks[k:] = parsed + tail
+        self.starts = [block.start for block in self.blocks]
+
+        if parsed:
+            return parsed[-1].end - restart
+        return 0
+
+    def resync(self, lines):
+        """
+        Update the index against a new version of the whole document,
+        parsing again only the range which differs from the indexed lines
+        """
+
+        old = self.lines
+        nb_old = len(old)
+        nb_new = len(lines)
+
+        # Common prefix and suffix of the two versions
+        first = 0
+        limit = min(nb_old, nb_new)
+        while first < limit and old[first] == lines[first]:
+            first += 1
+        suffix = 0
+        limit = limit - first
+        while suffix < limit and old[-1 - suffix] == lines[-1 - suffix]:
+            suffix += 1
+
+        if first == nb_old == nb_new:
+            return 0
+        return self.update(first, nb_old - suffix,
+                           lines[first:nb_new - suffix])
@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Plugin:      https://github.com/dpretet/vim-markdow-tool
+Description: Links checker, for local files, anchors and web links
+Maintainer:  Damien Pretet https://github.com/dpretet
+
+Web links are checked concurrently: requests run in a bounded pool of
+connections, with a limit of connections per host and a timeout, and
+their results are kept in an on-disk cache for a while, so checking again
+a document only requests the links not checked recently.
+
+This module doesn't depend on Vim.
+"""
+
+import asyncio
+import http.client
+import json
+import os
+import re
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import markdown_index
+
+INLINE_LINK_RE = re.compile(
+    r"(!?)\[[^\]]*\]\(\s*<?([^)\s>]*)>?(?:\s+[\"'(][^)]*)?\)")
+HTML_LINK_RE = re.compile(
+    r"""<(?:img|a)\b[^>]*?\s(?:src|href)=["']([^"']*)""", re.IGNORECASE)
+CODE_SPAN_RE = re.compile(r"(`+).*?\1")
+HTML_COMMENT_RE = re.compile(r"<!--.*?-->")
+
+ERROR = "E"
+WARNING = "W"
+
+# HTTP statuses returned by sites refusing robots, not proving a dead link
+DOUBTFUL_STATUS = (401, 403, 429)
+
+USER_AGENT = "vim-markdown-tool links checker"
+
+
+class Link(object):
+    """
+    A link found in the document
+
+    Attributes:
+        - target: the link destination, as written in the document
+        - row: line of the link, indexed from 0
+        - col: column of the link, indexed from 0
+        - is_image: True for an image source
+    """
+
+    __slots__ = ("target", "row", "col", "is_image")
+
+    def __init__(self, target, row, col, is_image=False):
+        self.target = target
+        self.row = row
+        self.col = col
+        self.is_image = is_image
+
+
+class Problem(object):
+    """
+    A link failing the check
+
+    Attributes:
+        - row, col: the link position, indexed from 0
+        - message: what's wrong with the link
+        - severity: ERROR, or WARNING when the link may still be valid
+    """
+
+    __slots__ = ("row", "col", "message", "severity")
+
+    def __init__(self, link, message, severity=ERROR):
+        self.row = link.row
+        self.col = link.col
+        self.message = message
+        self.severity = severity
+
+
+def blank_out(match):
+    """
+    Replace a match by spaces, to ignore it while keeping the columns
+    """
+    return " " * len(match.group(0))
+
+
+def extract_links(index):
+    """
+    Find the inline links, the images and the HTML links of the document,
+    out of the code blocks, the code spans and the HTML comments
+    """
+
+    links = []
+    lines = index.lines
+
+    for block in index.blocks:
+        if block.kind == markdown_index.FENCE:
+            continue
+        for row in range(block.start, block.end):
+            line = lines[row]
+            if "](" not in line and "<" not in line:
+                continue
+            line = CODE_SPAN_RE.sub(blank_out, line)
+            line = HTML_COMMENT_RE.sub(blank_out, line)
+            for match in INLINE_LINK_RE.finditer(line):
+                links.append(Link(match.group(2), row, match.start(),
+                                  bool(match.group(1))))
+            for match in HTML_LINK_RE.finditer(line):
+                links.append(Link(match.group(1), row, match.start(1)))
+
+    return links
+
+
+def is_web_url(target):
+    return target.startswith(("http://", "https://"))
+
+
+def file_anchors(path):
+    """
+    Read the heading anchors of a markdown file
+    """
+
+    with open(path, encoding="utf-8", errors="replace",
+              newline="") as source:
+        lines = markdown_index.split_lines(source.read())
+    return markdown_index.DocumentIndex(lines).anchors()
+
+
+def check_local(link, anchors, base_dir, anchors_cache):
+    """
+    Check a link to a heading of the document, or to a local file and
+    optionally one of its headings
+
+    Returns:
+        - a Problem, or None if the link is valid
+    """
+
+    target = link.target
+
+    if not target:
+        return Problem(link, "Empty link", WARNING)
+
+    (path, _, anchor) = urllib.parse.unquote(target).partition("#")
+    path = path.partition("?")[0]
+
+    # An empty anchor links to the top of the document
+    if not path:
+        if anchor and anchor not in anchors:
+            return Problem(link, "No heading for anchor #" + anchor)
+        return None
+
+    if not os.path.isabs(path):
+        path = os.path.join(base_dir, path)
+    if not os.path.exists(path):
+        return Problem(link, "File not found: " + target)
+
+    if anchor and path.lower().endswith((".md", ".mkd", ".markdown")):
+        if path not in anchors_cache:
+            anchors_cache[path] = file_anchors(path)
+        if anchor not in anchors_cache[path]:
+            return Problem(link, "No heading for anchor #" + anchor +
+                           " in " + target)
+    return None
+
+
+def request_status(url, deadline):
+    """
+    Request a URL, with a HEAD request first then a GET one if HEAD is not
+    supported by the server
+
+    Arguments:
+        - url: the URL requested
+        - deadline: time.monotonic() time both requests must end by
+
+    Returns:
+        - the HTTP status, after the redirections
+
+    Raises:
+        - TimeoutError if the deadline is passed before the GET request
+    """
+
+    for method in ("HEAD", "GET"):
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            raise TimeoutError("timed out")
+        request = urllib.request.Request(url, method=method,
+                                         headers={"User-Agent": USER_AGENT})
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                return response.status
+        except urllib.error.HTTPError as error:
+            if method == "HEAD" and error.code in (405, 501):
+                continue
+            return error.code
+    return None
+
+
+class LinkCache(object):
+    """
+    On-disk cache of the HTTP status of the URLs checked, with the time
+    they have been checked. Entries older than ttl seconds are ignored.
+    """
+
+    __slots__ = ("path", "ttl", "entries")
+
+    def __init__(self, path, ttl):
+        self.path = path
+        self.ttl = ttl
+        self.entries = {}
+        if path and os.path.isfile(path):
+            try:
+                with open(path, encoding="utf-8") as source:
+                    self.entries = json.load(source)
+            except (OSError, ValueError):
+                self.entries = {}
+
+    def get(self, url):
+        entry = self.entries.get(url)
+        if entry and time.time() - entry[1] < self.ttl:
+            return entry[0]
+        return None
+
+    def set(self, url, status):
+        self.entries[url] = [status, time.time()]
+
+    def save(self):
+        """
+        Write the cache, dropping the expired entries
+        """
+
+        if not self.path:
+            return
+        now = time.time()
+        entries = {url: entry for (url, entry) in self.entries.items()
+                   if now - entry[1] < self.ttl}
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as target:
+            json.dump(entries, target)
+        os.replace(tmp_path, self.path)
+
+
+async def check_urls(urls, cache, workers=16, per_host=2, timeout=10):
+    """
+    Request the URLs not found in the cache, at most workers at a time
+    and per_host at a time on the same host
+
+    Returns:
+        - a dict of URL: HTTP status, or error message if the request failed
+    """
+
+    loop = asyncio.get_running_loop()
+    results = {}
+    host_limits = {}
+    to_check = []
+
+    for url in urls:
+        status = cache.get(url)
+        if status is None:
+            to_check.append(url)
+        else:
+            results[url] = status
+
+    async def check(url, pool):
+        host = urllib.parse.urlsplit(url).netloc
+        limit = host_limits.setdefault(host, asyncio.Semaphore(per_host))
+        async with limit:
+            # A single deadline for the HEAD and GET requests of the URL
+            deadline = time.monotonic() + timeout
+            try:
+                status = await asyncio.wait_for(
+                    loop.run_in_executor(pool, request_status, url, deadline),
+                    timeout)
+            except asyncio.TimeoutError:
+                results[url] = "Timeout"
+                return
+            except (OSError, ValueError, http.client.HTTPException) as error:
+                results[url] = str(getattr(error, "reason", error))
+                return
+        results[url] = status
+        cache.set(url, status)
+
+    if to_check:
+        pool = ThreadPoolExecutor(max_workers=workers)
+        try:
+            await asyncio.gather(*(check(url, pool) for url in to_check))
+        finally:
+            # The requests timed out are left to end in their threads,
+            # instead of being waited for
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    return results
+
+
+def local_problems(links, anchors, base_dir, anchors_cache=None):
+    """
+    Check the links to the headings of the document and to local files,
+    and set apart the web links, to request later
+
+    Arguments:
+        - links: the links to check
+        - anchors: the heading anchors of the document
+        - base_dir: directory the relative paths are resolved from
+        - anchors_cache: the anchors of the markdown files already read,
+          by path
+
+    Returns:
+        - the list of problems found, and the list of web links
+    """
+
+    if anchors_cache is None:
+        anchors_cache = {}
+    problems = []
+    web_links = []
+
+    for link in links:
+        if is_web_url(link.target):
+            web_links.append(link)
+        elif "://" in link.target or link.target.startswith("mailto:"):
+            continue
+        else:
+            problem = check_local(link, anchors, base_dir, anchors_cache)
+            if problem is not None:
+                problems.append(problem)
+
+    return (problems, web_links)
+
+
+def web_problems(web_links, results):
+    """
+    Turn the results of check_urls into the problems of the web links
+    """
+
+    problems = []
+    for link in web_links:
+        status = results[link.target]
+        if isinstance(status, str):
+            problems.append(Problem(link, status + ": " + link.target))
+        elif status in DOUBTFUL_STATUS:
+            problems.append(Problem(link, "HTTP " + str(status) + ": " +
+                                    link.target, WARNING))
+        elif status is None or status >= 400:
+            problems.append(Problem(link, "HTTP " + str(status) + ": " +
+                                    link.target))
+    return problems
+
+
+def check_links(links, anchors, base_dir, cache, workers=16, per_host=2,
+                timeout=10):
+    """
+    Check a list of links, web links being requested concurrently
+
+    Arguments:
+        - links: the links to check
+        - anchors: the heading anchors of the document
+        - base_dir: directory the relative paths are resolved from
+        - cache: the LinkCache of the web links
+        - workers: maximum number of web requests at a time
+        - per_host: maximum number of web requests at a time on a host
+        - timeout: timeout of a web request, in seconds
+
+    Returns:
+        - the list of problems found, sorted by position
+    """
+
+    (problems, web_links) = local_problems(links, anchors, base_dir)
+
+    urls = sorted(set(link.target for link in web_links))
+    results = asyncio.run(check_urls(urls, cache, workers, per_host,
+                                     timeout))
+    cache.save()
+
+    problems += web_problems(web_links, results)
+    problems.sort(key=lambda problem: (problem.row, problem.col))
+    return problems
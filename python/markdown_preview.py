@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Plugin:      https://github.com/dpretet/vim-markdow-tool
+Description: Live HTML preview of a document, served on localhost
+Maintainer:  Damien Pretet https://github.com/dpretet
+
+The server runs in background threads. The page it serves listens to
+server-sent events, each one carrying the blocks replaced by a change of
+the document, so the browser patches the page instead of reloading it.
+
+This module doesn't depend on Vim.
+"""
+
+import json
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import markdown_html
+
+# Number of changes kept for the pages catching up, the pages further
+# behind receive the whole document
+HISTORY = 64
+
+# Seconds between two keep-alive messages to the pages
+KEEP_ALIVE = 15
+
+SCRIPT = """<script>
+const content = document.getElementById("content");
+const source = new EventSource("/events?since=%d");
+source.onmessage = (event) => {
+  const change = JSON.parse(event.data);
+  const blocks = Array.from(content.children);
+  const template = document.createElement("template");
+  template.innerHTML = change.html.join("\\n");
+  const next = blocks[change.end] || null;
+  for (const block of blocks.slice(change.start, change.end)) {
+    block.remove();
+  }
+  content.insertBefore(template.content, next);
+};
+</script>
+"""
+
+
+class PreviewServer(object):
+    """
+    Serve the preview of a document and push its changes
+
+    Attributes:
+        - title: the title of the page
+        - blocks: the (hash, HTML) of the blocks of the document
+        - version: the number of changes pushed
+    """
+
+    def __init__(self, title=""):
+        self.title = title
+        self.blocks = []
+        self.version = 0
+        self.history = deque(maxlen=HISTORY)
+        self.condition = threading.Condition()
+        self.closed = False
+        self.httpd = None
+
+    def start(self, port=0):
+        """
+        Start serving on localhost, on a free port if 0
+
+        Returns:
+            - the URL of the preview
+        """
+
+        handler = type("Handler", (PreviewHandler,), {"preview": self})
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), handler)
+        self.httpd.daemon_threads = True
+        thread = threading.Thread(target=self.httpd.serve_forever,
+                                  daemon=True)
+        thread.start()
+        return "http://127.0.0.1:%d/" % self.httpd.server_address[1]
+
+    def stop(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+    def update(self, blocks, title=None):
+        """
+        Push a new version of the document to the pages open, as the
+        blocks replaced
+
+        Returns:
+            - True if the document changed
+        """
+
+        with self.condition:
+            if title is not None:
+                self.title = title
+            (start, end, new_end) = markdown_html.block_diff(
+                [digest for (digest, _) in self.blocks],
+                [digest for (digest, _) in blocks])
+            if start == end == new_end:
+                return False
+
+            self.blocks = blocks
+            self.version += 1
+            self.history.append((self.version, json.dumps({
+                "start": start, "end": end,
+                "html": [text for (_, text) in blocks[start:new_end]]})))
+            self.condition.notify_all()
+        return True
+
+    def page(self):
+        with self.condition:
+            return markdown_html.page(
+                self.title, [text for (_, text) in self.blocks],
+                SCRIPT % self.version)
+
+    def changes_since(self, version):
+        """
+        Wait for the changes following a version, or the keep-alive delay
+
+        Returns:
+            - the list of (version, message) to send, the whole document
+              if the page is too far behind, None once the server stopped
+        """
+
+        with self.condition:
+            self.condition.wait_for(
+                lambda: self.closed or self.version != version, KEEP_ALIVE)
+            if self.closed:
+                return None
+            if self.version == version:
+                return []
+            if self.history and self.history[0][0] <= version + 1:
+                return [change for change in self.history
+                        if change[0] > version]
+            return [(self.version, json.dumps({
+                "start": 0, "end": 1 << 30,
+                "html": [text for (_, text) in self.blocks]}))]
+
+
+class PreviewHandler(BaseHTTPRequestHandler):
+    """
+    Serve the page, and the stream of its changes on /events
+    """
+
+    preview = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/":
+            self.send_text(self.preview.page(), "text/html")
+        elif url.path == "/events":
+            self.send_events(url)
+        else:
+            self.send_error(404)
+
+    def send_text(self, text, content_type):
+        body = text.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type + "; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_events(self, url):
+        # A reconnecting page gives the last change it received
+        version = self.headers.get("Last-Event-ID") or \
+            parse_qs(url.query).get("since", ["0"])[0]
+        version = int(version) if version.isdigit() else 0
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+        try:
+            while True:
+                changes = self.preview.changes_since(version)
+                if changes is None:
+                    return
+                if not changes:
+                    self.wfile.write(b": keep-alive\n\n")
+                for (version, message) in changes:
+                    self.wfile.write(("id: %d\ndata: %s\n\n" %
+                                      (version, message)).encode("utf-8"))
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            return
+
+    def log_message(self, format, *args):
+        # Nothing must be printed over the editor
+        pass
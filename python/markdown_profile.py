@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Plugin:      https://github.com/dpretet/vim-markdow-tool
+Description: Instrumentation of the commands, timing and Vim round-trips
+Maintainer:  Damien Pretet https://github.com/dpretet
+
+When profiling is enabled, each command is timed into a latency histogram,
+and the vim module is swapped for a stand-in counting the round-trips and
+the lines read and written. When disabled, nothing is swapped and the
+commands only pay a flag check.
+
+This module doesn't import Vim, the vim module to wrap is given to it.
+"""
+
+import time
+from contextlib import contextmanager
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, float("inf"))
+
+
+class CommandStats(object):
+    """
+    Latency histogram and counters of a command
+    """
+
+    __slots__ = ("calls", "total", "max", "buckets")
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * len(BUCKETS)
+
+    def add(self, elapsed):
+        self.calls += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+        for (i, bound) in enumerate(BUCKETS):
+            if elapsed <= bound:
+                self.buckets[i] += 1
+                break
+
+    def percentile(self, ratio):
+        """
+        Upper bound of the bucket holding the given percentile
+        """
+
+        target = ratio * self.calls
+        seen = 0
+        for (count, bound) in zip(self.buckets, BUCKETS):
+            seen += count
+            if seen >= target:
+                return min(bound, self.max)
+        return self.max
+
+
+class Profiler(object):
+    """
+    Collect the timing of the commands and the counters of the round-trips
+    with Vim, and optionally a cProfile of the commands
+
+    Attributes:
+        - enabled: True while profiling
+        - commands: CommandStats by command name
+        - counters: api_calls, lines_read, lines_written
+    """
+
+    __slots__ = ("enabled", "commands", "counters", "profile",
+                 "profile_path", "depth")
+
+    def __init__(self):
+        self.enabled = False
+        self.commands = {}
+        self.counters = {}
+        self.profile = None
+        self.profile_path = ""
+        self.depth = 0
+        self.reset()
+
+    def reset(self):
+        self.commands = {}
+        self.counters = {"api_calls": 0, "lines_read": 0, "lines_written": 0}
+
+    def start(self, profile_path=""):
+        """
+        Enable profiling, with a cProfile of the commands dumped into
+        profile_path at stop if given
+        """
+
+        self.enabled = True
+        self.profile_path = profile_path
+        self.profile = None
+        if profile_path:
+            import cProfile
+            self.profile = cProfile.Profile()
+
+    def stop(self):
+        """
+        Disable profiling, and write the cProfile stats if requested
+
+        Returns:
+            - the path of the stats file written, else an empty string
+        """
+
+        self.enabled = False
+        path = ""
+        if self.profile is not None:
+            self.profile.dump_stats(self.profile_path)
+            path = self.profile_path
+        self.profile = None
+        return path
+
+    def count(self, counter, value=1):
+        self.counters[counter] += value
+
+    @contextmanager
+    def span(self, name):
+        """
+        Time a command. Nested commands are accounted in the outer one only.
+        """
+
+        if self.depth:
+            yield
+            return
+
+        self.depth += 1
+        if self.profile is not None:
+            self.profile.enable()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            if self.profile is not None:
+                self.profile.disable()
+            self.depth -= 1
+            self.commands.setdefault(name, CommandStats()).add(elapsed)
+
+    def report(self):
+        """
+        Format the statistics collected
+
+        Returns:
+            - a list of lines
+        """
+
+        lines = ["%-22s %6s %9s %9s %9s %9s" % ("command", "calls", "mean ms",
+                                                "p50 ms", "p90 ms", "max ms")]
+        for name in sorted(self.commands):
+            stats = self.commands[name]
+            lines.append("%-22s %6d %9.2f %9.2f %9.2f %9.2f" % (
+                name, stats.calls, stats.total / stats.calls,
+                stats.percentile(0.5), stats.percentile(0.9), stats.max))
+
+        lines.append("histogram (ms): " + " ".join(
+            "<=%g" % bound for bound in BUCKETS[:-1]) + " >%g" % BUCKETS[-2])
+        for name in sorted(self.commands):
+            lines.append("  %-20s %s" % (name, " ".join(
+                str(count) for count in self.commands[name].buckets)))
+
+        lines.append(", ".join("%s: %d" % (counter, value)
+                               for (counter, value) in self.counters.items()))
+        return lines
+
+
+class CountingBuffer(object):
+    """
+    Stand-in of a Vim buffer counting the round-trips and the lines
+    read and written
+    """
+
+    __slots__ = ("_buffer", "_profiler")
+
+    def __init__(self, buffer, profiler):
+        self._buffer = buffer
+        self._profiler = profiler
+
+    def __getattr__(self, name):
+        return getattr(self._buffer, name)
+
+    def __len__(self):
+        self._profiler.count("api_calls")
+        return len(self._buffer)
+
+    def __getitem__(self, key):
+        self._profiler.count("api_calls")
+        lines = self._buffer[key]
+        self._profiler.count("lines_read",
+                             len(lines) if isinstance(key, slice) else 1)
+        return lines
+
+    def __setitem__(self, key, lines):
+        self._profiler.count("api_calls")
+        self._profiler.count("lines_written",
+                             len(lines) if isinstance(key, slice) else 1)
+        self._buffer[key] = lines
+
+    def __delitem__(self, key):
+        self._profiler.count("api_calls")
+        del self._buffer[key]
+
+    def append(self, lines, *args):
+        self._profiler.count("api_calls")
+        self._profiler.count("lines_written",
+                             1 if isinstance(lines, str) else len(lines))
+        return self._buffer.append(lines, *args)
+
+
+class CountingWindow(object):
+    """
+    Stand-in of a Vim window counting the cursor accesses
+    """
+
+    __slots__ = ("_window", "_profiler")
+
+    def __init__(self, window, profiler):
+        object.__setattr__(self, "_window", window)
+        object.__setattr__(self, "_profiler", profiler)
+
+    def __getattr__(self, name):
+        if name == "cursor":
+            self._profiler.count("api_calls")
+        return getattr(self._window, name)
+
+    def __setattr__(self, name, value):
+        if name == "cursor":
+            self._profiler.count("api_calls")
+        setattr(self._window, name, value)
+
+
+class CountingCurrent(object):
+    """
+    Stand-in of vim.current, handing out counting buffers and windows
+    """
+
+    __slots__ = ("_current", "_profiler")
+
+    def __init__(self, current, profiler):
+        self._current = current
+        self._profiler = profiler
+
+    @property
+    def buffer(self):
+        return CountingBuffer(self._current.buffer, self._profiler)
+
+    @property
+    def window(self):
+        return CountingWindow(self._current.window, self._profiler)
+
+    @property
+    def line(self):
+        self._profiler.count("api_calls")
+        self._profiler.count("lines_read")
+        return self._current.line
+
+    def __getattr__(self, name):
+        return getattr(self._current, name)
+
+
+class CountingVim(object):
+    """
+    Stand-in of the vim module counting the round-trips with Vim
+    """
+
+    __slots__ = ("_vim", "_profiler")
+
+    def __init__(self, module, profiler):
+        self._vim = module
+        self._profiler = profiler
+
+    @property
+    def current(self):
+        return CountingCurrent(self._vim.current, self._profiler)
+
+    def eval(self, expr):
+        self._profiler.count("api_calls")
+        return self._vim.eval(expr)
+
+    def command(self, cmd):
+        self._profiler.count("api_calls")
+        return self._vim.command(cmd)
+
+    def __getattr__(self, name):
+        return getattr(self._vim, name)
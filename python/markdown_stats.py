@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Plugin:      https://github.com/dpretet/vim-markdow-tool
+Description: Statistics of markdown documents for the statusline: words,
+             reading time and tasks done
+Maintainer:  Damien Pretet https://github.com/dpretet
+
+The words and the tasks of each status are counted per block of the
+document index, and the counts of the document are the sum of the blocks.
+After an edit, only the blocks the index parsed again are counted again,
+their counts replacing the old ones in the sums.
+
+This module doesn't depend on Vim and only works on lists of strings.
+"""
+
+from collections import Counter
+
+import markdown_index
+from markdown_index import FENCE, LazyPattern
+
+WORD_RE = LazyPattern(r"\w+(?:['’.-]\w+)*")
+
+# Words read per minute, for the reading time
+READING_SPEED = 200
+
+
+def line_words(line):
+    """
+    Number of words of a line, without the task marker and the link
+    destinations
+    """
+
+    match = markdown_index.TASK_RE.match(line)
+    if match:
+        line = line[match.end():]
+    if "](" in line:
+        line = markdown_index.INLINE_LINK_RE.sub(r"\1", line)
+    return len(WORD_RE.findall(line))
+
+
+def block_counts(block, lines):
+    """
+    Count the words and the tasks of a block. The code is not read, so
+    not counted.
+
+    Returns:
+        - the number of words, and the number of tasks by status
+    """
+
+    if block.kind == FENCE:
+        return (0, {})
+
+    words = 0
+    tasks = {}
+    for row in range(block.start, block.end):
+        line = lines[row]
+        words += line_words(line)
+        match = markdown_index.TASK_RE.match(line)
+        if match:
+            status = match.group(1)
+            tasks[status] = tasks.get(status, 0) + 1
+    return (words, tasks)
+
+
+class DocumentStats(object):
+    """
+    Counts of the words and the tasks of a document, updated from its
+    block index
+
+    Attributes:
+        - words: the number of words
+        - tasks: the number of tasks by status character
+        - blocks: the blocks of the index the counts were computed from
+        - counts: the counts of each block, see block_counts
+    """
+
+    __slots__ = ("words", "tasks", "blocks", "counts")
+
+    def __init__(self):
+        self.words = 0
+        self.tasks = Counter()
+        self.blocks = []
+        self.counts = []
+
+    def update(self, index):
+        """
+        Count again the blocks which changed in the index since the last
+        update. The index keeps the Block objects of the lines which didn't
+        change, and a block's counts don't depend on where it is, so the
+        blocks kept are only compared by reference.
+
+        Returns:
+            - the number of blocks counted
+        """
+
+        (old_blocks, blocks) = (self.blocks, index.blocks)
+
+        # Blocks unchanged before the edit, and after it
+        k = 0
+        limit = min(len(old_blocks), len(blocks))
+        while k < limit and blocks[k] is old_blocks[k]:
+            k += 1
+        kept = 0
+        limit -= k
+        while kept < limit and blocks[-1 - kept] is old_blocks[-1 - kept]:
+            kept += 1
+
+        removed = self.counts[k:len(old_blocks) - kept]
+        added = [block_counts(block, index.lines)
+                 for block in blocks[k:len(blocks) - kept]]
+
+        for (words, tasks) in removed:
+            self.words -= words
+            self.tasks.subtract(tasks)
+        for (words, tasks) in added:
+            self.words += words
+            self.tasks.update(tasks)
+
+        self.counts[k:len(old_blocks) - kept] = added
+        self.blocks = list(blocks)
+        return len(added)
+
+    def summary(self, done_status="X", speed=READING_SPEED):
+        """
+        Return the statistics shown in the statusline
+
+        Arguments:
+            - done_status: the status character of the tasks done
+            - speed: the reading speed, in words per minute
+
+        Returns:
+            - a dict of words, minutes (reading time, rounded up), tasks
+              (of all statuses), done, and text, the statistics written
+              out
+        """
+
+        minutes = -(-self.words // max(speed, 1))
+        tasks = sum(self.tasks.values())
+        done = self.tasks[done_status]
+
+        text = "%d words, %d min" % (self.words, minutes)
+        if tasks:
+            text += ", %d/%d tasks" % (done, tasks)
+        return {"words": self.words, "minutes": minutes, "tasks": tasks,
+                "done": done, "text": text}
@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Plugin:      https://github.com/dpretet/vim-markdow-tool
+Description: Table model used to manipulate and render markdown tables
+Maintainer:  Damien Pretet https://github.com/dpretet
+
+This module doesn't depend on Vim and only works on strings.
+"""
+
+import csv
+from collections import Counter
+
+from markdown_width import display_width, display_widths
+
+# Width of a column only filled with blank cells
+DEFAULT_WIDTH = 5
+
+LEFT = "left"
+CENTER = "center"
+RIGHT = "right"
+
+
+class Table(object):
+    """
+    A markdown table, stored column by column. The first row is the header.
+
+    The maximum width of each column is maintained while the table is
+    edited, by counting the cells of each width, so a change never needs
+    to scan the whole table again. The cells of a column are only counted
+    once one of them changes, most tables being parsed to be rendered
+    right away. The rendered rows are kept as well, and only the rows
+    edited are rendered again. When the width of a single column justified
+    on the left or the right changed, the padding of the other rows is
+    only widened or narrowed.
+
+    Attributes:
+        - columns: list of columns, each one a list of stripped strings
+        - align: alignment of each column, LEFT, CENTER, RIGHT or None
+          when the separator doesn't specify it
+        - widths: maximum width of the cells of each column, in columns
+          of the terminal: wide characters count for two, the combining
+          ones for none
+    """
+
+    __slots__ = ("columns", "align", "widths", "_width_counts",
+                 "_rendered", "_rendered_widths", "_rendered_justify")
+
+    def __init__(self, columns=None, align=None):
+        self.columns = []
+        self.align = []
+        self.widths = []
+        self._width_counts = []
+        self._rendered = []
+        self._rendered_widths = None
+        self._rendered_justify = None
+
+        columns = columns or []
+        align = align or [None] * len(columns)
+        for (cells, column_align) in zip(columns, align):
+            self.insert_column(len(self.columns), cells, column_align)
+
+    @property
+    def nb_cols(self):
+        return len(self.columns)
+
+    @property
+    def nb_rows(self):
+        """
+        Number of rows, header included
+        """
+        if self.columns:
+            return len(self.columns[0])
+        return len(self._rendered)
+
+    def cell(self, col, row):
+        return self.columns[col][row]
+
+    def row(self, row):
+        return [column[row] for column in self.columns]
+
+    def _count(self, col, width, step):
+        """
+        Account a cell of a given width added (step=1) or removed (step=-1)
+        in a column and update its maximum width
+        """
+
+        counts = self._width_counts[col]
+        # Counted before the column changes
+        if counts is None:
+            counts = Counter(display_widths(self.columns[col]))
+            self._width_counts[col] = counts
+        counts[width] = counts.get(width, 0) + step
+
+        if step > 0:
+            if width > self.widths[col]:
+                self.widths[col] = width
+        elif not counts[width]:
+            del counts[width]
+            if width == self.widths[col]:
+                self.widths[col] = max(counts, default=0)
+
+    def set_cell(self, col, row, value):
+        """
+        Change the content of a cell
+        """
+
+        value = value.strip()
+        self._count(col, display_width(self.columns[col][row]), -1)
+        self._count(col, display_width(value), 1)
+        self.columns[col][row] = value
+        self._rendered[row] = None
+
+    def insert_column(self, index, cells=None, align=None):
+        """
+        Insert a column before index, blank if cells are not provided
+        """
+
+        if cells is None:
+            cells = [""] * self.nb_rows
+        else:
+            cells = list(map(str.strip, cells))
+
+        if not self.columns:
+            self._rendered = [None] * len(cells)
+
+        self.columns.insert(index, cells)
+        self.align.insert(index, align)
+        self.widths.insert(index, max(display_widths(cells), default=0))
+        self._width_counts.insert(index, None)
+        self._invalidate()
+
+    def delete_column(self, index):
+        """
+        Remove a column and return its cells
+        """
+
+        cells = self.columns.pop(index)
+        del self.align[index]
+        del self.widths[index]
+        del self._width_counts[index]
+        self._invalidate()
+        return cells
+
+    def move_column(self, src, dst):
+        """
+        Move the column src, to be inserted at dst once removed
+        """
+
+        align = self.align[src]
+        self.insert_column(dst, self.delete_column(src), align)
+
+    def insert_row(self, index, cells=None):
+        """
+        Insert a row before index, blank if cells are not provided
+        """
+
+        if cells is None:
+            cells = [""] * self.nb_cols
+
+        for (col, cell) in enumerate(cells):
+            cell = cell.strip()
+            self._count(col, display_width(cell), 1)
+            self.columns[col].insert(index, cell)
+        self._rendered.insert(index, None)
+
+    def delete_row(self, index):
+        """
+        Remove a row and return its cells
+        """
+
+        cells = []
+        for (col, column) in enumerate(self.columns):
+            self._count(col, display_width(column[index]), -1)
+            cells.append(column.pop(index))
+        del self._rendered[index]
+        return cells
+
+    def move_row(self, src, dst):
+        """
+        Move the row src, to be inserted at dst once removed. The widths
+        don't change, so only the two rows moved need to be rendered.
+        """
+
+        rendered = self._rendered[src]
+        for column in self.columns:
+            column.insert(dst, column.pop(src))
+        del self._rendered[src]
+        self._rendered.insert(dst, rendered)
+
+    def select_rows(self, rows):
+        """
+        Keep only the rows given, in the order given, to sort or filter
+        the table. The rows already rendered are kept, and the widths
+        computed again only if rows were removed.
+        """
+
+        nb_rows = self.nb_rows
+        self.columns = [[column[row] for row in rows]
+                        for column in self.columns]
+        self._rendered = [self._rendered[row] for row in rows]
+
+        if len(rows) == nb_rows:
+            return
+        for (col, column) in enumerate(self.columns):
+            self._width_counts[col] = None
+            self.widths[col] = max(display_widths(column), default=0)
+
+    def _invalidate(self):
+        self._rendered = [None] * self.nb_rows
+        self._rendered_widths = None
+
+    def _resize_column(self, col, old_widths, widths, justify):
+        """
+        Adjust the padding of a column justified on the left or the right
+        in the rows already rendered, the other columns keeping their width.
+        The rows with characters not one column wide are rendered again,
+        their cells not being where the widths put them.
+        """
+
+        # Start and end of the column in the rows, between "| " and " |"
+        start = 2 + sum(old_widths[:col]) + 3 * col
+        end = start + old_widths[col]
+        delta = widths[col] - old_widths[col]
+        # The padding is after the cells justified on the left, before the
+        # ones justified on the right
+        at = start if justify[col] == RIGHT else end
+        rendered = self._rendered
+
+        if delta > 0:
+            padding = " " * delta
+            for (row, line) in enumerate(rendered):
+                if line is None:
+                    continue
+                if line.isascii():
+                    rendered[row] = line[:at] + padding + line[at:]
+                else:
+                    rendered[row] = None
+        else:
+            # Remove the padding after the position, or before
+            (cut, keep) = (at, at - delta) if at == start else \
+                (at + delta, at)
+            for (row, line) in enumerate(rendered):
+                if line is None:
+                    continue
+                if line.isascii():
+                    rendered[row] = line[:cut] + line[keep:]
+                else:
+                    rendered[row] = None
+
+    def render_row(self, row, widths, justify=None):
+        """
+        Render a row, padding the cells to the column widths
+        """
+
+        return render_cells(self.row(row), widths, justify)
+
+    def render_separator(self, widths):
+        """
+        Render the line between the header and the rows, keeping
+        the alignment markers
+        """
+
+        return render_separator(widths, self.align)
+
+    def render(self, justify=LEFT):
+        """
+        Render the table into a list of lines, the header, the separator,
+        then the rows.
+
+        Only the rows edited since the last rendering are rendered again,
+        the padding of the others is adjusted if a single column width
+        changed, else they are all rendered again.
+
+        Arguments:
+            - justify: the justification of the columns whose alignment
+              is not specified, LEFT, CENTER or RIGHT
+        """
+
+        widths = [width or DEFAULT_WIDTH for width in self.widths]
+        justify = [column_align or justify for column_align in self.align]
+        old_widths = self._rendered_widths
+
+        if justify != self._rendered_justify:
+            self._invalidate()
+            self._rendered_justify = justify
+        elif widths != old_widths:
+            changed = []
+            if old_widths is not None and len(old_widths) == len(widths):
+                changed = [col for col in range(len(widths))
+                           if widths[col] != old_widths[col]]
+            # Both sides of the centered cells move
+            if len(changed) == 1 and justify[changed[0]] != CENTER:
+                self._resize_column(changed[0], old_widths, widths, justify)
+            else:
+                self._invalidate()
+        self._rendered_widths = widths
+
+        # The cells only justified on the left are padded faster
+        if all(column_justify == LEFT for column_justify in justify):
+            justify = None
+        rendered = self._rendered
+        for row in range(len(rendered)):
+            if rendered[row] is None:
+                rendered[row] = self.render_row(row, widths, justify)
+
+        if not rendered:
+            return []
+        return [rendered[0], self.render_separator(widths)] + rendered[1:]
+
+
+def render_cells(cells, widths, justify=None):
+    """
+    Render a table row, padding the cells to the column widths
+
+    Arguments:
+        - cells: the cells, stripped
+        - widths: the display width of each column
+        - justify: the justification of each column, LEFT, CENTER or
+          RIGHT, all on the left if not given
+    """
+
+    # Pad to the display width, in characters
+    if not "".join(cells).isascii():
+        widths = [width if cell.isascii() else
+                  width + len(cell) - display_width(cell)
+                  for (cell, width) in zip(cells, widths)]
+
+    if justify is None:
+        cells = [cell.ljust(width) for (cell, width) in zip(cells, widths)]
+    else:
+        cells = [justify_cell(cell, width, column_justify)
+                 for (cell, width, column_justify) in
+                 zip(cells, widths, justify)]
+    return "| " + " | ".join(cells) + " |"
+
+
+def justify_cell(cell, width, justify):
+    """
+    Pad a cell to a width, on the left, the right or both sides, the odd
+    space of a centered cell going on the right
+    """
+
+    if justify == RIGHT:
+        return cell.rjust(width)
+    if justify == CENTER:
+        return (" " * ((width - len(cell)) // 2) + cell).ljust(width)
+    return cell.ljust(width)
+
+
+def render_separator(widths, align):
+    """
+    Render the line between the header and the rows of a table, with the
+    alignment markers of each column (LEFT, CENTER, RIGHT or None)
+    """
+
+    dashes = []
+    for (width, column_align) in zip(widths, align):
+        if column_align == CENTER:
+            dashes.append(":" + "-" * width + ":")
+        elif column_align == RIGHT:
+            dashes.append("-" * (width + 1) + ":")
+        elif column_align == LEFT:
+            dashes.append(":" + "-" * (width + 1))
+        else:
+            dashes.append("-" * (width + 2))
+    return "|" + "|".join(dashes) + "|"
+
+
+def csv_cell(field):
+    """
+    Turn a CSV field into a table cell, on a single line and
+    with its pipes escaped
+    """
+
+    return " ".join(field.splitlines()).replace("|", "\\|").strip()
+
+
+def table_cell_to_csv(cell):
+    """
+    Turn a table cell back into a CSV field
+    """
+
+    return cell.replace("\\|", "|")
+
+
+def iter_csv_lines(open_source, delimiter=","):
+    """
+    Render CSV content into the lines of a markdown table. The source is
+    read twice: a first pass computes the column widths, a second one
+    renders the rows. Only one row is held in memory at a time, whatever
+    the size of the source.
+
+    Arguments:
+        - open_source: a function returning a new file object on the
+          source each time it's called
+        - delimiter: the CSV field delimiter
+
+    Returns:
+        - a generator of table lines, the header first
+    """
+
+    widths = []
+    with open_source() as source:
+        for row in csv.reader(source, delimiter=delimiter):
+            for (i, field) in enumerate(row):
+                width = display_width(csv_cell(field))
+                if i == len(widths):
+                    widths.append(width)
+                elif width > widths[i]:
+                    widths[i] = width
+
+    if not widths:
+        return
+
+    widths = [width or DEFAULT_WIDTH for width in widths]
+    nb_col = len(widths)
+    is_header = True
+
+    with open_source() as source:
+        for row in csv.reader(source, delimiter=delimiter):
+            # Skip the blank lines
+            if not row:
+                continue
+            cells = [csv_cell(field) for field in row]
+            yield render_cells(cells + [""] * (nb_col - len(cells)), widths)
+            if is_header:
+                yield render_separator(widths, [None] * nb_col)
+                is_header = False
+
+
+def write_csv(table, target, delimiter=","):
+    """
+    Write a table row by row into a CSV file object, the header first
+    """
+
+    writer = csv.writer(target, delimiter=delimiter, lineterminator="\n")
+    for row in range(table.nb_rows):
+        writer.writerow([table_cell_to_csv(cell) for cell in table.row(row)])
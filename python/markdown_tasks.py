@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Plugin:      https://github.com/dpretet/vim-markdow-tool
+Description: Index of the tasks of all the markdown files of a project
+Maintainer:  Damien Pretet https://github.com/dpretet
+
+The index stores the tasks of each file with the modification time and the
+size of the file, so a refresh only parses again the files which changed.
+It's saved on disk between two sessions. Tasks are also indexed by status,
+so the queries and the counts don't need to go through all the files.
+
+This module doesn't depend on Vim.
+"""
+
+import fnmatch
+import hashlib
+import multiprocessing
+import os
+import pickle
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import markdown_index
+
+MARKDOWN_EXTENSIONS = (".md", ".mkd", ".markdown")
+
+# Below this number of files to parse, a process pool costs more than it saves
+POOL_THRESHOLD = 64
+
+# Version of the file format, bump it when the index content changes
+INDEX_VERSION = 1
+
+# Progress of the subtasks appended to a parent task, like (3/7)
+PROGRESS_RE = re.compile(r"\s*\(\d+/\d+\)\s*$")
+
+
+def parse_tasks(lines):
+    """
+    Find the tasks of a document, out of the code blocks
+
+    Returns:
+        - a list of (row, status, text, indent) tuples, row indexed from 0
+    """
+
+    tasks = []
+    index = markdown_index.DocumentIndex(lines)
+
+    for block in index.blocks_of(markdown_index.TASKLIST):
+        for row in range(block.start, block.end):
+            match = markdown_index.TASK_RE.match(lines[row])
+            if match:
+                line = lines[row]
+                indent = len(line) - len(line.lstrip())
+                text = line[match.end():].strip()
+                tasks.append((row, match.group(1), text, indent))
+
+    return tasks
+
+
+class TaskNode(object):
+    """
+    A task of the tree
+
+    Attributes:
+        - row: line of the task, indexed from 0
+        - indent: indentation of the task, giving its depth
+        - status: the symbol between the brackets
+        - parent: the parent task, None for a top-level task
+        - children: the subtasks
+        - done: number of subtasks done, at any depth
+        - total: number of subtasks not cancelled, at any depth
+    """
+
+    __slots__ = ("row", "indent", "status", "parent", "children",
+                 "done", "total")
+
+    def __init__(self, row, indent, status, parent):
+        self.row = row
+        self.indent = indent
+        self.status = status
+        self.parent = parent
+        self.children = []
+        self.done = 0
+        self.total = 0
+
+
+class TaskTree(object):
+    """
+    Hierarchy of the tasks of a document, built from the indentation of the
+    task lists, with the progress of the subtasks of each task.
+
+    When a status changes, only the ancestors of the task are updated.
+
+    Attributes:
+        - nodes: the tasks, by row
+        - done_status, cancel_status: the symbols of the done and
+          cancelled tasks
+    """
+
+    __slots__ = ("nodes", "done_status", "cancel_status")
+
+    def __init__(self, lines, blocks, done_status, cancel_status):
+        self.nodes = {}
+        self.done_status = done_status
+        self.cancel_status = cancel_status
+
+        ordered = []
+        for block in blocks:
+            stack = []
+            for row in range(block.start, block.end):
+                line = lines[row]
+                match = markdown_index.TASK_RE.match(line)
+                if not match:
+                    continue
+                indent = len(line) - len(line.lstrip())
+                while stack and stack[-1].indent >= indent:
+                    stack.pop()
+                parent = stack[-1] if stack else None
+                node = TaskNode(row, indent, match.group(1), parent)
+                if parent is not None:
+                    parent.children.append(node)
+                self.nodes[row] = node
+                ordered.append(node)
+                stack.append(node)
+
+        # Children come after their parent, so going backward
+        # accounts each subtree before its parent
+        for node in reversed(ordered):
+            if node.parent is not None:
+                (done, total) = self.weight(node.status)
+                node.parent.done += node.done + done
+                node.parent.total += node.total + total
+
+    def weight(self, status):
+        """
+        Contribution of a task to the progress of its parents
+        """
+        return (int(status == self.done_status),
+                int(status != self.cancel_status))
+
+    def ancestors(self, row):
+        """
+        Return the rows of the parents of a task, closest first
+        """
+
+        rows = []
+        node = self.nodes[row].parent
+        while node is not None:
+            rows.append(node.row)
+            node = node.parent
+        return rows
+
+    def set_status(self, row, status, autocomplete=False):
+        """
+        Change the status of a task and update the progress of its parents.
+        With autocomplete, a parent whose subtasks are all done is marked
+        done as well.
+
+        Returns:
+            - the rows of the tasks whose status or progress changed
+        """
+
+        node = self.nodes[row]
+        (old_done, old_total) = self.weight(node.status)
+        node.status = status
+        (done, total) = self.weight(status)
+        (done, total) = (done - old_done, total - old_total)
+
+        changed = [row]
+        parent = node.parent
+        while parent is not None and (done or total):
+            parent.done += done
+            parent.total += total
+            changed.append(parent.row)
+            if (autocomplete and parent.total and
+                    parent.done == parent.total and
+                    parent.status != self.done_status):
+                (old_done, old_total) = self.weight(parent.status)
+                parent.status = self.done_status
+                done += 1 - old_done
+                total += 1 - old_total
+            parent = parent.parent
+
+        return changed
+
+    def complete_all(self):
+        """
+        Mark done all the tasks whose subtasks are all done
+
+        Returns:
+            - the rows of the tasks whose status or progress changed
+        """
+
+        changed = set()
+        for row in sorted(self.nodes, reverse=True):
+            node = self.nodes[row]
+            if (node.total and node.done == node.total and
+                    node.status != self.done_status):
+                changed.update(self.set_status(row, self.done_status))
+        return changed
+
+    def annotate(self, line, row):
+        """
+        Write the status of a task and the progress of its subtasks into its
+        line, like "- [-] deploy (3/7)"
+        """
+
+        node = self.nodes[row]
+        match = markdown_index.TASK_RE.match(line)
+        line = line[:match.start(1)] + node.status + line[match.end(1):]
+        line = PROGRESS_RE.sub("", line)
+        if node.children:
+            line += " (%d/%d)" % (node.done, node.total)
+        return line
+
+
+def parse_file(path):
+    """
+    Read a file and find its tasks
+
+    Returns:
+        - the path, its modification time and size, and its tasks
+    """
+
+    stat = os.stat(path)
+    with open(path, encoding="utf-8", errors="replace",
+              newline="") as source:
+        lines = markdown_index.split_lines(source.read())
+    return (path, stat.st_mtime_ns, stat.st_size, parse_tasks(lines))
+
+
+def try_parse_file(path):
+    """
+    Parse a file, returning None if it can't be read anymore
+    """
+
+    try:
+        return parse_file(path)
+    except OSError:
+        return None
+
+
+def iter_markdown_files(root):
+    """
+    Walk the project and yield the markdown files with their stats,
+    skipping hidden directories
+    """
+
+    for (dirpath, dirnames, filenames) in os.walk(root):
+        dirnames[:] = [name for name in dirnames if not name.startswith(".")]
+        for name in filenames:
+            if name.lower().endswith(MARKDOWN_EXTENSIONS):
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield (path, stat.st_mtime_ns, stat.st_size)
+
+
+class TaskIndex(object):
+    """
+    Tasks of the markdown files of a project
+
+    Attributes:
+        - root: the project directory
+        - files: path relative to root: (mtime, size, tasks)
+        - by_status: status: {path: [position of the tasks in the file]}
+        - counts: number of tasks of each status
+    """
+
+    __slots__ = ("root", "files", "by_status", "counts")
+
+    def __init__(self, root):
+        self.root = root
+        self.files = {}
+        self.by_status = {}
+        self.counts = {}
+
+    def _add(self, path, mtime, size, tasks):
+        self.files[path] = (mtime, size, tasks)
+        for (i, task) in enumerate(tasks):
+            status = task[1]
+            self.by_status.setdefault(status, {}).setdefault(path, [])
+            self.by_status[status][path].append(i)
+            self.counts[status] = self.counts.get(status, 0) + 1
+
+    def _remove(self, path):
+        (_, _, tasks) = self.files.pop(path)
+        for status in set(task[1] for task in tasks):
+            del self.by_status[status][path]
+        for task in tasks:
+            self.counts[task[1]] -= 1
+
+    def refresh(self, workers=0):
+        """
+        Parse again the files added or modified since the last refresh,
+        and forget the ones removed. When many files need to be parsed, as
+        for the first build, they are spread over a process pool.
+
+        Arguments:
+            - workers: size of the process pool, 0 for the number of CPUs
+
+        Returns:
+            - the number of files parsed
+        """
+
+        seen = set()
+        to_parse = []
+
+        for (path, mtime, size) in iter_markdown_files(self.root):
+            relpath = os.path.relpath(path, self.root)
+            seen.add(relpath)
+            known = self.files.get(relpath)
+            if known is None or known[0] != mtime or known[1] != size:
+                to_parse.append(path)
+
+        for relpath in [path for path in self.files if path not in seen]:
+            self._remove(relpath)
+
+        for (path, mtime, size, tasks) in parse_files(to_parse, workers):
+            relpath = os.path.relpath(path, self.root)
+            if relpath in self.files:
+                self._remove(relpath)
+            self._add(relpath, mtime, size, tasks)
+
+        return len(to_parse)
+
+    def query(self, statuses=None, pattern=None, text=None):
+        """
+        Find the tasks matching all the criteria given
+
+        Arguments:
+            - statuses: the status characters accepted
+            - pattern: a glob the file path must match, like ops/**
+            - text: a string the task description must contain
+
+        Returns:
+            - a list of (path, row, status, text) tuples, sorted by file
+        """
+
+        if statuses is None:
+            candidates = {path: range(len(entry[2]))
+                          for (path, entry) in self.files.items()}
+        else:
+            candidates = {}
+            for status in statuses:
+                for (path, positions) in self.by_status.get(status,
+                                                            {}).items():
+                    candidates.setdefault(path, []).extend(positions)
+
+        if text is not None:
+            text = text.lower()
+
+        results = []
+        for path in sorted(candidates):
+            if pattern and not fnmatch.fnmatch(path, pattern):
+                continue
+            tasks = self.files[path][2]
+            for i in sorted(candidates[path]):
+                (row, status, description, _) = tasks[i]
+                if text is None or text in description.lower():
+                    results.append((path, row, status, description))
+
+        return results
+
+
+def parse_files(paths, workers=0, parse=try_parse_file):
+    """
+    Parse a list of files, in a process pool if there are many of them.
+    The pool is only used when processes can be forked, a spawned process
+    would start the editor embedding Python instead of an interpreter.
+
+    Arguments:
+        - paths: the files to parse
+        - workers: size of the process pool, 0 for the number of CPUs
+        - parse: the function parsing a file, returning None if it can't
+          be read
+    """
+
+    if (len(paths) < POOL_THRESHOLD or
+            "fork" not in multiprocessing.get_all_start_methods()):
+        results = map(parse, paths)
+    else:
+        context = multiprocessing.get_context("fork")
+        nb_workers = workers or os.cpu_count() or 1
+        chunksize = max(len(paths) // (nb_workers * 4), 1)
+        with ProcessPoolExecutor(max_workers=nb_workers,
+                                 mp_context=context) as pool:
+            results = list(pool.map(parse, paths,
+                                    chunksize=chunksize))
+
+    return [result for result in results if result is not None]
+
+
+def index_path(cache_dir, root, name="tasks"):
+    """
+    Path of the file storing an index of a project
+    """
+
+    digest = hashlib.sha1(root.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(cache_dir, name + "-" + digest + ".pickle")
+
+
+def load_index(cache_dir, root):
+    """
+    Load the index of a project saved on disk, or a new empty index
+    """
+
+    try:
+        with open(index_path(cache_dir, root), "rb") as source:
+            (version, index) = pickle.load(source)
+        if version == INDEX_VERSION and index.root == root:
+            return index
+    except Exception:
+        # Only a cache: a corrupt file, or a pickle of other versions of
+        # the classes, raising about anything, is built again
+        pass
+    return TaskIndex(root)
+
+
+def save_index(cache_dir, index):
+    """
+    Save the index of a project on disk
+    """
+
+    path = index_path(cache_dir, index.root)
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(path + ".tmp", "wb") as target:
+        pickle.dump((INDEX_VERSION, index), target,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + ".tmp", path)
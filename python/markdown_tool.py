@@ -8,211 +8,1093 @@ Maintainer:  Damien Pretet https://github.com/dpretet
 """
 
 import vim
+import functools
+import io
+import json
+import os
 import re
+import threading
+import time
+
+# Only the modules below are imported with the plugin. The other markdown_*
+# modules are imported by the commands using them: their dependencies
+# (asyncio, urllib, multiprocessing, http.server...) would otherwise weigh
+# on the first load of the plugin
+import markdown_core
+import markdown_index
+import markdown_profile
+import markdown_table
+from markdown_core import (
+    add_column, add_row, csv_delimiter, grab_table, is_web_link, line_end,
+    line_to_task, line_with_status, locate_cursor, swap_column, swap_row,
+    table_clean_args, table_init, table_prettifier)
 
 DEBUG = 0
 INFO = 1
 WARNING = 2
 ERROR = 3
 
+# Number of lines appended at once into the buffer by streaming commands
+APPEND_BATCH = 1000
 
-def logger(msg, logtype=INFO):
+# Maximum number of separate writes of a transaction, above this number the
+# unchanged lines between the changes are written back too
+MAX_HUNKS = 8
+
+# The vim module, kept aside while profiling swaps it for a counting one
+VIM = vim
+NVIM = int(vim.eval("has('nvim')"))
+
+# Value of g:mardownToolDebug, read once per command, or on Neovim only
+# when a dict watcher reports it changed
+DEBUG_LEVEL = None
+
+PROFILER = markdown_profile.Profiler()
+
+# Arguments of the command running and snapshot of the editor state,
+# sent by the Vimscript side with the call, see dispatch()
+CONTEXT = {}
+
+
+def debug_level():
+    """
+    Return g:mardownToolDebug, read from Vim only if not cached
+    """
+
+    global DEBUG_LEVEL
+    if DEBUG_LEVEL is None:
+        DEBUG_LEVEL = int(option("g:mardownToolDebug"))
+    return DEBUG_LEVEL
+
+
+def refresh_debug_level():
+    """
+    Forget the cached g:mardownToolDebug, it will be read again if needed
+    """
+
+    global DEBUG_LEVEL
+    DEBUG_LEVEL = None
+    return
+
+
+def logger(msg, logtype=INFO, *args):
     """
-    Print function to debug the flow
+    Print function to debug the flow. The message is formatted with args,
+    like msg % args, only if the debug mode is enabled, so a disabled
+    logger costs nothing more than a call.
     TODO: Handle colors in vim messages
     """
-    debug = int(vim.eval("g:mardownToolDebug"))
 
-    if debug:
-        if logtype == DEBUG:
-            log = """echo "DEBUG: """
-        if logtype == INFO:
-            log = """echo "INFO: """
-        if logtype == WARNING:
-            log = """ echo "WARNING: """
-        if logtype == ERROR:
-            log = """echoerr "ERROR: """
+    if not debug_level():
+        return
+
+    if args:
+        msg = msg % args
+
+    if logtype == DEBUG:
+        log = "echo "
+        msg = "DEBUG: MarkdownTool: " + msg
+    if logtype == INFO:
+        log = "echo "
+        msg = "INFO: MarkdownTool: " + msg
+    if logtype == WARNING:
+        log = "echo "
+        msg = "WARNING: MarkdownTool: " + msg
+    if logtype == ERROR:
+        log = "echoerr "
+        msg = "ERROR: MarkdownTool: " + msg
+
+    # A JSON string is a valid Vim string, quotes escaped
+    vim.command(log + json.dumps(msg))
+
+    return
+
+
+def command(function):
+    """
+    Decorate the functions called by the Vim commands. When profiling, the
+    command is timed and its round-trips with Vim are counted, else it only
+    costs a flag check. On Vim, g:mardownToolDebug is read again by the
+    next log of the command.
+    """
+
+    name = function.__name__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not NVIM:
+            refresh_debug_level()
+        if not PROFILER.enabled:
+            return function(*args, **kwargs)
+        with PROFILER.span(name):
+            return function(*args, **kwargs)
+
+    return wrapper
+
+
+def dispatch(request):
+    """
+    Run a command called from Vimscript. The request, a JSON object, gives
+    the command, its arguments and a snapshot of the editor state taken
+    when calling it: the cursor, the current line, b:changedtick, the
+    current file and directory, the indentation and the plugin options.
+    The command reads them from CONTEXT instead of asking Vim, so it only
+    crosses over to Vim to edit the buffer.
+
+    Arguments:
+        - request: the JSON object, with the keys:
+            - command: the function to run
+            - params: the positional arguments of the function
+            - args, bang, first, last: the arguments of the Vim command
+            - cursor, line, changedtick, path, cwd, shiftwidth, expandtab,
+              tabstop: the editor state
+            - options: the g:mardownTool* options, without g:
+    """
+
+    CONTEXT.clear()
+    CONTEXT.update(json.loads(request))
+    try:
+        return globals()[CONTEXT["command"]](*CONTEXT["params"])
+    finally:
+        CONTEXT.clear()
+
+
+def snapshot(name, expr):
+    """
+    Return a value of the editor state from the snapshot sent with the
+    command, or evaluate it in Vim if the snapshot doesn't have it or
+    isn't valid anymore
+    """
+
+    if name in CONTEXT:
+        return CONTEXT[name]
+    return vim.eval(expr)
+
+
+def option(name):
+    """
+    Return the value of a plugin option, like g:mardownToolDebug
+    """
+
+    return options(name)[0]
+
+
+def options(*names):
+    """
+    Return the values of plugin options, from the snapshot sent with the
+    command, or read from Vim in a single eval
+    """
+
+    known = CONTEXT.get("options", {})
+    if all(name[2:] in known for name in names):
+        return [known[name[2:]] for name in names]
+    return vim.eval("[" + ", ".join(names) + "]")
+
+
+def current_cursor():
+    """
+    Return the cursor of the current window, (row from 1, byte column
+    from 0), from the snapshot sent with the command if not moved since
+    """
+
+    if "cursor" in CONTEXT:
+        return tuple(CONTEXT["cursor"])
+    return vim.current.window.cursor
+
+
+def current_line():
+    """
+    Return the line under the cursor, from the snapshot sent with the
+    command if not changed since
+    """
+
+    if "line" in CONTEXT:
+        return CONTEXT["line"]
+    return vim.current.line
+
+
+def current_changedtick():
+    """
+    Return b:changedtick, from the snapshot sent with the command if the
+    buffer didn't change since
+    """
+
+    return int(snapshot("changedtick", "b:changedtick"))
 
-        log += "MarkdownTool: "
-        log += msg + """\""""
-        vim.command(log)
 
+def forget_snapshot(*names):
+    """
+    Drop values of the snapshot once the command changed them, they will
+    be read from Vim if needed again
+    """
+
+    for name in names:
+        CONTEXT.pop(name, None)
     return
 
 
-def add_task(is_sub_task=False):
+class BufferTransaction(object):
+    """
+    Snapshot a range of the current buffer into a plain list of strings,
+    let the Python code edit it, then write it back with a single slice
+    assignment. A single write means a single undo entry and a single
+    redraw, whatever the number of lines modified.
+
+    Usage:
+
+        with BufferTransaction(start, end) as tx:
+            tx.lines[0] = "new content"
+            tx.cursor = (row, col)
+
+    Arguments:
+        - start: first line of the range, indexed from 0
+        - end: line after the last one of the range, None for end of buffer
+        - snapshot: the current content of the range if already known,
+          avoids to read it again from the buffer
+        - buffer: the buffer to edit, the current one by default
+
+    Only the lines which changed are written back, and the cursor
+    (1-indexed row, 0-indexed byte column, like vim.current.window.cursor)
+    is moved only if it has been set. api_calls counts the round-trips
+    done with Vim during the transaction, lines_written the number of
+    lines replaced in the buffer.
+    """
+
+    __slots__ = ("buffer", "start", "end", "lines", "cursor",
+                 "api_calls", "lines_written", "_snapshot")
+
+    def __init__(self, start=0, end=None, snapshot=None, buffer=None):
+        self.buffer = vim.current.buffer if buffer is None else buffer
+        self.start = start
+        self.end = end
+        self.lines = []
+        self.cursor = None
+        self.api_calls = 0
+        self.lines_written = 0
+        self._snapshot = snapshot
+
+    def __enter__(self):
+        if self._snapshot is None:
+            self._snapshot = self.buffer[self.start:self.end]
+            self.api_calls += 1
+        self.lines = list(self._snapshot)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Never write back a half-edited range
+        if exc_type is None:
+            self.commit()
+        return False
+
+    def commit(self):
+        """
+        Write back the lines if changed, then move the cursor if requested
+        """
+
+        old = self._snapshot
+        new = self.lines
+
+        if new != old:
+            # Skip the unchanged lines at both ends of the range
+            first = 0
+            limit = min(len(old), len(new))
+            while first < limit and old[first] == new[first]:
+                first += 1
+            suffix = 0
+            limit = limit - first
+            while suffix < limit and old[-1 - suffix] == new[-1 - suffix]:
+                suffix += 1
+
+            for (start, end, lines) in self._hunks(first, suffix):
+                self.buffer[self.start + start:self.start + end] = lines
+                self.api_calls += 1
+                self.lines_written += len(lines)
+            self._snapshot = list(new)
+            forget_snapshot("changedtick", "line")
+
+        if self.cursor is not None:
+            vim.current.window.cursor = self.cursor
+            self.api_calls += 1
+            if CONTEXT:
+                CONTEXT["cursor"] = list(self.cursor)
+            forget_snapshot("line")
+            self.cursor = None
+
+        logger("Buffer transaction: %d API calls", DEBUG, self.api_calls)
+        return
+
+    def _hunks(self, first, suffix):
+        """
+        Split the changed span in the runs of lines which differ, when lines
+        have been replaced one for one and the runs are few. Several small
+        writes are then cheaper than rewriting the unchanged lines between
+        them. Otherwise the whole span is a single hunk.
+
+        Returns:
+            - a list of (start, end, lines) to write, relative to the range
+        """
+
+        old = self._snapshot
+        new = self.lines
+        end = len(new) - suffix
+
+        if len(old) != len(new):
+            return [(first, len(old) - suffix, new[first:end])]
+
+        hunks = []
+        i = first
+        while i < end:
+            if old[i] == new[i]:
+                i += 1
+                continue
+            j = i + 1
+            while j < end and old[j] != new[j]:
+                j += 1
+            hunks.append((i, j, new[i:j]))
+            if len(hunks) > MAX_HUNKS:
+                return [(first, end, new[first:end])]
+            i = j
+
+        return hunks
+
+
+# Document index of each buffer, by buffer number
+INDEXES = {}
+
+# Task index of each project, by root directory
+TASK_INDEXES = {}
+
+# Link graph of each project, by root directory
+LINK_GRAPHS = {}
+
+# Task tree of the buffers annotated with MdTaskProgress, by buffer number,
+# with the b:changedtick they describe
+TASK_TREES = {}
+
+# Links check running in background, polled by a Vim timer
+LINK_CHECK = {"thread": None, "timer": None, "result": None,
+              "bufnr": 0, "lines": []}
+
+# Table aligned by the live alignment in each buffer, by buffer number:
+# (first line, aligned lines, Table)
+LIVE_TABLES = {}
+
+# HTML renderer of each buffer, keeping the blocks it rendered, by
+# buffer number
+HTML_RENDERERS = {}
+
+# Fold levels of each buffer, by buffer number
+FOLDS = {}
+
+# Word and task counts of each buffer, by buffer number
+STATS = {}
+
+# Preview server running, and the buffer it shows
+PREVIEW = {"server": None, "bufnr": 0, "url": ""}
+
+# Background worker process, and the timer polling its responses
+WORKER = {"client": None, "timer": None}
+
+# Version of each buffer the worker holds: (b:changedtick, lines)
+WORKER_DOCS = {}
+
+# Estimated duration of the commands the worker can run, in ms per unit
+# of work: a line of the buffer, a KiB of CSV, a project refresh
+LATENCY = {}
+
+# Neovim only: record the lines changed in the buffers, so the index
+# re-parses only these ranges instead of diffing the whole buffer
+NVIM_ATTACH = (
+    "markdown_tool_changes = markdown_tool_changes or {} "
+    "function markdown_tool_pop(b) "
+    "local c = markdown_tool_changes[b] "
+    "if c ~= nil then markdown_tool_changes[b] = {} end "
+    "return c end "
+    "local buf = vim.api.nvim_get_current_buf() "
+    "markdown_tool_changes[buf] = {} "
+    "vim.api.nvim_buf_attach(buf, false, {"
+    "on_lines = function(_, b, _, first, last, new_last) "
+    "local c = markdown_tool_changes[b] "
+    "if c == nil then return true end "
+    "table.insert(c, {first, last, new_last}) end, "
+    "on_reload = function(_, b) markdown_tool_changes[b] = {{-1, -1, -1}} end, "
+    "on_detach = function(_, b) markdown_tool_changes[b] = nil end})"
+)
+
+
+def document_index():
+    """
+    Return the block index of the current buffer, up to date with
+    b:changedtick. The index is built once per buffer, then only the
+    changed lines are parsed again.
+    """
+
+    buf = vim.current.buffer
+    changedtick = current_changedtick()
+    index = INDEXES.get(buf.number)
+
+    if index is None:
+        logger("Build document index", DEBUG)
+        index = markdown_index.DocumentIndex(buf[:], changedtick)
+        INDEXES[buf.number] = index
+        if NVIM:
+            vim.command("lua " + NVIM_ATTACH)
+        return index
+
+    if index.changedtick == changedtick:
+        return index
+
+    changes = None
+    if NVIM:
+        changes = vim.eval("luaeval('markdown_tool_pop(_A)', %d)" %
+                           buf.number)
+
+    if changes and not any(int(c[0]) < 0 for c in changes):
+        # Merge the changes into a single range: [first, old_end) in the
+        # indexed version, [first, new_end) in the current buffer
+        (first, old_end, new_end) = (int(c) for c in changes[0])
+        for change in changes[1:]:
+            (start, last, new_last) = (int(c) for c in change)
+            if last > new_end:
+                old_end += last - new_end
+                new_end = last
+            first = min(first, start)
+            new_end += new_last - last
+        parsed = index.update(first, old_end, buf[first:new_end])
+    else:
+        parsed = index.resync(buf[:])
+
+    index.changedtick = changedtick
+    logger("Document index updated, %d lines parsed", DEBUG, parsed)
+    return index
+
+
+def drop_index(bufnr):
+    """
+    Forget the index of a buffer being wiped out
+    """
+
+    INDEXES.pop(bufnr, None)
+    TASK_TREES.pop(bufnr, None)
+    LIVE_TABLES.pop(bufnr, None)
+    HTML_RENDERERS.pop(bufnr, None)
+    FOLDS.pop(bufnr, None)
+    STATS.pop(bufnr, None)
+    if PREVIEW["server"] is not None and PREVIEW["bufnr"] == bufnr:
+        stop_preview()
+    if WORKER_DOCS.pop(bufnr, None) is not None and \
+            WORKER["client"].is_alive():
+        WORKER["client"].request("close", {"bufnr": bufnr}, lambda _: None)
+    return
+
+
+def use_worker(name, size):
+    """
+    Tell if a command should run in the background worker: always when
+    g:mardownToolWorkerThreshold is 0, never when it's negative, else when
+    the estimated duration of the command exceeds it, in ms.
+
+    Arguments:
+        - name: the command
+        - size: the units of work of the command, see LATENCY
+    """
+
+    threshold = int(option("g:mardownToolWorkerThreshold"))
+    if threshold < 0:
+        return False
+    return LATENCY.get(name, 0) * size >= threshold
+
+
+def record_latency(name, elapsed, size):
+    """
+    Update the estimated duration of a command, a moving average of its
+    durations per unit of work
+
+    Arguments:
+        - elapsed: the duration of the command, in ms
+    """
+
+    rate = elapsed / max(size, 1)
+    LATENCY[name] = 0.7 * LATENCY[name] + 0.3 * rate if name in LATENCY \
+        else rate
+    return
+
+
+def worker_document(index, bufnr):
+    """
+    Return the change bringing the version of a buffer held by the worker
+    to the one indexed: the lines which differ, or all of them if the
+    worker holds none
+    """
+
+    params = {"bufnr": bufnr, "changedtick": index.changedtick}
+    sent = WORKER_DOCS.get(bufnr)
+    WORKER_DOCS[bufnr] = (index.changedtick, list(index.lines))
+
+    if sent is None:
+        params["lines"] = index.lines
+        return params
+
+    (base, old) = sent
+    new = index.lines
+    first = 0
+    limit = min(len(old), len(new))
+    while first < limit and old[first] == new[first]:
+        first += 1
+    suffix = 0
+    limit = limit - first
+    while suffix < limit and old[-1 - suffix] == new[-1 - suffix]:
+        suffix += 1
+
+    params.update(base=base, first=first, last=len(old) - suffix,
+                  lines=new[first:len(new) - suffix])
+    return params
+
+
+def run_in_worker(name, latency, method, params, apply, size, index=None,
+                  changedtick=None, partial=None):
+    """
+    Send a command to the background worker, started if not running. Its
+    result is applied once received, by the timer polling the worker.
+
+    Arguments:
+        - name: the command, to report
+        - latency: the key of the command in LATENCY, shared with the runs
+          of the command out of the worker, to estimate its duration
+        - method, params: the request to the worker
+        - apply: function(result, buffer, index) applying the result, with
+          the buffer to edit and its document index if up to date
+        - size: the units of work of the command
+        - index: the document index of the current buffer, when the worker
+          needs the document
+        - changedtick: b:changedtick when the command edits the buffer: its
+          result is discarded if the buffer changed meanwhile. Defaults to
+          the one of index.
+        - partial: function(params, buffer, index) applying the
+          notifications sent before the result, the buffer changes it
+          makes not discarding the next ones
+    """
+
+    import markdown_worker
+
+    client = WORKER["client"]
+    if client is None:
+        client = markdown_worker.WorkerClient(
+            option("g:mardownToolWorkerPython"))
+        WORKER["client"] = client
+    if not client.is_alive():
+        # A new process holds no document
+        WORKER_DOCS.clear()
+        client.start()
+
+    bufnr = vim.current.buffer.number
+    if index is not None:
+        params.update(worker_document(index, bufnr))
+        if changedtick is None:
+            changedtick = index.changedtick
+    # The version of the buffer expected, moved by the partial results
+    expected = {"changedtick": changedtick, "stale": False, "resent": False}
+
+    def target():
+        """
+        Return the buffer to edit and its index if up to date, or None if
+        the buffer changed meanwhile
+        """
+
+        changedtick = expected["changedtick"]
+        if changedtick is None:
+            return (None, None)
+        current = vim.eval("getbufvar(%d, 'changedtick')" % bufnr)
+        if expected["stale"] or not current or int(current) != changedtick:
+            if not expected["stale"]:
+                logger("%s: the buffer changed, result discarded", WARNING,
+                       name)
+            expected["stale"] = True
+            return None
+        buf_index = INDEXES.get(bufnr)
+        if buf_index is not None and buf_index.changedtick != changedtick:
+            buf_index = None
+        return (vim.buffers[bufnr], buf_index)
+
+    def callback(response):
+        if "error" in response:
+            WORKER_DOCS.pop(bufnr, None)
+            # The worker lost the version the change sent is based on:
+            # send the whole document, once, if it didn't change since
+            if (response["error"]["code"] == markdown_worker.OUT_OF_SYNC and
+                    not expected["resent"] and index is not None and
+                    index.changedtick == changedtick):
+                expected["resent"] = True
+                for key in ("base", "first", "last"):
+                    params.pop(key, None)
+                params.update(worker_document(index, bufnr))
+                send()
+                logger("%s: document sent again to the worker", DEBUG, name)
+                return
+            logger("%s failed: %s", ERROR, name,
+                   response["error"]["message"])
+            return
+        record_latency(latency, response["elapsed"], size)
+
+        edited = target()
+        if edited is not None:
+            apply(response["result"], *edited)
+
+    def on_notification(notification):
+        edited = target()
+        if edited is None:
+            return
+        partial(notification["params"], *edited)
+        if expected["changedtick"] is not None:
+            expected["changedtick"] = int(vim.eval(
+                "getbufvar(%d, 'changedtick')" % bufnr))
+
+    def send():
+        client.request(method, params, callback,
+                       on_notification if partial is not None else None)
+
+    send()
+    if WORKER["timer"] is None:
+        WORKER["timer"] = vim.eval(
+            "timer_start(20, 'markdown_tool#WorkerPoll', {'repeat': -1})")
+
+    logger("%s running in the background", DEBUG, name)
+    return
+
+
+def worker_poll():
+    """
+    Called by a timer while requests are pending, apply the results
+    received from the worker
+    """
+
+    if WORKER["client"].poll() == 0 and WORKER["timer"] is not None:
+        vim.command("call timer_stop(" + str(WORKER["timer"]) + ")")
+        WORKER["timer"] = None
+    return
+
+
+def sub_task_indent(first):
+    """
+    Build the whitespace `normal! >>` would insert to indent a subtask
+    whose parent starts at column first, following &shiftwidth,
+    &expandtab and &tabstop
+    """
+
+    if "shiftwidth" in CONTEXT:
+        (shiftwidth, expandtab, tabstop) = (
+            CONTEXT["shiftwidth"], CONTEXT["expandtab"], CONTEXT["tabstop"])
+    else:
+        (shiftwidth, expandtab, tabstop) = vim.eval(
+            "[shiftwidth(), &expandtab, &tabstop]")
+    shiftwidth = int(shiftwidth)
+    indent_level = int(first / shiftwidth + 1)
+    width = shiftwidth * indent_level
+
+    if int(expandtab):
+        return " " * width
+
+    tabstop = int(tabstop)
+    return "\t" * (width // tabstop) + " " * (width % tabstop)
+
+
+@command
+def add_task(is_sub_task=False, indent=""):
     """
     Add a task into current line. If line is empty, replace it
     with the task, else append it below the curor.
     """
 
     # Grab task description from vim script front end
-    task_desc = vim.eval("task_desc")
+    args = CONTEXT["args"]
+    task_desc = args[0] if args else ""
 
-    (row, _) = vim.current.window.cursor
+    (row, _) = current_cursor()
     # To index from 0 to N-1, not from 1, avoid row-1 everywhere in the script
     row = row - 1
 
-    is_empty = False
-    if vim.current.buffer[row] == "":
-        logger("Line is empty", DEBUG)
-        is_empty = True
-        del vim.current.buffer[row]
+    with BufferTransaction(row, row+1) as tx:
 
-    new_task = """- [ ]"""
-    if task_desc:
-        new_task += " " + task_desc
+        new_task = indent + """- [ ]"""
+        if task_desc:
+            new_task += " " + task_desc
 
-    # Append to the next line if line is not empty (so can be replaced)
-    # or if is a subtask
-    if not is_empty or is_sub_task:
-        vim.current.buffer.append(new_task, row+1)
-    else:
-        vim.current.buffer.append(new_task, row)
+        # Replace the line if empty, else append the task to the next line.
+        # A subtask always goes below its parent.
+        if tx.lines[0] == "" and not is_sub_task:
+            logger("Line is empty", DEBUG)
+            tx.lines[0] = new_task
+            task_row = row + 1
+        else:
+            tx.lines.append(new_task)
+            task_row = row + 2
+
+        # Move cursor on the task line and go to the end
+        tx.cursor = (task_row, line_end(new_task))
 
-    # Move cursor on the task line and go to the end
-    if is_empty:
-        vim.current.window.cursor = (row+1, 0)
-    else:
-        vim.current.window.cursor = (row+2, 0)
-    vim.command("normal! $")
     return
 
 
+@command
 def add_sub_task():
     """
     Append a subtask below an existing task
     """
 
     # Grab line
-    (row, _) = vim.current.window.cursor
-    line = vim.current.buffer[row-1]
+    line = current_line()
     # Check first the line is a task
-    # TODO: Change for a regex
-    if """[""" not in line or """]""" not in line:
-        logger("No brackets found. Assume it's not a task", WARNING)
+    if not markdown_index.TASK_RE.match(line):
+        logger("Line is not a task", WARNING)
         return
 
-    # Get line start to compute later the indentation to apply
+    # Get line start to compute the indentation to apply
     first = line.find("-")
-    # Add it as a sub task
-    add_task(is_sub_task=True)
 
-    # Compute indent to apply
-    shiftwidth = int(vim.eval("&shiftwidth"))
-    indent_level = int(first / shiftwidth + 1)
-    # And indent n times
-    i = 0
-    while i < indent_level:
-        vim.command("normal! >>")
-        i = i + 1
-    vim.command("normal! $")
+    # Add it as a sub task, indented in the same write
+    add_task(is_sub_task=True, indent=sub_task_indent(first))
     return
 
 
+@command
 def change_to_task():
     """
-    Change a line to a task. The line must not start with - [ ],
-    it can only be a list item or a simple line.
+    Change a line, or all the lines of a range, to a task. The line must
+    not start with - [ ], it can only be a list item or a simple line.
+    In a range, blank lines are left untouched.
     """
 
-    (row, _) = vim.current.window.cursor
-    # To index from 0 to N-1, not from 1, avoid row-1 everywhere in the script
-    row = row - 1
-    line = vim.current.buffer[row]
+    # Grab the range from vim script front end
+    (first, last) = (int(CONTEXT["first"]), int(CONTEXT["last"]))
+
+    with BufferTransaction(first-1, last) as tx:
+
+        if len(tx.lines) > 1:
+            for (i, line) in enumerate(tx.lines):
+                if line.strip():
+                    tx.lines[i] = line_to_task(line) or line
+            return
+
+        task = line_to_task(tx.lines[0])
+        if task is None:
+            logger("Line is already a task", DEBUG)
+            return
+
+        tx.lines[0] = task
+
+        # Move cursor on the task line and go to the end
+        tx.cursor = (first, line_end(task))
 
-    # Check first the line is not already a task
-    # TODO: Change for a regex
-    if """[""" in line and """]""" in line:
-        logger("Found brackets. Assume it's a task", DEBUG)
+    return
+
+
+@command
+def change_status():
+    """
+    When into a task line, or on a range of lines, change the symbol
+    between the brackets signifying the task status. The lines which
+    are not tasks are left untouched.
+
+    If the progress of the tasks has been annotated with MdTaskProgress,
+    the parents of the tasks changed are updated as well.
+    """
+
+    # Grab task status and range from vim script front-end
+    task_status = CONTEXT["args"][0]
+    (first, last) = (int(CONTEXT["first"]), int(CONTEXT["last"]))
+    autocomplete = option("g:mardownToolTaskAutoComplete")
+
+    tree = cached_task_tree()
+    start = first - 1
+    if tree is not None:
+        for row in range(first-1, last):
+            if row in tree.nodes:
+                start = min([start] + tree.ancestors(row))
+
+    with BufferTransaction(start, last) as tx:
+
+        not_task = 0
+        changed = set()
+        for row in range(first-1, last):
+            line = tx.lines[row-start]
+            task = line_with_status(line, task_status)
+            if task is None:
+                not_task += 1
+                continue
+            tx.lines[row-start] = task
+            # A task-looking line in a code block is not in the tree
+            if tree is not None and row in tree.nodes:
+                changed.update(tree.set_status(row, task_status,
+                                               int(autocomplete)))
+
+        # Update the progress of the parents
+        for row in changed:
+            tx.lines[row-start] = tree.annotate(tx.lines[row-start], row)
+
+        if not_task:
+            logger("%d line(s) are not tasks", WARNING, not_task)
+
+        # Move cursor into the bracket
+        if first == last and not not_task:
+            line = tx.lines[first-1-start]
+            bracket = markdown_index.TASK_RE.match(line).start(1)
+            tx.cursor = (first, len(line[:bracket].encode("utf-8")))
+
+    if tree is not None:
+        TASK_TREES[vim.current.buffer.number] = (
+            tree, current_changedtick())
+
+    return
+
+
+def cached_task_tree():
+    """
+    Return the task tree of the current buffer if its progress is annotated
+    and the tree is still up to date, else None
+    """
+
+    cached = TASK_TREES.get(vim.current.buffer.number)
+    if cached is None:
+        return None
+
+    (tree, changedtick) = cached
+    if changedtick == current_changedtick():
+        return tree
+
+    import markdown_tasks
+
+    # The buffer changed since, the tree will be built again
+    index = document_index()
+    (done, cancel) = options("g:mardownToolDoneStatus",
+                             "g:mardownToolCancelStatus")
+    tree = markdown_tasks.TaskTree(
+        index.lines, index.blocks_of(markdown_index.TASKLIST), done, cancel)
+    TASK_TREES[vim.current.buffer.number] = (tree, index.changedtick)
+    return tree
+
+
+@command
+def task_progress():
+    """
+    Append to each task with subtasks the progress of its subtasks, like
+    (3/7). With g:mardownToolTaskAutoComplete, the tasks whose subtasks
+    are all done are marked done as well.
+
+    The tree of tasks is then kept with the buffer, and the progress is
+    updated each time a status changes.
+    """
+
+    import markdown_tasks
+
+    index = document_index()
+    (done, cancel, autocomplete) = options(
+        "g:mardownToolDoneStatus", "g:mardownToolCancelStatus",
+        "g:mardownToolTaskAutoComplete")
+    tree = markdown_tasks.TaskTree(
+        index.lines, index.blocks_of(markdown_index.TASKLIST), done, cancel)
+
+    if not tree.nodes:
+        logger("No task found", INFO)
         return
 
-    # If line is empty, turn it into a task by replacing it simply
-    if vim.current.buffer[row] == "":
-        del vim.current.buffer[row]
-        vim.current.buffer.append("- [ ]", row)
+    if int(autocomplete):
+        tree.complete_all()
+
+    start = min(tree.nodes)
+    end = max(tree.nodes) + 1
+    with BufferTransaction(start, end, index.lines[start:end]) as tx:
+        for (row, node) in tree.nodes.items():
+            if node.children or markdown_tasks.PROGRESS_RE.search(
+                    tx.lines[row-start]):
+                tx.lines[row-start] = tree.annotate(tx.lines[row-start], row)
+
+    TASK_TREES[vim.current.buffer.number] = (
+        tree, current_changedtick())
+    return
+
+
+def task_statuses():
+    """
+    Return the status characters configured, by status name
+    """
+
+    statuses = options(
+        "g:mardownToolNewStatus", "g:mardownToolOngoingStatus",
+        "g:mardownToolDoneStatus", "g:mardownToolCancelStatus")
+    return dict(zip(markdown_core.STATUSES, statuses))
+
+
+def task_project(root=""):
+    """
+    Return the parameters of the task index of a project: its directory,
+    the current one by default, the cache directory and the number of
+    processes parsing the files
+    """
+
+    cwd = snapshot("cwd", "getcwd()")
+    (cache_dir, workers) = options("g:mardownToolCacheDir",
+                                   "g:mardownToolTaskWorkers")
+    return {"root": os.path.abspath(os.path.expanduser(root or cwd)),
+            "cache_dir": os.path.expanduser(cache_dir),
+            "workers": int(workers)}
+
+
+def task_index(root=""):
+    """
+    Return the task index of a project, the current directory by default,
+    refreshed with the files modified since its last use. The index is
+    saved under g:mardownToolCacheDir between two sessions.
+    """
+
+    import markdown_tasks
+
+    started = time.perf_counter()
+    project = task_project(root)
+    (root, cache_dir) = (project["root"], project["cache_dir"])
+
+    index = TASK_INDEXES.get(root)
+    if index is None:
+        index = markdown_tasks.load_index(cache_dir, root)
+        TASK_INDEXES[root] = index
+
+    parsed = index.refresh(project["workers"])
+    if parsed:
+        markdown_tasks.save_index(cache_dir, index)
+
+    logger("Task index: %d files parsed", DEBUG, parsed)
+    record_latency("tasks", (time.perf_counter() - started) * 1000, 1)
+    return index
+
+
+@command
+def task_summary():
+    """
+    Refresh the task index of the project and print the number
+    of tasks of each status. Slow projects are scanned by the
+    background worker.
+    """
+
+    root = CONTEXT["args"]
+    root = root[0] if root else ""
+
+    if use_worker("tasks", 1):
+        run_in_worker("MdTaskSummary", "tasks", "tasks", task_project(root),
+                      lambda result, buf, index: echo_task_summary(
+                          result["counts"], result["files"]), 1)
         return
 
-    # Search the first non null character
-    first = len(re.match(r"\s*", line, re.UNICODE).group(0))
+    index = task_index(root)
+    echo_task_summary(index.counts, len(index.files))
+    return
 
-    # If is an item, just place the brackets
-    if line[first] == "-":
-        text = len(re.match(r"\s*", line[first+1], re.UNICODE).group(0))
-        new_task = " " * first + """- [ ]""" + line[text:]
-    # Else insert hypen and brackets
-    else:
-        new_task = " " * first + """- [ ] """ + line[first:]
 
-    del vim.current.buffer[row]
-    vim.current.buffer.append(new_task, row)
+def echo_task_summary(counts, nb_files):
+    """
+    Print the number of tasks of each status
+    """
+
+    names = []
+    for (name, status) in task_statuses().items():
+        names.append(str(counts.get(status, 0)) + " " + name)
+    total = sum(counts.values())
 
-    # Move cursor on the task line and go to the end
-    vim.current.window.cursor = (row+1, 0)
-    vim.command("normal! $")
+    vim.command("echomsg 'MarkdownTool: " + ", ".join(names) + " (" +
+                str(total) + " tasks in " + str(nb_files) + " files)'")
     return
 
 
-def change_status():
+@command
+def task_query():
     """
-    When into a task line, seach for brackets and change symbol
-    inbetween signifyiing the task status
+    Search the tasks of the project and list them in the quickfix list,
+    or in the location list with a bang. The query is a list of criteria:
+
+        - status:ongoing, or status:new,ongoing for several statuses
+        - path:ops/**, a glob on the path relative to the project
+        - root:~/docs, the project directory, the current one by default
+        - any other word must be found in the task description
     """
 
-    # Grab task status from vim script front-end
-    task_status = vim.eval("task_status")
-    (row, _) = vim.current.window.cursor
-    # To index from 0 to N, not from 1, avoid row-1 everywhere in the script
-    row = row - 1
-    line = vim.current.buffer[row]
+    (args, bang) = (CONTEXT["args"], CONTEXT["bang"])
+    (statuses, pattern, root, text) = markdown_core.parse_task_query(
+        args, task_statuses())
 
-    # Check first the line is a task, else return
-    # TODO: Change for a regex
-    if """[""" not in line or """]""" not in line:
-        logger("No brackets found. Assume it's not a task", WARNING)
+    if use_worker("tasks", 1):
+        params = task_project(root)
+        params["query"] = (statuses, pattern, text)
+        run_in_worker("MdTaskQuery", "tasks", "tasks", params,
+                      lambda result, buf, index: list_tasks(
+                          result["root"], result["results"], int(bang)), 1)
         return
 
-    first = line.find("[")
-    second = line.find("]")
-    new_task = line[0:first+1] + task_status + line[second:]
-    del vim.current.buffer[row]
-    vim.current.buffer.append(new_task, row)
+    index = task_index(root)
+    list_tasks(index.root, index.query(statuses, pattern, text), int(bang))
+    return
+
 
-    # Move cursor into the bracket
-    vim.current.window.cursor = (row+1, first+1)
+def list_tasks(root, results, to_loclist):
+    """
+    Fill the quickfix list, or the location list, with the tasks found
+    """
+
+    entries = [{"filename": os.path.join(root, path), "lnum": row + 1,
+                "text": "[" + status + "] " + description}
+               for (path, row, status, description) in results]
+    fill_list(entries, to_loclist)
+
+    vim.command("echomsg 'MarkdownTool: " + str(len(entries)) +
+                " task(s) found'")
     return
 
 
+def fill_list(entries, to_loclist):
+    """
+    Replace the quickfix list, or the location list, and open its window
+    """
+
+    if to_loclist:
+        vim.command("call setloclist(0, " + json.dumps(entries) + ", 'r')")
+        vim.command("lwindow")
+    else:
+        vim.command("call setqflist(" + json.dumps(entries) + ", 'r')")
+        vim.command("cwindow")
+    return
+
+
+@command
 def add_code():
     """
     Add a code block
     """
 
     # Grab language from vim script front-end
-    lang = vim.eval("lang")
+    args = CONTEXT["args"]
+    lang = args[0] if args else ""
 
-    (row, _) = vim.current.window.cursor
+    (row, _) = current_cursor()
     # To index from 0 to N, not from 1, avoid row-1 everywhere in the script
     row = row - 1
 
-    if vim.current.buffer[row] == "":
-        del vim.current.buffer[row]
-
     start_block = """```"""
     if lang:
         start_block += lang
     end_block = "```"
 
-    # Append code block into the buffer
-    vim.current.buffer.append(end_block, row)
-    vim.current.buffer.append("", row)
-    vim.current.buffer.append(start_block, row)
+    with BufferTransaction(row, row+1) as tx:
+
+        # Code block replaces the line if empty, else is inserted above it
+        if tx.lines[0] == "":
+            tx.lines = [start_block, "", end_block]
+        else:
+            tx.lines[0:0] = [start_block, "", end_block]
+
+        # Move cursor inside the code block
+        tx.cursor = (row+2, 0)
 
-    # Move cursor inside the code block
-    vim.current.window.cursor = (row+2, 0)
     return
 
 
+@command
 def add_table():
     """
     Insert a markdown table at the current line.
@@ -229,484 +1111,750 @@ def add_table():
     By default tables are left justified
     """
 
-    (row, _) = vim.current.window.cursor
+    (row, _) = current_cursor()
     # To index from 0 to N-1, not from 1, avoid row-1 everywhere in the script
     row = row - 1
     # Grab table dimension from vim script front end
-    desc = vim.eval("description")
+    desc = list(CONTEXT["args"])
     # Put in shape the descriptions
     desc = table_clean_args(desc)
-    # Construct a first table, with only strings in to a list
-    table_list = table_init(desc)
+    # Construct a first table, with only blank cells or headers
+    table = table_init(desc)
     # Format the table to drop
-    table_text = table_prettifier(table_list)
-    # Append the new shiny table in the buffer, at current line if empty
-    # else on the line below
-    vim.current.buffer.append(table_text, row+1)
+    table_text = table_prettifier(table)
+    # Append the new shiny table in the buffer, on the line below
+    with BufferTransaction(row+1, row+1) as tx:
+        tx.lines = table_text
 
     return
 
 
-def table_clean_args(desc):
+@command
+def table_transformation(action=""):
     """
-    Handle the arguments passed to AddTable() and prepare
-    them for processing
+    Apply an action on the table under the cursor, then prettify it and
+    write it back in a single buffer update
     """
 
-    # Handle as well comma and space to separate descriptions
-    if '' in desc[0]:
-        desc = ''
-    elif "," in desc[0]:
-        desc = desc[0].split(",")
-    else:
-        desc = desc[0].split(" ")
+    (row, col) = current_cursor()
+    # Localize start and end of table
+    location = locate_table(row)
+    if location is None:
+        return
+    (table_start, table_end) = location
 
-    logger("Nb Args: " + str(len(desc)), DEBUG)
+    with BufferTransaction(table_start, table_end+1) as tx:
 
-    # Clean up the arguments
-    for i in range(len(desc)):
-        desc[i] = desc[i].strip()
+        # Extract the content in a Table, stored column by column
+        # (col0[row0, row1, ...], col1[...], ...)
+        content = grab_table(tx.lines)
 
-    return desc
+        line = tx.lines[row-1-table_start]
+        # Columns are byte indexes in Vim
+        char_col = len(line.encode("utf-8")[:col].decode("utf-8", "ignore"))
+        cursor_row, cursor_col = locate_cursor(row, char_col, table_start,
+                                               table_end, line)
+        logger("cursor row: %d, col: %d", DEBUG, cursor_row, cursor_col)
 
+        if action == "add_column":
+            add_column(content, cursor_col)
 
-def table_init(dims):
-    """
-    From description passed by the user, draft a first table
-    based on list of string. Headers remain blank if was not specified,
-    and add separation with rows
-    """
+        if action == "add_row":
+            add_row(content, cursor_row)
 
-    # Default dimension of the table, will be adjusted by the user arguments
-    column_num = 3
-    row_num = 5
-    row_width = 5
-    # The output list to return
-    table_list = []
-    # A flag indicating we need to create a table only from dimension,
-    # no header description has been passed
-    init_with_dim = 0
+        if action == "swap_column":
+            swap_column(content, cursor_col)
 
-    # Check first if the arguments could be the table dimensions
-    # In this case, handle a dimension passed by the user, like 2 x 3
-    # He didn't provide the columns' header
-    if len(dims) == 2 and\
-       dims[0].isnumeric() and dims[1].isnumeric():
+        if action == "swap_row":
+            swap_row(content, cursor_row)
 
-        init_with_dim = 1
-        dim = dims[0] + "x" + dims[1]
-        msg = "Two numeric args passed. Will create a " + dim + " table"
-        logger(msg, DEBUG)
+        # Put in shape the table, replacing the last version in the buffer
+        tx.lines = table_prettifier(content)
 
-        column_num = int(dims[0])
-        row_num = int(dims[1])
-    # Here assume the arguments are the headers description if arguments passed
-    elif len(dims) > 0:
-        column_num = len(dims)
-    # Else if nothing passed, assume it's init with default dimensions
-    else:
-        logger("Init the table with default dimension (3x5)", DEBUG)
-        init_with_dim = 1
-
-    # Init the table content
-    for i in range(column_num):
-        rows = []
-        # +1 for the headers
-        for j in range(row_num+1):
-            # Append the header description
-            if j == 0 and not init_with_dim:
-                rows.append(dims[i])
-            # Or simply a blank one
-            else:
-                rows.append(" " * row_width)
-
-        table_list.append(rows)
-
-    return table_list
-
-
-def table_prettifier(table, justify="left"):
-    """
-    Prettify the table to drop into the document. Adapt the
-    column width
-    """
-
-    default_width = 5
-    column_num = len(table)
-    table_text = []
-
-    column_width = []
-
-    # First parse the table to store the maximum width of
-    # each column stored
-    for i in range(column_num):
-        column_width.append(0)
-        for j in range(len(table[0])):
-            if len(table[i][j]) > column_width[i] and\
-                    not table[i][j].isspace():
-                column_width[i] = len(table[i][j].strip())
-        # If table is only plenty of space, init width
-        if column_width[i] == 0:
-            column_width[i] = default_width
-
-    # Then append the data and align them to have clean
-    # aligment to ease visualization
-    for i in range(len(table[0])):
-        row_md = "| "
-        for j in range(column_num):
-            # Case it's only whitespace, adapt with correct width
-            if table[j][i].isspace():
-                row_md += " " * column_width[j] + " | "
-            # Else append the content and add missing whitespace
-            # for alignment
-            else:
-                missing_ws = column_width[j] - len(table[j][i])
-                row_md += table[j][i] + (" " * missing_ws) + " | "
-        # Add our brand new row
-        table_text.append(row_md.strip())
-        # If was parsing the columns' header, add a new line
-        # (|----|----|) to separate the data
-        if i == 0:
-            row_md = "|"
-            for j in range(column_num):
-                # +2 because we add space before and after '|'
-                # in headers and data
-                row_md += "-" * (column_width[j] + 2) + "|"
-            table_text.append(row_md)
-
-    return table_text
+    return
 
 
-def table_transformation(action=""):
+def table_with_column(column):
+    """
+    Grab the table under the cursor and find one of its columns, from its
+    number or its header, or the cursor one if not given
 
-    (row, col) = vim.current.window.cursor
-    # Localize start and end of table
-    (table_start, table_end) = locate_table(row)
-    # Extract the content in a list of list of strings
-    # (col0[row0, row1, ...], col1[...], ...)
-    content = grab_table(table_start, table_end)
+    Returns:
+        - the first and last lines of the table, its lines, the Table and
+          the column index, or None if not found
+    """
 
-    cursor_row, cursor_col = locate_cursor(row, col, table_start, table_end)
+    (row, col) = current_cursor()
+    location = locate_table(row)
+    if location is None:
+        return None
+    (table_start, table_end) = location
 
-    if action == "add_column":
-        add_column(content, cursor_col)
+    lines = document_index().lines[table_start:table_end+1]
+    table = grab_table(lines)
 
-    if action == "add_row":
-        add_row(content, cursor_row)
+    if column:
+        col_index = markdown_core.table_column(table, column)
+        if col_index is None:
+            logger("No column %s in the table", ERROR, column)
+            return None
+    else:
+        line = lines[row - 1 - table_start]
+        # Columns are byte indexes in Vim
+        char_col = len(line.encode("utf-8")[:col].decode("utf-8", "ignore"))
+        (col_index, _) = markdown_core.cursor_cell(line, char_col)
+        col_index = min(col_index, table.nb_cols - 1)
 
-    if action == "swap_column":
-        swap_column(content, cursor_col)
+    return (table_start, table_end, lines, table, col_index)
 
-    if action == "swap_row":
-        swap_row(content, cursor_row)
 
-    # Put in shape the table before insert it back
-    prettified = table_prettifier(content)
+@command
+def sort_table():
+    """
+    Sort the rows of the table under the cursor on a column, the cursor
+    one by default, the header staying first. The options are n for
+    numbers, h for sizes like 2.5M, else guessed from the column content,
+    and r or a bang for the descending order. The table is written back
+    in a single buffer update.
+    """
+
+    (args, bang) = (CONTEXT["args"], CONTEXT["bang"])
+    (column, kind, reverse) = markdown_core.parse_sort_args(args)
+
+    found = table_with_column(column)
+    if found is None:
+        return
+    (table_start, table_end, lines, table, col) = found
 
-    # Delete last table version in the buffer
-    i = table_end
-    while i >= table_start:
-        del vim.current.buffer[i]
-        i = i - 1
+    kind = markdown_core.sort_table(table, col, kind,
+                                    reverse or bool(int(bang)))
+    with BufferTransaction(table_start, table_end+1, lines) as tx:
+        tx.lines = table_prettifier(table)
 
-    # Then append the new table
-    vim.current.buffer.append(prettified, table_start)
+    logger("Sorted %d rows on column %d (%s)", INFO, table.nb_rows - 1,
+           col + 1, {"n": "numeric", "h": "sizes"}.get(kind, "text"))
     return
 
 
-def locate_table(row):
+@command
+def filter_table():
+    """
+    Keep the rows of the table under the cursor whose cell in a column
+    matches a Python regular expression, or with a bang the rows which
+    don't match it. The arguments are the column, a number or a header,
+    then the expression.
     """
-    From the cursor position, parse the buffer to find the table to operate on.
-    Assume the user positioned the cursor into the table, so the function can
-    search for |
 
-    Returns:
-        1 if failed to find a table, else return a list of list of string.
-
-    """
-
-    # First check we are into a table. If not give up
-    start = row - 1
-    table_start = 0
-    table_end = 0
-
-    logger("Search table start", DEBUG)
-    i = start
-    while i >= 0:
-        # Search for the table limits
-        line = vim.current.buffer[i]
-        first = len(re.match(r"\s*", line, re.UNICODE).group(0))
-        # Case we are out of the table
-        if not line or line[first] != "|":
-            logger("Line doesn't start with |", DEBUG)
-            table_start = i+1
-            break
-        # Case we reached out the file's start
-        if i == 0:
-            table_start = 0
-            break
-        i -= 1
-
-    logger("Search table end", DEBUG)
-    i = start
-    while i < len(vim.current.buffer):
-        # Search for the table limits
-        line = vim.current.buffer[i]
-        first = len(re.match(r"\s*", line, re.UNICODE).group(0))
-        # Case we are out of the table
-        if not line or line[first] != "|":
-            logger("Line doesn't start with |", DEBUG)
-            table_end = i-1
-            break
-        # Case we reached out the file's end
-        if i == len(vim.current.buffer)-1:
-            logger("Reached end of buffer", DEBUG)
-            table_end = i
-            break
-        i += 1
-
-    logger("Line start: " + str(table_start), DEBUG)
-    logger("Line end: " + str(table_end), DEBUG)
-
-    return (table_start, table_end)
-
-
-def locate_cursor(row, col, table_start, table_end):
-    """
-    Determine from the table location and the cursor position
-    the cursor index inside table (in terms of column/row)
-    """
-
-    # Relative position of the cursor into the table
-    row_num = 0
-    col_num = 0
-
-    # Compute the height, and relative position into the table
-    nb_row = table_end - table_start - 1
-    cursor_row = table_end - row + 1
-
-    # If cursor is located in header or separator, consider it's
-    # ouside the table
-    if (row == table_start or row == table_start + 1):
-        row_num = -1
-    # Else compute position, relative to the header separator, indexed from 1
-    else:
-        row_num = nb_row - cursor_row
+    (args, bang) = (CONTEXT["args"], CONTEXT["bang"])
+    (column, _, pattern) = args.strip().partition(" ")
+    pattern = pattern.strip()
+    if not pattern:
+        logger("Specify the column and the pattern to filter the rows",
+               ERROR)
+        return
 
-    # To locate the cursor in the table's row, we count the number
-    # of separator. Any line can be used
-    line = vim.current.buffer[row-1]
-    nb_col = line.count("|")
-    col_num = nb_col - line[col+1:].count("|")
+    found = table_with_column(column)
+    if found is None:
+        return
+    (table_start, table_end, lines, table, col) = found
 
-    if col_num == nb_col:
-        col_num = nb_col - 1
+    try:
+        removed = markdown_core.filter_table(table, col, pattern,
+                                             bool(int(bang)))
+    except re.error as error:
+        logger("Invalid pattern %s: %s", ERROR, pattern, error)
+        return
 
-    logger(f"cursor row: {row_num}", DEBUG)
-    logger(f"cursor col: {col_num}", DEBUG)
+    with BufferTransaction(table_start, table_end+1, lines) as tx:
+        tx.lines = table_prettifier(table)
 
-    return row_num, col_num
+    logger("Filtered out %d rows", INFO, removed)
+    return
 
 
-def grab_table(table_start, table_end):
+@command
+def live_align():
+    """
+    Align the table under the cursor while it's edited, called when the
+    typing pauses and when leaving insert mode if g:mardownToolLiveAlign
+    is set. Only the rows changed since the last alignment are parsed,
+    only the lines which differ are written back, and the cursor stays at
+    the same place in its cell.
     """
-    From the lines identified in the buffer,
-    extract the the content.
 
-    Arguments:
-        - start: first line of the table
-        - end: last line of the table
+    (row, col) = current_cursor()
+    index = document_index()
+    block = index.table_at(row - 1)
+    if block is None:
+        return
 
-    Returns:
-        a list of list of strings:
-            - First dimension: the columns
-            - Second dimensions: the column's content
+    bufnr = vim.current.buffer.number
+    lines = index.lines[block.start:block.end]
+    (table, aligned) = (None, None)
+    cached = LIVE_TABLES.get(bufnr)
+    if cached is not None and cached[0] == block.start:
+        (_, aligned, table) = cached
+
+    result = markdown_core.realign_table(lines, table, aligned)
+    if result is None:
+        LIVE_TABLES.pop(bufnr, None)
+        return
+    (table, new_lines) = result
+    LIVE_TABLES[bufnr] = (block.start, new_lines, table)
+
+    line = lines[row - 1 - block.start]
+    new_line = new_lines[row - 1 - block.start]
+
+    with BufferTransaction(block.start, block.end, lines) as tx:
+        tx.lines = new_lines
+        if new_line != line:
+            # Columns are byte indexes in Vim
+            char_col = len(line.encode("utf-8")[:col].decode("utf-8",
+                                                              "ignore"))
+            (cell, offset) = markdown_core.cursor_cell(line, char_col)
+            new_col = markdown_core.cell_cursor(new_line, cell, offset)
+            tx.cursor = (row, len(new_line[:new_col].encode("utf-8")))
+
+    logger("Live alignment: %d lines rewritten", DEBUG, tx.lines_written)
+    return
+
+
+@command
+def prettify_all():
+    """
+    Prettify all the tables of the document. Tables are found with the
+    document index, so lines starting with | into code blocks are skipped,
+    and the document is written back in a single buffer update. Long
+    documents are prettified by the background worker.
     """
 
-    extracted = []
-    content = []
+    index = document_index()
+    if use_worker("prettify_all", len(index.lines)):
+        run_in_worker("MdPrettifyAll", "prettify_all", "prettify", {},
+                      apply_prettify_all, len(index.lines), index)
+        return
 
-    for line in vim.current.buffer[table_start:table_end+1]:
-        line = line.split("|")
-        clean = [i for i in line if i != '']
-        is_sep = False
-        for col in clean:
-            if "---" in col:
-                is_sep = True
-        if not is_sep:
-            extracted.append(clean)
+    started = time.perf_counter()
+    tables = markdown_core.table_blocks(index)
 
-    # Now organize the array to describe content
-    # column by column
-    for i in range(len(extracted[0])):
-        col = []
-        for j in range(len(extracted)):
-            ext = extracted[j][i].strip()
-            col.append(ext)
-        content.append(col)
+    if not tables:
+        logger("No table found", INFO)
+        return
 
-    return content
+    offset = tables[0].start
 
+    with BufferTransaction(offset, tables[-1].end,
+                           index.lines[offset:tables[-1].end]) as tx:
+        (nb_rows, skipped) = markdown_core.prettify_tables(tx.lines, tables,
+                                                           offset)
 
-def add_column(content, col_index, col_info=[]):
-    """
-    From the position of the cursor add a column
+    for row in skipped:
+        logger("Malformed table at line %d, skipped", WARNING, row + 1)
 
-    Arguments:
-        - the table content, a list of list of strings:
-             - First dimension: the columns
-             - Second dimensions: the column's content
-        - cursor index for col
-        - optional information to append from command line
-    Returns:
-        - the table content, a list of list of strings:
-             - First dimension: the columns
-             - Second dimensions: the column's content
+    logger("MdPrettifyAll: %d tables, %d rows, %d lines rewritten", INFO,
+           len(tables), nb_rows, tx.lines_written)
+    record_latency("prettify_all", (time.perf_counter() - started) * 1000,
+                   len(index.lines))
+    return
+
+
+def apply_prettify_all(result, buf, index):
     """
+    Write back the tables prettified by the worker
+    """
+
+    if result is None:
+        logger("No table found", INFO)
+        return
 
-    col_size = len(content[0])
-    content.insert(col_index, [""] * col_size)
-    return content
+    (start, end) = (result["start"], result["end"])
+    snapshot = index.lines[start:end] if index is not None else None
+    with BufferTransaction(start, end, snapshot, buf) as tx:
+        tx.lines = result["lines"]
 
+    for row in result["skipped"]:
+        logger("Malformed table at line %d, skipped", WARNING, row + 1)
 
-def add_row(content, row_index, row_info=[]):
+    logger("MdPrettifyAll: %d tables, %d rows, %d lines rewritten", INFO,
+           result["tables"], result["rows"], tx.lines_written)
+    return
+
+
+def locate_table(row):
     """
-    From the position of the cursor, add a row
+    From the cursor position, find the table to operate on in the document
+    index. Assume the user positioned the cursor into the table. Lines
+    starting with | inside a code block are not considered as a table.
 
-    Arguments:
-        - the table content, a list of list of strings:
-             - First dimension: the columns
-             - Second dimensions: the column's content
-        - cursor index for col
-        - cursor index for row
     Returns:
-        - the table content, a list of list of strings:
-             - First dimension: the columns
-             - Second dimensions: the column's content
+        None if failed to find a table, else the first and the last
+        lines of the table.
+
     """
 
-    for i in range(len(content)):
-        content[i].insert(row_index+1, "")
+    table = document_index().table_at(row - 1)
 
-    return content
+    if table is None:
+        logger("Cursor is not into a table", WARNING)
+        return None
 
+    logger("Line start: %d", DEBUG, table.start)
+    logger("Line end: %d", DEBUG, table.end - 1)
 
-def swap_column(content, col_index, col_info=[]):
-    """
-    Swap column position into the table
+    return (table.start, table.end - 1)
 
-    Arguments:
-        - the table content, a list of list of strings:
-             - First dimension: the columns
-             - Second dimensions: the column's content
-        - cursor index for col
-        - optional information to append from command line
-    Returns:
-        - the table content, a list of list of strings:
-             - First dimension: the columns
-             - Second dimensions: the column's content
+
+@command
+def import_csv():
+    """
+    Import a CSV or TSV file as a table below the cursor line. Without file,
+    the + register is imported as TSV, like a selection copied from a
+    spreadsheet.
+
+    The file is streamed twice, once to compute the columns width, once to
+    render the rows, and the lines are appended in batches, so the memory
+    used doesn't depend on the file size. Large files are rendered by the
+    background worker, which sends the lines in the same batches.
     """
 
-    nb_col = len(content)
+    # Grab the file and the optional delimiter from vim script front end
+    args = CONTEXT["args"]
+    path = os.path.expanduser(args[0]) if args else ""
+    delimiter = csv_delimiter(args[1] if len(args) > 1 else "", path)
 
-    if col_index == nb_col:
-        to_swap = col_index - 2
+    if path:
+        if not os.path.isfile(path):
+            logger("Can't find %s", ERROR, path)
+            return
+        size = os.path.getsize(path) / 1024
+
+        def open_source():
+            return open(path, newline="", encoding="utf-8-sig")
     else:
-        to_swap = col_index
+        content = vim.eval("@+")
+        size = len(content) / 1024
+
+        def open_source():
+            return io.StringIO(content, newline="")
 
-    col_saved = content[to_swap]
-    del content[to_swap]
-    content.insert(col_index - 1, col_saved)
+    (row, _) = current_cursor()
 
-    return content
+    # The register, already read, is not copied to the worker
+    if path and use_worker("import_csv", size):
+        appended = [0]
 
+        def append(params, buf, index):
+            # The batches are a single undo step, the first one excepted
+            if appended[0] and buf.number == vim.current.buffer.number:
+                vim.command("silent! undojoin")
+            appended[0] += append_lines(params["lines"], row + appended[0],
+                                        buf)
 
-def swap_row(content, row_index, row_info=[]):
+        def apply(result, buf, index):
+            logger("Imported %d lines", INFO, result["lines"])
+
+        run_in_worker("MdImportCsv", "import_csv", "import_csv",
+                      {"path": path, "delimiter": delimiter,
+                       "batch": APPEND_BATCH},
+                      apply, size, changedtick=current_changedtick(),
+                      partial=append)
+        return
+
+    started = time.perf_counter()
+    lines = markdown_table.iter_csv_lines(open_source, delimiter)
+    nb_lines = append_lines(lines, row)
+
+    logger("Imported %d lines", INFO, nb_lines)
+    record_latency("import_csv", (time.perf_counter() - started) * 1000,
+                   size)
+    return
+
+
+def append_lines(lines, row, buf=None):
     """
-    Swap row position into the table
+    Append the lines produced by a generator below the line row (indexed
+    from 1), APPEND_BATCH lines at a time, into the current buffer or
+    the one given.
 
-    Arguments:
-        - the table content, a list of list of strings:
-             - First dimension: the columns
-             - Second dimensions: the column's content
-        - cursor index for col
-        - cursor index for row
     Returns:
-        - the table content, a list of list of strings:
-             - First dimension: the columns
-             - Second dimensions: the column's content
+        - the number of lines appended
     """
 
-    for i in range(len(content)):
-        row_saved = content[i][row_index]
-        del content[i][row_index]
-        if row_index == len(content[i]):
-            content[i].insert(row_index-1, row_saved)
-        else:
-            content[i].insert(row_index+1, row_saved)
+    if buf is None:
+        buf = vim.current.buffer
+    batch = []
+    nb_lines = 0
 
-    return content
+    for line in lines:
+        batch.append(line)
+        if len(batch) == APPEND_BATCH:
+            buf.append(batch, row + nb_lines)
+            nb_lines += len(batch)
+            batch = []
 
+    if batch:
+        buf.append(batch, row + nb_lines)
+        nb_lines += len(batch)
 
+    return nb_lines
+
+
+@command
+def export_csv():
+    """
+    Export the table under the cursor to a CSV file, or a TSV file if
+    its name ends with .tsv. The rows are written one by one to the file.
+    """
+
+    # Grab the file and the optional delimiter from vim script front end
+    args = CONTEXT["args"]
+    if not args:
+        logger("Specify the file to export the table into", ERROR)
+        return
+    path = os.path.expanduser(args[0])
+    delimiter = csv_delimiter(args[1] if len(args) > 1 else "", path)
+
+    (row, _) = current_cursor()
+    location = locate_table(row)
+    if location is None:
+        return
+    (table_start, table_end) = location
+
+    table = grab_table(document_index().lines[table_start:table_end+1])
+    with open(path, "w", newline="", encoding="utf-8") as target:
+        markdown_table.write_csv(table, target, delimiter)
+
+    logger("Exported %d rows to %s", INFO, table.nb_rows, path)
+    return
+
+
+@command
 def add_link():
     """
     Create a link. Can be empty, defined from command line
     or pasted from clipboard
     """
     # Link provided from command
-    link = vim.eval("link")
-    # Link possibly present in clipboard
-    clip = vim.eval("clip")
+    link = CONTEXT["args"]
 
     to_add = ""
     # Use input if present, whatever it is
-    if link[0]:
+    if link and link[0]:
         to_add = link[0]
-    # Else use clipboard but check it's a link, not dirty text
-    elif clip and is_web_link(clip):
-        to_add = clip
+    else:
+        # Else use clipboard but check it's a link, not dirty text. It's
+        # read only now: on X11 and Wayland, it runs a clipboard tool.
+        clip = vim.eval("@+")
+        if clip and is_web_link(clip):
+            to_add = clip
     # Append the link at current cursor position
-    (row, col) = vim.current.window.cursor
-    vim.current.buffer[row-1] += f"[]({to_add})"
-    # Restore cursor and move to bracket
-    vim.current.window.cursor = (row, col)
-    vim.command("normal! F[")
+    (row, col) = current_cursor()
+    with BufferTransaction(row-1, row) as tx:
+        line = tx.lines[0]
+        tx.lines[0] = line + f"[]({to_add})"
+        # Move to the bracket of the new link
+        tx.cursor = (row, len(line.encode("utf-8")))
 
     return
 
 
-def is_web_link(link):
+@command
+def insert_toc():
+    """
+    Insert a table of content below the cursor line, between marker
+    comments so it can be updated later. If the document already has
+    one, update it instead.
     """
-    Check a link is a web address by checking existence of
-    http, https, www into the string
 
-    Arguments:
-        - link: a string describing the link
+    index = document_index()
 
-    Returns:
-        - 1 if is a web address otherwise 0
+    if index.toc_range() is not None:
+        logger("Table of content already present, update it", INFO)
+        update_toc()
+        return
+
+    headings = list(index.blocks_of(markdown_index.HEADING))
+    toc = markdown_index.toc_lines(headings)
+
+    (row, _) = current_cursor()
+    with BufferTransaction(row, row, []) as tx:
+        tx.lines = [markdown_index.TOC_START] + toc + [markdown_index.TOC_END]
+
+    return
+
+
+@command
+def update_toc():
+    """
+    Refresh the table of content between its markers. Only the lines
+    which changed are written back into the buffer. The table of content
+    of long documents is computed by the background worker.
+    """
+
+    index = document_index()
+    if use_worker("update_toc", len(index.lines)):
+        run_in_worker("MdTocUpdate", "update_toc", "toc", {}, apply_toc,
+                      len(index.lines), index)
+        return
+
+    started = time.perf_counter()
+    update = markdown_core.toc_update(index)
+
+    if update is None:
+        logger("No table of content found, insert one with MdToc", WARNING)
+        return
+
+    (start, end, toc) = update
+    with BufferTransaction(start, end, index.lines[start:end]) as tx:
+        tx.lines = toc
+
+    logger("Table of content: %d lines updated", DEBUG, tx.lines_written)
+    record_latency("update_toc", (time.perf_counter() - started) * 1000,
+                   len(index.lines))
+    return
+
+
+def apply_toc(result, buf, index):
+    """
+    Write back the table of content computed by the worker
+    """
+
+    if result is None:
+        logger("No table of content found, insert one with MdToc", WARNING)
+        return
+
+    (start, end) = (result["start"], result["end"])
+    snapshot = index.lines[start:end] if index is not None else None
+    with BufferTransaction(start, end, snapshot, buf) as tx:
+        tx.lines = result["lines"]
+
+    logger("Table of content: %d lines updated", DEBUG, tx.lines_written)
+    return
+
+
+@command
+def check_links():
+    """
+    Check the links, images and anchors of the document. Web links are
+    checked in a background thread, and the problems are reported into
+    the quickfix list once the check is done.
+    """
+
+    import markdown_links
+
+    if LINK_CHECK["thread"] is not None:
+        logger("A links check is already running", WARNING)
+        return
+
+    index = document_index()
+    links = markdown_links.extract_links(index)
+    anchors = index.anchors()
+
+    base_dir = os.path.dirname(snapshot("path", "expand('%:p')"))
+    (cache_dir, ttl, workers, per_host, timeout) = options(
+        "g:mardownToolCacheDir", "g:mardownToolLinkTTL",
+        "g:mardownToolLinkWorkers", "g:mardownToolLinkPerHost",
+        "g:mardownToolLinkTimeout")
+    cache = markdown_links.LinkCache(
+        os.path.join(os.path.expanduser(cache_dir), "links.json"), int(ttl))
+
+    def run():
+        try:
+            LINK_CHECK["result"] = markdown_links.check_links(
+                links, anchors, base_dir, cache, int(workers),
+                int(per_host), int(timeout))
+        except Exception as error:
+            LINK_CHECK["result"] = error
+
+    LINK_CHECK["bufnr"] = vim.current.buffer.number
+    LINK_CHECK["lines"] = index.lines
+    LINK_CHECK["thread"] = threading.Thread(target=run, daemon=True)
+    LINK_CHECK["thread"].start()
+    LINK_CHECK["timer"] = vim.eval(
+        "timer_start(100, 'markdown_tool#CheckLinksPoll', {'repeat': -1})")
+
+    logger("Checking %d links", INFO, len(links))
+    return
+
+
+def check_links_poll():
     """
+    Called by a timer until the links check is done, then fill
+    the quickfix list with the problems found
+    """
+
+    thread = LINK_CHECK["thread"]
+    if thread is None or thread.is_alive():
+        return
+
+    vim.command("call timer_stop(" + str(LINK_CHECK["timer"]) + ")")
+    result = LINK_CHECK["result"]
+    lines = LINK_CHECK["lines"]
+    LINK_CHECK.update(thread=None, timer=None, result=None, lines=[])
+
+    if isinstance(result, Exception):
+        logger("Links check failed: %s", ERROR, result)
+        return
+
+    entries = []
+    for problem in result:
+        # Quickfix columns are byte indexes, from 1
+        col = len(lines[problem.row][:problem.col].encode("utf-8")) + 1
+        entries.append({"bufnr": LINK_CHECK["bufnr"], "lnum": problem.row + 1,
+                        "col": col, "text": problem.message,
+                        "type": problem.severity})
+
+    vim.command("call setqflist(" + json.dumps(entries) + ", 'r')")
+    vim.command("cwindow")
+    vim.command("echomsg 'MarkdownTool: " + str(len(entries)) +
+                " broken link(s) found'")
+    return
+
+
+def link_graph(root=""):
+    """
+    Return the link graph of a project, the current directory by default,
+    refreshed with the files modified since its last use. The graph is
+    saved under g:mardownToolCacheDir between two sessions.
+    """
+
+    import markdown_graph
+
+    project = task_project(root)
+    (root, cache_dir) = (project["root"], project["cache_dir"])
+
+    graph = LINK_GRAPHS.get(root)
+    if graph is None:
+        graph = markdown_graph.load_graph(cache_dir, root)
+        LINK_GRAPHS[root] = graph
 
-    is_web = 0
-    keywords = ["http", "www.", "://", "git@git"]
+    parsed = graph.refresh(project["workers"])
+    if parsed:
+        markdown_graph.save_graph(cache_dir, graph)
 
-    for keyword in keywords:
-        if keyword in link:
-            is_web = 1
+    logger("Link graph: %d files parsed", DEBUG, parsed)
+    return graph
 
-    return is_web
+
+@command
+def backlinks():
+    """
+    List the links of the notes of the project to the current one in the
+    quickfix list, or in the location list with a bang
+    """
+
+    (path, bang) = (snapshot("path", "expand('%:p')"), CONTEXT["bang"])
+    if not path:
+        logger("The buffer has no file", ERROR)
+        return
+
+    graph = link_graph()
+    note = os.path.relpath(path, graph.root)
+    entries = [{"filename": os.path.join(graph.root, source),
+                "lnum": row + 1, "text": "link to " + note}
+               for (source, row) in graph.backlinks(note)]
+    fill_list(entries, int(bang))
+
+    vim.command("echomsg 'MarkdownTool: " + str(len(entries)) +
+                " backlink(s) found'")
+    return
 
 
+@command
+def rename_note():
+    """
+    Rename the note of the current buffer, to a path relative to its
+    directory, keeping its extension if none is given. The links of the
+    project to the note are rewritten in one pass, in the buffers loaded,
+    left modified, and in the other files, written back. Its own relative
+    links are rewritten too when it moves to another directory.
+    """
+
+    import markdown_cli
+    import markdown_graph
+
+    (args, path) = (CONTEXT["args"], snapshot("path", "expand('%:p')"))
+    loaded = vim.eval("map(getbufinfo({'bufloaded': 1}), "
+                      "'[v:val.bufnr, v:val.name]')")
+    if not path:
+        logger("The buffer has no file to rename", ERROR)
+        return
+
+    new_path = os.path.join(os.path.dirname(path),
+                            os.path.expanduser(args[0]))
+    if not os.path.splitext(new_path)[1]:
+        new_path += os.path.splitext(path)[1]
+    new_path = os.path.normpath(new_path)
+    if os.path.exists(new_path):
+        logger("%s already exists", ERROR, new_path)
+        return
+
+    graph = link_graph()
+    old = os.path.relpath(path, graph.root)
+    new = os.path.relpath(new_path, graph.root)
+    buffers = {os.path.abspath(name): int(bufnr)
+               for (bufnr, name) in loaded if name}
+
+    with BufferTransaction() as tx:
+        (tx.lines, nb_links) = markdown_graph.rename_links(tx.lines, old,
+                                                           old, new)
+    os.makedirs(os.path.dirname(new_path), exist_ok=True)
+    vim.command("execute 'silent keepalt saveas' fnameescape(" +
+                json.dumps(new_path) + ")")
+    forget_snapshot("path", "changedtick")
+    if os.path.exists(path):
+        os.remove(path)
+
+    if old in graph.files:
+        graph.remove(old)
+    stat = os.stat(new_path)
+    graph.add(new, stat.st_mtime_ns, stat.st_size,
+              markdown_graph.note_links(tx.lines))
+
+    nb_files = int(nb_links > 0)
+    for source in sorted(graph.incoming.get(old, ())):
+        source_path = os.path.join(graph.root, source)
+        bufnr = buffers.get(source_path)
+        if bufnr is not None:
+            with BufferTransaction(buffer=vim.buffers[bufnr]) as tx:
+                (tx.lines, count) = markdown_graph.rename_links(
+                    tx.lines, source, old, new)
+        else:
+            try:
+                (lines, newline, final_newline) = markdown_cli.read_lines(
+                    source_path)
+            except (OSError, UnicodeDecodeError) as error:
+                logger("Can't rewrite %s: %s", WARNING, source_path, error)
+                continue
+            (lines, count) = markdown_graph.rename_links(lines, source,
+                                                         old, new)
+            if count:
+                markdown_cli.write_lines(source_path, lines, newline,
+                                         final_newline)
+                stat = os.stat(source_path)
+                graph.add(source, stat.st_mtime_ns, stat.st_size,
+                          markdown_graph.note_links(lines))
+        nb_links += count
+        nb_files += count > 0
+
+    markdown_graph.save_graph(task_project()["cache_dir"], graph)
+    vim.command("echomsg " + json.dumps(
+        "MarkdownTool: renamed to %s, %d link(s) rewritten in %d file(s)" %
+        (new, nb_links, nb_files)))
+    return
+
+
+@command
 def add_image():
     """
     Add an image link, with HTML style for better configuration
     """
 
     # Link provided from command
-    link = vim.eval("link")
+    link = CONTEXT["args"]
     # Use input if present, whatever it is
     to_add = ""
-    if link[0]:
+    if link and link[0]:
         to_add = link[0]
 
     anchor = f"""
@@ -716,13 +1864,291 @@ def add_image():
 </p>"""
 
     # Append the link at current cursor position
-    (row, col) = vim.current.window.cursor
+    (row, col) = current_cursor()
+
+    with BufferTransaction(row-1, row) as tx:
+        # If line is empty, append into it, else append to the next one
+        if not tx.lines[0]:
+            tx.lines[0:0] = anchor.split("\n")
+        else:
+            tx.lines.extend(anchor.split("\n"))
+        # Restore cursor
+        tx.cursor = (row, col)
+
+    return
+
+
+def html_blocks():
+    """
+    Render the current buffer into HTML, only the blocks changed since
+    its last rendering being rendered again
+
+    Returns:
+        - the (hash, HTML) of the blocks, and the title of the document
+    """
 
-    # If line is empty, append into it, else append to the next one
-    if not vim.current.buffer[row-1]:
-        vim.current.buffer.append(anchor.split("\n"), row-1)
+    import markdown_html
+
+    index = document_index()
+    bufnr = vim.current.buffer.number
+    renderer = HTML_RENDERERS.get(bufnr)
+    if renderer is None:
+        renderer = markdown_html.HtmlRenderer()
+        HTML_RENDERERS[bufnr] = renderer
+
+    blocks = renderer.render(index)
+    logger("HTML: %d blocks, %d rendered", DEBUG, len(blocks),
+           renderer.rendered)
+
+    name = os.path.basename(vim.current.buffer.name)
+    return (blocks, markdown_html.document_title(index, name))
+
+
+@command
+def to_html():
+    """
+    Export the document to an HTML page with a simple stylesheet, into the
+    file given, or next to the document with the .html extension
+    """
+
+    import markdown_html
+
+    args = CONTEXT["args"]
+    if args:
+        path = os.path.expanduser(args[0])
+    elif vim.current.buffer.name:
+        path = os.path.splitext(vim.current.buffer.name)[0] + ".html"
     else:
-        vim.current.buffer.append(anchor.split("\n"), row)
-    # Restore cursor and move to bracket
-    vim.current.window.cursor = (row, col)
-    vim.command("normal! F[")
+        logger("Specify the file to export the document into", ERROR)
+        return
+
+    (blocks, title) = html_blocks()
+    with open(path, "w", encoding="utf-8") as target:
+        target.write(markdown_html.page(title, [text for (_, text) in blocks]))
+
+    logger("Exported to %s", INFO, path)
+    return
+
+
+@command
+def preview():
+    """
+    Start the live preview of the document on localhost, or stop it with
+    the stop argument. The page open in the browser is updated on save
+    and when the cursor holds, with only the blocks which changed.
+    """
+
+    args = CONTEXT["args"]
+    if args and args[0] == "stop":
+        stop_preview()
+        return
+
+    import markdown_preview
+
+    server = PREVIEW["server"]
+    (port, open_browser) = options("g:mardownToolPreviewPort",
+                                   "g:mardownToolPreviewOpen")
+    if server is None:
+        server = markdown_preview.PreviewServer()
+        url = server.start(int(port))
+        PREVIEW.update(server=server, url=url)
+    PREVIEW["bufnr"] = vim.current.buffer.number
+
+    (blocks, title) = html_blocks()
+    server.update(blocks, title)
+
+    vim.command("augroup markdown_tool_preview")
+    vim.command("autocmd!")
+    vim.command("autocmd BufWritePost,CursorHold,CursorHoldI <buffer=%d> "
+                "python3 markdown_tool.update_preview()" % PREVIEW["bufnr"])
+    vim.command("augroup END")
+
+    vim.command("echomsg " + json.dumps("MarkdownTool: preview at " +
+                                        PREVIEW["url"]))
+    if int(open_browser):
+        import webbrowser
+        webbrowser.open(PREVIEW["url"])
+    return
+
+
+def update_preview():
+    """
+    Push the changes of the previewed buffer to the page
+    """
+
+    server = PREVIEW["server"]
+    if server is None or vim.current.buffer.number != PREVIEW["bufnr"]:
+        return
+    (blocks, title) = html_blocks()
+    server.update(blocks, title)
+    return
+
+
+def stop_preview():
+    """
+    Stop the preview server and its autocommands
+    """
+
+    if PREVIEW["server"] is None:
+        return
+    PREVIEW["server"].stop()
+    PREVIEW.update(server=None, bufnr=0, url="")
+    vim.command("silent! autocmd! markdown_tool_preview")
+    return
+
+
+@command
+def update_folds():
+    """
+    Update b:markdown_tool_folds, the fold level of each line read by
+    the foldexpr, once per b:changedtick. Only the levels of the lines
+    which changed are computed again and sent to Vim, unless the whole
+    list is asked for, when the buffer doesn't have it yet.
+    """
+
+    import markdown_folds
+
+    index = document_index()
+    bufnr = vim.current.buffer.number
+    folds = FOLDS.get(bufnr)
+    if folds is None:
+        folds = markdown_folds.FoldLevels()
+        FOLDS[bufnr] = folds
+
+    (first, end, new_end) = folds.update(index)
+    logger("Fold levels of lines %d to %d updated", DEBUG, first, new_end)
+
+    tick = "let b:markdown_tool_fold_tick = %d" % index.changedtick
+    if CONTEXT.get("full"):
+        vim.command("let b:markdown_tool_folds = %s | %s" % (
+            json.dumps(folds.levels), tick))
+        return
+
+    # A single command removes the levels replaced, inserts the new ones
+    commands = [tick]
+    if end > first:
+        commands.append("call remove(b:markdown_tool_folds, %d, %d)" %
+                        (first, end - 1))
+    if new_end > first:
+        commands.append("call extend(b:markdown_tool_folds, %s, %d)" %
+                        (json.dumps(folds.levels[first:new_end]), first))
+    vim.command(" | ".join(commands))
+    return
+
+
+@command
+def update_stats():
+    """
+    Update b:markdown_tool_stats, the statistics of the document read by
+    the statusline, once per b:changedtick. Only the blocks which changed
+    are counted again.
+    """
+
+    import markdown_stats
+
+    index = document_index()
+    bufnr = vim.current.buffer.number
+    stats = STATS.get(bufnr)
+    if stats is None:
+        stats = markdown_stats.DocumentStats()
+        STATS[bufnr] = stats
+
+    counted = stats.update(index)
+    logger("Statistics: %d blocks counted", DEBUG, counted)
+
+    (done_status, speed) = options("g:mardownToolDoneStatus",
+                                   "g:mardownToolReadingSpeed")
+    vim.command("let b:markdown_tool_stats = %s | "
+                "let b:markdown_tool_stats_tick = %d" % (
+                    json.dumps(stats.summary(done_status, int(speed))),
+                    index.changedtick))
+    return
+
+
+@command
+def format_code():
+    """
+    Pipe the fenced code blocks of the document through the formatter of
+    their language, set in g:mardownToolCodeFormatters. The formatters run
+    concurrently, the blocks already formatted are skipped unless the
+    command has a bang, and the blocks are written back in a single buffer
+    update.
+    """
+
+    import markdown_format
+
+    index = document_index()
+    (formatters, cache_dir, workers, timeout) = options(
+        "g:mardownToolCodeFormatters", "g:mardownToolCacheDir",
+        "g:mardownToolCodeWorkers", "g:mardownToolCodeTimeout")
+    blocks = markdown_format.code_blocks(index)
+    if not any(formatters.get(block.lang) for block in blocks):
+        logger("No code block to format", INFO)
+        return
+
+    started = time.perf_counter()
+    cache = markdown_format.FormatCache(
+        os.path.join(os.path.expanduser(cache_dir), "code.json"))
+    path = snapshot("path", "expand('%:p')")
+    cwd = os.path.dirname(path) if path else snapshot("cwd", "getcwd()")
+    results = markdown_format.format_blocks(
+        blocks, formatters, cache, cwd, int(workers) or os.cpu_count(),
+        int(timeout), int(CONTEXT["bang"]))
+
+    (first, last) = (results[0].block.start, results[-1].block.end)
+    with BufferTransaction(first, last, index.lines[first:last]) as tx:
+        changed = markdown_format.apply_results(tx.lines, results, first)
+
+    failed = [result for result in results if result.error]
+    for result in failed:
+        logger("Code block at line %d not formatted: %s", WARNING,
+               result.block.start + 1, result.error)
+
+    logger("MdFormatCode: %d blocks in %.1f ms", DEBUG, len(results),
+           (time.perf_counter() - started) * 1000)
+    unchanged = len(results) - changed - len(failed)
+    vim.command("echomsg 'MarkdownTool: %d code block(s) formatted, %d "
+                "already formatted, %d failed'" % (
+                    changed, unchanged, len(failed)))
+    return
+
+
+def profile():
+    """
+    Control the profiling of the commands, from the MdProfile arguments:
+
+        - start [file]: time the commands and count their round-trips with
+          Vim, and with a file, profile them with cProfile too
+        - stop: stop profiling, writing the cProfile stats if requested
+        - reset: forget the statistics collected
+        - report, or no argument: print the latency of each command and
+          the counters
+    """
+
+    global vim
+
+    args = CONTEXT["args"]
+    action = args[0] if args else "report"
+
+    if action == "start":
+        path = os.path.expanduser(args[1]) if len(args) > 1 else ""
+        PROFILER.start(path)
+        vim = markdown_profile.CountingVim(VIM, PROFILER)
+        lines = ["Profiling started"]
+    elif action == "stop":
+        vim = VIM
+        path = PROFILER.stop()
+        lines = ["Profiling stopped"]
+        if path:
+            lines.append("cProfile stats written to " + path)
+    elif action == "reset":
+        PROFILER.reset()
+        lines = ["Profiling statistics cleared"]
+    elif action == "report":
+        lines = PROFILER.report()
+    else:
+        lines = ["Usage: MdProfile [start [file] | stop | reset | report]"]
+
+    for line in lines:
+        vim.command("echomsg " + json.dumps("MarkdownTool: " + line))
+    return
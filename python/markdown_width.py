@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Plugin:      https://github.com/dpretet/vim-markdow-tool
+Description: Display width of a text in a terminal, to align the tables
+Maintainer:  Damien Pretet https://github.com/dpretet
+
+The width of a character is looked up by bisection in the ranges of code
+points of the same width: 0 for the combining marks and the format
+characters, 2 for the wide and fullwidth East Asian characters and the
+emoji, 1 for the others. The ranges are generated by width_ranges() from
+the Unicode database of Python, the unassigned code points being part of
+the range before them.
+
+The width of an ASCII text is its length. The width of the other texts is
+remembered, the cells of a table often repeating the same values.
+
+This module doesn't depend on Vim and only works on strings.
+"""
+
+import functools
+from bisect import bisect_right
+
+# Number of texts whose width is remembered
+CACHE_SIZE = 1 << 16
+
+# Ranges of code points of the same width: the first code point of each
+# range and its width, from Unicode 14.0. The code points before the first
+# range are 1 column wide.
+WIDTH_RANGES = (
+    0x0300, 0, 0x0370, 1, 0x0483, 0, 0x048A, 1, 0x0591, 0, 0x05BE, 1,
+    0x05BF, 0, 0x05C0, 1, 0x05C1, 0, 0x05C3, 1, 0x05C4, 0, 0x05C6, 1,
+    0x05C7, 0, 0x05D0, 1, 0x0600, 0, 0x0606, 1, 0x0610, 0, 0x061B, 1,
+    0x061C, 0, 0x061D, 1, 0x064B, 0, 0x0660, 1, 0x0670, 0, 0x0671, 1,
+    0x06D6, 0, 0x06DE, 1, 0x06DF, 0, 0x06E5, 1, 0x06E7, 0, 0x06E9, 1,
+    0x06EA, 0, 0x06EE, 1, 0x070F, 0, 0x0710, 1, 0x0711, 0, 0x0712, 1,
+    0x0730, 0, 0x074D, 1, 0x07A6, 0, 0x07B1, 1, 0x07EB, 0, 0x07F4, 1,
+    0x07FD, 0, 0x07FE, 1, 0x0816, 0, 0x081A, 1, 0x081B, 0, 0x0824, 1,
+    0x0825, 0, 0x0828, 1, 0x0829, 0, 0x0830, 1, 0x0859, 0, 0x085E, 1,
+    0x0890, 0, 0x08A0, 1, 0x08CA, 0, 0x0903, 1, 0x093A, 0, 0x093B, 1,
+    0x093C, 0, 0x093D, 1, 0x0941, 0, 0x0949, 1, 0x094D, 0, 0x094E, 1,
+    0x0951, 0, 0x0958, 1, 0x0962, 0, 0x0964, 1, 0x0981, 0, 0x0982, 1,
+    0x09BC, 0, 0x09BD, 1, 0x09C1, 0, 0x09C7, 1, 0x09CD, 0, 0x09CE, 1,
+    0x09E2, 0, 0x09E6, 1, 0x09FE, 0, 0x0A03, 1, 0x0A3C, 0, 0x0A3E, 1,
+    0x0A41, 0, 0x0A59, 1, 0x0A70, 0, 0x0A72, 1, 0x0A75, 0, 0x0A76, 1,
+    0x0A81, 0, 0x0A83, 1, 0x0ABC, 0, 0x0ABD, 1, 0x0AC1, 0, 0x0AC9, 1,
+    0x0ACD, 0, 0x0AD0, 1, 0x0AE2, 0, 0x0AE6, 1, 0x0AFA, 0, 0x0B02, 1,
+    0x0B3C, 0, 0x0B3D, 1, 0x0B3F, 0, 0x0B40, 1, 0x0B41, 0, 0x0B47, 1,
+    0x0B4D, 0, 0x0B57, 1, 0x0B62, 0, 0x0B66, 1, 0x0B82, 0, 0x0B83, 1,
+    0x0BC0, 0, 0x0BC1, 1, 0x0BCD, 0, 0x0BD0, 1, 0x0C00, 0, 0x0C01, 1,
+    0x0C04, 0, 0x0C05, 1, 0x0C3C, 0, 0x0C3D, 1, 0x0C3E, 0, 0x0C41, 1,
+    0x0C46, 0, 0x0C58, 1, 0x0C62, 0, 0x0C66, 1, 0x0C81, 0, 0x0C82, 1,
+    0x0CBC, 0, 0x0CBD, 1, 0x0CBF, 0, 0x0CC0, 1, 0x0CC6, 0, 0x0CC7, 1,
+    0x0CCC, 0, 0x0CD5, 1, 0x0CE2, 0, 0x0CE6, 1, 0x0D00, 0, 0x0D02, 1,
+    0x0D3B, 0, 0x0D3D, 1, 0x0D41, 0, 0x0D46, 1, 0x0D4D, 0, 0x0D4E, 1,
+    0x0D62, 0, 0x0D66, 1, 0x0D81, 0, 0x0D82, 1, 0x0DCA, 0, 0x0DCF, 1,
+    0x0DD2, 0, 0x0DD8, 1, 0x0E31, 0, 0x0E32, 1, 0x0E34, 0, 0x0E3F, 1,
+    0x0E47, 0, 0x0E4F, 1, 0x0EB1, 0, 0x0EB2, 1, 0x0EB4, 0, 0x0EBD, 1,
+    0x0EC8, 0, 0x0ED0, 1, 0x0F18, 0, 0x0F1A, 1, 0x0F35, 0, 0x0F36, 1,
+    0x0F37, 0, 0x0F38, 1, 0x0F39, 0, 0x0F3A, 1, 0x0F71, 0, 0x0F7F, 1,
+    0x0F80, 0, 0x0F85, 1, 0x0F86, 0, 0x0F88, 1, 0x0F8D, 0, 0x0FBE, 1,
+    0x0FC6, 0, 0x0FC7, 1, 0x102D, 0, 0x1031, 1, 0x1032, 0, 0x1038, 1,
+    0x1039, 0, 0x103B, 1, 0x103D, 0, 0x103F, 1, 0x1058, 0, 0x105A, 1,
+    0x105E, 0, 0x1061, 1, 0x1071, 0, 0x1075, 1, 0x1082, 0, 0x1083, 1,
+    0x1085, 0, 0x1087, 1, 0x108D, 0, 0x108E, 1, 0x109D, 0, 0x109E, 1,
+    0x1100, 2, 0x1160, 0, 0x1200, 1, 0x135D, 0, 0x1360, 1, 0x1712, 0,
+    0x1715, 1, 0x1732, 0, 0x1734, 1, 0x1752, 0, 0x1760, 1, 0x1772, 0,
+    0x1780, 1, 0x17B4, 0, 0x17B6, 1, 0x17B7, 0, 0x17BE, 1, 0x17C6, 0,
+    0x17C7, 1, 0x17C9, 0, 0x17D4, 1, 0x17DD, 0, 0x17E0, 1, 0x180B, 0,
+    0x1810, 1, 0x1885, 0, 0x1887, 1, 0x18A9, 0, 0x18AA, 1, 0x1920, 0,
+    0x1923, 1, 0x1927, 0, 0x1929, 1, 0x1932, 0, 0x1933, 1, 0x1939, 0,
+    0x1940, 1, 0x1A17, 0, 0x1A19, 1, 0x1A1B, 0, 0x1A1E, 1, 0x1A56, 0,
+    0x1A57, 1, 0x1A58, 0, 0x1A61, 1, 0x1A62, 0, 0x1A63, 1, 0x1A65, 0,
+    0x1A6D, 1, 0x1A73, 0, 0x1A80, 1, 0x1AB0, 0, 0x1B04, 1, 0x1B34, 0,
+    0x1B35, 1, 0x1B36, 0, 0x1B3B, 1, 0x1B3C, 0, 0x1B3D, 1, 0x1B42, 0,
+    0x1B43, 1, 0x1B6B, 0, 0x1B74, 1, 0x1B80, 0, 0x1B82, 1, 0x1BA2, 0,
+    0x1BA6, 1, 0x1BA8, 0, 0x1BAA, 1, 0x1BAB, 0, 0x1BAE, 1, 0x1BE6, 0,
+    0x1BE7, 1, 0x1BE8, 0, 0x1BEA, 1, 0x1BED, 0, 0x1BEE, 1, 0x1BEF, 0,
+    0x1BF2, 1, 0x1C2C, 0, 0x1C34, 1, 0x1C36, 0, 0x1C3B, 1, 0x1CD0, 0,
+    0x1CD3, 1, 0x1CD4, 0, 0x1CE1, 1, 0x1CE2, 0, 0x1CE9, 1, 0x1CED, 0,
+    0x1CEE, 1, 0x1CF4, 0, 0x1CF5, 1, 0x1CF8, 0, 0x1CFA, 1, 0x1DC0, 0,
+    0x1E00, 1, 0x200B, 0, 0x2010, 1, 0x202A, 0, 0x202F, 1, 0x2060, 0,
+    0x2070, 1, 0x20D0, 0, 0x2100, 1, 0x231A, 2, 0x231C, 1, 0x2329, 2,
+    0x232B, 1, 0x23E9, 2, 0x23ED, 1, 0x23F0, 2, 0x23F1, 1, 0x23F3, 2,
+    0x23F4, 1, 0x25FD, 2, 0x25FF, 1, 0x2614, 2, 0x2616, 1, 0x2648, 2,
+    0x2654, 1, 0x267F, 2, 0x2680, 1, 0x2693, 2, 0x2694, 1, 0x26A1, 2,
+    0x26A2, 1, 0x26AA, 2, 0x26AC, 1, 0x26BD, 2, 0x26BF, 1, 0x26C4, 2,
+    0x26C6, 1, 0x26CE, 2, 0x26CF, 1, 0x26D4, 2, 0x26D5, 1, 0x26EA, 2,
+    0x26EB, 1, 0x26F2, 2, 0x26F4, 1, 0x26F5, 2, 0x26F6, 1, 0x26FA, 2,
+    0x26FB, 1, 0x26FD, 2, 0x26FE, 1, 0x2705, 2, 0x2706, 1, 0x270A, 2,
+    0x270C, 1, 0x2728, 2, 0x2729, 1, 0x274C, 2, 0x274D, 1, 0x274E, 2,
+    0x274F, 1, 0x2753, 2, 0x2756, 1, 0x2757, 2, 0x2758, 1, 0x2795, 2,
+    0x2798, 1, 0x27B0, 2, 0x27B1, 1, 0x27BF, 2, 0x27C0, 1, 0x2B1B, 2,
+    0x2B1D, 1, 0x2B50, 2, 0x2B51, 1, 0x2B55, 2, 0x2B56, 1, 0x2CEF, 0,
+    0x2CF2, 1, 0x2D7F, 0, 0x2D80, 1, 0x2DE0, 0, 0x2E00, 1, 0x2E80, 2,
+    0x302A, 0, 0x302E, 2, 0x303F, 1, 0x3041, 2, 0x3099, 0, 0x309B, 2,
+    0x3248, 1, 0x3250, 2, 0x4DC0, 1, 0x4E00, 2, 0xA4D0, 1, 0xA66F, 0,
+    0xA673, 1, 0xA674, 0, 0xA67E, 1, 0xA69E, 0, 0xA6A0, 1, 0xA6F0, 0,
+    0xA6F2, 1, 0xA802, 0, 0xA803, 1, 0xA806, 0, 0xA807, 1, 0xA80B, 0,
+    0xA80C, 1, 0xA825, 0, 0xA827, 1, 0xA82C, 0, 0xA830, 1, 0xA8C4, 0,
+    0xA8CE, 1, 0xA8E0, 0, 0xA8F2, 1, 0xA8FF, 0, 0xA900, 1, 0xA926, 0,
+    0xA92E, 1, 0xA947, 0, 0xA952, 1, 0xA960, 2, 0xA980, 0, 0xA983, 1,
+    0xA9B3, 0, 0xA9B4, 1, 0xA9B6, 0, 0xA9BA, 1, 0xA9BC, 0, 0xA9BE, 1,
+    0xA9E5, 0, 0xA9E6, 1, 0xAA29, 0, 0xAA2F, 1, 0xAA31, 0, 0xAA33, 1,
+    0xAA35, 0, 0xAA40, 1, 0xAA43, 0, 0xAA44, 1, 0xAA4C, 0, 0xAA4D, 1,
+    0xAA7C, 0, 0xAA7D, 1, 0xAAB0, 0, 0xAAB1, 1, 0xAAB2, 0, 0xAAB5, 1,
+    0xAAB7, 0, 0xAAB9, 1, 0xAABE, 0, 0xAAC0, 1, 0xAAC1, 0, 0xAAC2, 1,
+    0xAAEC, 0, 0xAAEE, 1, 0xAAF6, 0, 0xAB01, 1, 0xABE5, 0, 0xABE6, 1,
+    0xABE8, 0, 0xABE9, 1, 0xABED, 0, 0xABF0, 1, 0xAC00, 2, 0xD7B0, 1,
+    0xF900, 2, 0xFB00, 1, 0xFB1E, 0, 0xFB1F, 1, 0xFE00, 0, 0xFE10, 2,
+    0xFE20, 0, 0xFE30, 2, 0xFE70, 1, 0xFEFF, 0, 0xFF01, 2, 0xFF61, 1,
+    0xFFE0, 2, 0xFFE8, 1, 0xFFF9, 0, 0xFFFC, 1, 0x101FD, 0, 0x10280, 1,
+    0x102E0, 0, 0x102E1, 1, 0x10376, 0, 0x10380, 1, 0x10A01, 0, 0x10A10, 1,
+    0x10A38, 0, 0x10A40, 1, 0x10AE5, 0, 0x10AEB, 1, 0x10D24, 0, 0x10D30, 1,
+    0x10EAB, 0, 0x10EAD, 1, 0x10F46, 0, 0x10F51, 1, 0x10F82, 0, 0x10F86, 1,
+    0x11001, 0, 0x11002, 1, 0x11038, 0, 0x11047, 1, 0x11070, 0, 0x11071, 1,
+    0x11073, 0, 0x11075, 1, 0x1107F, 0, 0x11082, 1, 0x110B3, 0, 0x110B7, 1,
+    0x110B9, 0, 0x110BB, 1, 0x110BD, 0, 0x110BE, 1, 0x110C2, 0, 0x110D0, 1,
+    0x11100, 0, 0x11103, 1, 0x11127, 0, 0x1112C, 1, 0x1112D, 0, 0x11136, 1,
+    0x11173, 0, 0x11174, 1, 0x11180, 0, 0x11182, 1, 0x111B6, 0, 0x111BF, 1,
+    0x111C9, 0, 0x111CD, 1, 0x111CF, 0, 0x111D0, 1, 0x1122F, 0, 0x11232, 1,
+    0x11234, 0, 0x11235, 1, 0x11236, 0, 0x11238, 1, 0x1123E, 0, 0x11280, 1,
+    0x112DF, 0, 0x112E0, 1, 0x112E3, 0, 0x112F0, 1, 0x11300, 0, 0x11302, 1,
+    0x1133B, 0, 0x1133D, 1, 0x11340, 0, 0x11341, 1, 0x11366, 0, 0x11400, 1,
+    0x11438, 0, 0x11440, 1, 0x11442, 0, 0x11445, 1, 0x11446, 0, 0x11447, 1,
+    0x1145E, 0, 0x1145F, 1, 0x114B3, 0, 0x114B9, 1, 0x114BA, 0, 0x114BB, 1,
+    0x114BF, 0, 0x114C1, 1, 0x114C2, 0, 0x114C4, 1, 0x115B2, 0, 0x115B8, 1,
+    0x115BC, 0, 0x115BE, 1, 0x115BF, 0, 0x115C1, 1, 0x115DC, 0, 0x11600, 1,
+    0x11633, 0, 0x1163B, 1, 0x1163D, 0, 0x1163E, 1, 0x1163F, 0, 0x11641, 1,
+    0x116AB, 0, 0x116AC, 1, 0x116AD, 0, 0x116AE, 1, 0x116B0, 0, 0x116B6, 1,
+    0x116B7, 0, 0x116B8, 1, 0x1171D, 0, 0x11720, 1, 0x11722, 0, 0x11726, 1,
+    0x11727, 0, 0x11730, 1, 0x1182F, 0, 0x11838, 1, 0x11839, 0, 0x1183B, 1,
+    0x1193B, 0, 0x1193D, 1, 0x1193E, 0, 0x1193F, 1, 0x11943, 0, 0x11944, 1,
+    0x119D4, 0, 0x119DC, 1, 0x119E0, 0, 0x119E1, 1, 0x11A01, 0, 0x11A0B, 1,
+    0x11A33, 0, 0x11A39, 1, 0x11A3B, 0, 0x11A3F, 1, 0x11A47, 0, 0x11A50, 1,
+    0x11A51, 0, 0x11A57, 1, 0x11A59, 0, 0x11A5C, 1, 0x11A8A, 0, 0x11A97, 1,
+    0x11A98, 0, 0x11A9A, 1, 0x11C30, 0, 0x11C3E, 1, 0x11C3F, 0, 0x11C40, 1,
+    0x11C92, 0, 0x11CA9, 1, 0x11CAA, 0, 0x11CB1, 1, 0x11CB2, 0, 0x11CB4, 1,
+    0x11CB5, 0, 0x11D00, 1, 0x11D31, 0, 0x11D46, 1, 0x11D47, 0, 0x11D50, 1,
+    0x11D90, 0, 0x11D93, 1, 0x11D95, 0, 0x11D96, 1, 0x11D97, 0, 0x11D98, 1,
+    0x11EF3, 0, 0x11EF5, 1, 0x13430, 0, 0x14400, 1, 0x16AF0, 0, 0x16AF5, 1,
+    0x16B30, 0, 0x16B37, 1, 0x16F4F, 0, 0x16F50, 1, 0x16F8F, 0, 0x16F93, 1,
+    0x16FE0, 2, 0x16FE4, 0, 0x16FF0, 2, 0x1BC00, 1, 0x1BC9D, 0, 0x1BC9F, 1,
+    0x1BCA0, 0, 0x1CF50, 1, 0x1D167, 0, 0x1D16A, 1, 0x1D173, 0, 0x1D183, 1,
+    0x1D185, 0, 0x1D18C, 1, 0x1D1AA, 0, 0x1D1AE, 1, 0x1D242, 0, 0x1D245, 1,
+    0x1DA00, 0, 0x1DA37, 1, 0x1DA3B, 0, 0x1DA6D, 1, 0x1DA75, 0, 0x1DA76, 1,
+    0x1DA84, 0, 0x1DA85, 1, 0x1DA9B, 0, 0x1DF00, 1, 0x1E000, 0, 0x1E100, 1,
+    0x1E130, 0, 0x1E137, 1, 0x1E2AE, 0, 0x1E2C0, 1, 0x1E2EC, 0, 0x1E2F0, 1,
+    0x1E8D0, 0, 0x1E900, 1, 0x1E944, 0, 0x1E94B, 1, 0x1F004, 2, 0x1F005, 1,
+    0x1F0CF, 2, 0x1F0D1, 1, 0x1F18E, 2, 0x1F18F, 1, 0x1F191, 2, 0x1F19B, 1,
+    0x1F200, 2, 0x1F321, 1, 0x1F32D, 2, 0x1F336, 1, 0x1F337, 2, 0x1F37D, 1,
+    0x1F37E, 2, 0x1F394, 1, 0x1F3A0, 2, 0x1F3CB, 1, 0x1F3CF, 2, 0x1F3D4, 1,
+    0x1F3E0, 2, 0x1F3F1, 1, 0x1F3F4, 2, 0x1F3F5, 1, 0x1F3F8, 2, 0x1F43F, 1,
+    0x1F440, 2, 0x1F441, 1, 0x1F442, 2, 0x1F4FD, 1, 0x1F4FF, 2, 0x1F53E, 1,
+    0x1F54B, 2, 0x1F54F, 1, 0x1F550, 2, 0x1F568, 1, 0x1F57A, 2, 0x1F57B, 1,
+    0x1F595, 2, 0x1F597, 1, 0x1F5A4, 2, 0x1F5A5, 1, 0x1F5FB, 2, 0x1F650, 1,
+    0x1F680, 2, 0x1F6C6, 1, 0x1F6CC, 2, 0x1F6CD, 1, 0x1F6D0, 2, 0x1F6D3, 1,
+    0x1F6D5, 2, 0x1F6E0, 1, 0x1F6EB, 2, 0x1F6F0, 1, 0x1F6F4, 2, 0x1F700, 1,
+    0x1F7E0, 2, 0x1F800, 1, 0x1F90C, 2, 0x1F93B, 1, 0x1F93C, 2, 0x1F946, 1,
+    0x1F947, 2, 0x1FA00, 1, 0x1FA70, 2, 0x1FB00, 1, 0x20000, 2, 0xE0001, 0,
+    0xF0000, 1,
+)
+
+STARTS = WIDTH_RANGES[0::2]
+WIDTHS = WIDTH_RANGES[1::2]
+
+
+def char_width(char):
+    """
+    Number of columns a character takes in a terminal
+    """
+
+    k = bisect_right(STARTS, ord(char)) - 1
+    return WIDTHS[k] if k >= 0 else 1
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def text_width(text):
+    return sum(map(char_width, text))
+
+
+def display_width(text):
+    """
+    Number of columns a text takes in a terminal
+    """
+
+    if text.isascii():
+        return len(text)
+    return text_width(text)
+
+
+def display_widths(texts):
+    """
+    Widths of a list of texts, their lengths if they're all ASCII
+    """
+
+    if "".join(texts).isascii():
+        return map(len, texts)
+    return [len(text) if text.isascii() else text_width(text)
+            for text in texts]
+
+
+def width_ranges():
+    """
+    Compute the ranges of WIDTH_RANGES from the Unicode database of the
+    running Python
+
+    Returns:
+        - a list of (first code point, width) tuples
+    """
+
+    import unicodedata
+
+    ranges = []
+    previous = 1
+    for code in range(0x80, 0x110000):
+        char = chr(code)
+        category = unicodedata.category(char)
+        if category == "Cn":
+            continue
+        # The soft hyphen is displayed, the Hangul medial vowels and
+        # final consonants combine with the initial consonant
+        if category in ("Mn", "Me", "Cf") and code != 0xAD or \
+                0x1160 <= code <= 0x11FF:
+            width = 0
+        elif unicodedata.east_asian_width(char) in ("W", "F"):
+            width = 2
+        else:
+            width = 1
+        if width != previous:
+            ranges.append((code, width))
+            previous = width
+    return ranges
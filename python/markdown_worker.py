@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Plugin:      https://github.com/dpretet/vim-markdow-tool
+Description: Background worker running the long operations out of Vim
+Maintainer:  Damien Pretet https://github.com/dpretet
+
+The worker is a separate Python process talking JSON-RPC 2.0 over its
+standard input and output, one message per line. It keeps the index of
+the documents it has been sent, so a request only carries the lines which
+changed since the previous one, and answers with the span of lines to
+write back. The editor applies a result only if the buffer didn't change
+in the meantime. A result too large to be held at once, like an imported
+CSV file, is sent in batches of lines, as notifications sent before the
+response.
+
+WorkerClient starts the process and exchanges the messages from a thread,
+the responses are then handled by poll(), called from the editor.
+
+This module doesn't depend on Vim.
+"""
+
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+
+import markdown_core
+import markdown_index
+import markdown_table
+
+# JSON-RPC error codes
+METHOD_NOT_FOUND = -32601
+SERVER_ERROR = -32000
+OUT_OF_SYNC = -32001
+
+# Methods the worker answers
+METHODS = ("prettify", "toc", "import_csv", "tasks", "close")
+
+# Number of lines sent at once by the methods streaming their result
+BATCH = 1000
+
+# Number of messages received from the worker and not handled yet by the
+# editor. Above it, the worker waits to send more: the lines of a streamed
+# result are only held a few batches at a time.
+QUEUE_SIZE = 8
+
+
+class OutOfSync(Exception):
+    """
+    The worker doesn't hold the version of the document a change is
+    based on
+    """
+    pass
+
+
+class Worker(object):
+    """
+    The operations of the worker, and the documents it holds
+
+    Attributes:
+        - documents: the DocumentIndex of each buffer, by buffer number
+        - task_indexes: the TaskIndex of each project, by root directory
+        - notify: function(method, params) sending a notification to the
+          editor, while a request runs
+        - request_id: the id of the request running
+    """
+
+    __slots__ = ("documents", "task_indexes", "notify", "request_id")
+
+    def __init__(self, notify=None):
+        self.documents = {}
+        self.task_indexes = {}
+        self.notify = notify or (lambda method, params: None)
+        self.request_id = None
+
+    def document(self, params):
+        """
+        Update the document of a buffer with the change sent in params:
+        the whole lines, or the lines [first, last) of the version base
+        replaced by lines
+        """
+
+        bufnr = params["bufnr"]
+        changedtick = params["changedtick"]
+        index = self.documents.get(bufnr)
+
+        if params.get("first") is None:
+            index = markdown_index.DocumentIndex(params["lines"],
+                                                 changedtick)
+            self.documents[bufnr] = index
+        elif index is None or index.changedtick != params.get("base"):
+            raise OutOfSync("document %d is not at version %s" %
+                            (bufnr, params.get("base")))
+        else:
+            index.update(params["first"], params["last"], params["lines"])
+            index.changedtick = changedtick
+
+        return index
+
+    def prettify(self, params):
+        """
+        Prettify all the tables of a document
+
+        Returns:
+            - the span of lines to replace, start and end, its new lines
+              and the first lines of the malformed tables, or None if the
+              document has no table
+        """
+
+        index = self.document(params)
+        tables = markdown_core.table_blocks(index)
+        if not tables:
+            return None
+
+        (start, end) = (tables[0].start, tables[-1].end)
+        lines = index.lines[start:end]
+        (nb_rows, skipped) = markdown_core.prettify_tables(lines, tables,
+                                                           start)
+        return {"start": start, "end": end, "lines": lines,
+                "tables": len(tables), "rows": nb_rows, "skipped": skipped}
+
+    def toc(self, params):
+        """
+        Compute the table of content of a document
+
+        Returns:
+            - the span of lines between the markers, start and end, and its
+              new lines, or None if the document has no markers
+        """
+
+        update = markdown_core.toc_update(self.document(params))
+        if update is None:
+            return None
+        (start, end, lines) = update
+        return {"start": start, "end": end, "lines": lines}
+
+    def import_csv(self, params):
+        """
+        Render a CSV file into table lines, sent in "lines" notifications
+        of params["batch"] lines, so neither the worker nor the editor
+        holds the whole table at once
+
+        Returns:
+            - the number of lines sent
+        """
+
+        path = params["path"]
+
+        def open_source():
+            return open(path, newline="", encoding="utf-8-sig")
+
+        size = params.get("batch", BATCH)
+        batch = []
+        nb_lines = 0
+        for line in markdown_table.iter_csv_lines(open_source,
+                                                  params["delimiter"]):
+            batch.append(line)
+            if len(batch) == size:
+                self.notify("lines", {"id": self.request_id, "lines": batch})
+                nb_lines += len(batch)
+                batch = []
+        if batch:
+            self.notify("lines", {"id": self.request_id, "lines": batch})
+            nb_lines += len(batch)
+
+        return {"lines": nb_lines}
+
+    def tasks(self, params):
+        """
+        Refresh the task index of a project, then count its tasks by
+        status, or search them if a query is given
+        """
+
+        import markdown_tasks
+
+        (root, cache_dir) = (params["root"], params["cache_dir"])
+        index = self.task_indexes.get(root)
+        if index is None:
+            index = markdown_tasks.load_index(cache_dir, root)
+            self.task_indexes[root] = index
+        if index.refresh(params.get("workers", 0)):
+            markdown_tasks.save_index(cache_dir, index)
+
+        result = {"root": index.root, "files": len(index.files),
+                  "counts": index.counts}
+        if params.get("query") is not None:
+            (statuses, pattern, text) = params["query"]
+            result["results"] = index.query(statuses, pattern, text)
+        return result
+
+    def close(self, params):
+        """
+        Forget the document of a buffer
+        """
+
+        self.documents.pop(params["bufnr"], None)
+        return None
+
+    def handle(self, request):
+        """
+        Run a JSON-RPC request
+
+        Returns:
+            - the response, with the time spent in the method, in ms
+        """
+
+        response = {"jsonrpc": "2.0", "id": request.get("id")}
+        method = request.get("method", "")
+        if method not in METHODS:
+            response["error"] = {"code": METHOD_NOT_FOUND,
+                                 "message": "Unknown method " + method}
+            return response
+
+        started = time.perf_counter()
+        self.request_id = request.get("id")
+        try:
+            response["result"] = getattr(self, method)(
+                request.get("params", {}))
+        except OutOfSync as error:
+            response["error"] = {"code": OUT_OF_SYNC, "message": str(error)}
+        except Exception as error:
+            response["error"] = {"code": SERVER_ERROR,
+                                 "message": type(error).__name__ + ": " +
+                                 str(error)}
+        response["elapsed"] = (time.perf_counter() - started) * 1000
+        return response
+
+
+def serve(source, target):
+    """
+    Answer the requests read from source, one JSON message per line,
+    until the end of the input
+    """
+
+    def notify(method, params):
+        target.write(json.dumps({"jsonrpc": "2.0", "method": method,
+                                 "params": params}) + "\n")
+
+    worker = Worker(notify)
+    for line in source:
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+        except ValueError as error:
+            response = {"jsonrpc": "2.0", "id": None,
+                        "error": {"code": -32700, "message": str(error)}}
+        else:
+            response = worker.handle(request)
+        target.write(json.dumps(response) + "\n")
+        target.flush()
+
+
+class WorkerClient(object):
+    """
+    Start the worker process and send it requests. The responses and the
+    notifications are read by a thread and queued, the callbacks are then
+    run by poll() in the thread calling it.
+
+    The queue of the messages received is bounded: once full, the reading
+    thread waits, and so does the worker writing into the pipe. The
+    requests are written by another thread, so the editor never waits on
+    a worker itself waiting for the editor to handle its messages.
+
+    Attributes:
+        - python: the Python interpreter running the worker
+        - pending: the callbacks of the requests sent, by id
+        - partials: the callbacks of the notifications of the requests
+          sent, by id
+    """
+
+    __slots__ = ("python", "process", "pending", "partials", "responses",
+                 "requests", "next_id")
+
+    def __init__(self, python="python3"):
+        self.python = python
+        self.process = None
+        self.pending = {}
+        self.partials = {}
+        self.responses = queue.Queue(QUEUE_SIZE)
+        self.requests = None
+        self.next_id = 0
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        # The writer of a previous process stops
+        if self.requests is not None:
+            self.requests.put(None)
+        self.process = subprocess.Popen(
+            [self.python, os.path.abspath(__file__)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            encoding="utf-8", bufsize=1)
+        self.requests = queue.Queue()
+        threading.Thread(target=self._read, args=(self.process,),
+                         daemon=True).start()
+        threading.Thread(target=self._write,
+                         args=(self.process, self.requests),
+                         daemon=True).start()
+
+    def _read(self, process):
+        for line in process.stdout:
+            self.responses.put(json.loads(line))
+        # The worker exited, fail the requests still pending
+        for request_id in list(self.pending):
+            self.responses.put({"id": request_id, "error": {
+                "code": SERVER_ERROR, "message": "Worker exited"}})
+
+    def _write(self, process, requests):
+        """
+        Write the requests queued into the worker input, until None
+        """
+
+        while True:
+            message = requests.get()
+            try:
+                if message is None:
+                    process.stdin.close()
+                    return
+                process.stdin.write(message)
+                process.stdin.flush()
+            except OSError:
+                # The worker exited, the reader fails the requests
+                return
+
+    def request(self, method, params, callback, partial=None):
+        """
+        Send a request, callback(response) will be run by poll() once
+        the worker answered, and partial(notification) for each
+        notification sent meanwhile. The worker is started if not running.
+        """
+
+        if not self.is_alive():
+            self.start()
+        self.next_id += 1
+        self.pending[self.next_id] = callback
+        if partial is not None:
+            self.partials[self.next_id] = partial
+        self.requests.put(json.dumps({
+            "jsonrpc": "2.0", "id": self.next_id, "method": method,
+            "params": params}) + "\n")
+        return self.next_id
+
+    def poll(self):
+        """
+        Run the callbacks of the messages received, at most the ones
+        queued when called, the worker sending more meanwhile
+
+        Returns:
+            - the number of requests still pending
+        """
+
+        for _ in range(self.responses.qsize()):
+            response = self.responses.get_nowait()
+            if "method" in response:
+                partial = self.partials.get(response["params"].get("id"))
+                if partial is not None:
+                    partial(response)
+                continue
+            self.partials.pop(response.get("id"), None)
+            callback = self.pending.pop(response.get("id"), None)
+            if callback is not None:
+                callback(response)
+        return len(self.pending)
+
+    def stop(self):
+        if self.process is None:
+            return
+        self.requests.put(None)
+        while True:
+            try:
+                self.process.wait(0.05)
+                break
+            except subprocess.TimeoutExpired:
+                # Drop the messages not handled, the worker may be waiting
+                # to send more
+                while not self.responses.empty():
+                    self.responses.get_nowait()
+        self.process = None
+
+
+if __name__ == "__main__":
+    serve(sys.stdin, sys.stdout)
@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Plugin:      https://github.com/dpretet/vim-markdow-tool
+Description: Benchmarks of the table and task commands, run headless
+Maintainer:  Damien Pretet https://github.com/dpretet
+
+Each case runs a command on a generated document and measures its wall
+time (best of several runs), its peak memory (with tracemalloc) and its
+round-trips with Vim. The results are compared to bench_baseline.json and
+the run fails if a case got slower, bigger or chattier than its baseline.
+
+Usage:
+
+    python3 test/bench.py               # run and compare to the baseline
+    python3 test/bench.py --quick       # skip the largest documents
+    python3 test/bench.py -k table      # only the cases matching table
+    python3 test/bench.py --update      # store the results as the baseline
+"""
+
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import conftest  # noqa: F401, puts python/ on the path
+
+import vim
+import markdown_tool
+
+BASELINE = os.path.join(conftest.TEST_DIR, "bench_baseline.json")
+
+# A case is slower than its baseline beyond this ratio, and this
+# absolute margin to absorb the timer noise of the fast cases
+TIME_TOLERANCE = 0.5
+TIME_MARGIN_MS = 2.0
+MEMORY_TOLERANCE = 0.25
+MEMORY_MARGIN_KIB = 256
+
+# Documents bigger than this are skipped with --quick
+QUICK_LIMIT = 20000
+
+
+def table_lines(nb_cols, nb_rows):
+    """
+    A table of nb_cols columns and nb_rows rows below the header, not
+    aligned, with cells of different widths
+    """
+
+    lines = ["|" + "|".join("header %d" % col for col in range(nb_cols)) +
+             "|", "|" + "|".join("---" for _ in range(nb_cols)) + "|"]
+    for row in range(nb_rows):
+        lines.append("| " + " | ".join("r%dc%d%s" % (row, col, "x" * (
+            (row * 7 + col * 3) % 11)) for col in range(nb_cols)) + " |")
+    return lines
+
+
+def wide_table_lines(nb_cols, nb_rows):
+    """
+    A table like table_lines, with CJK text, emoji and combining accents
+    in a third of its cells
+    """
+
+    words = ["東京", "서울", "José", "👍 ok", "naïve"]
+    lines = table_lines(nb_cols, nb_rows)
+    for row in range(2, len(lines), 3):
+        lines[row] = lines[row].replace("c1", words[row % len(words)])
+    return lines
+
+
+def task_lines(nb_lines):
+    """
+    A document of nb_lines lines of headings, paragraphs and task lists
+    nested on three levels
+    """
+
+    lines = []
+    section = 0
+    while len(lines) < nb_lines:
+        lines += ["# Section %d" % section, "",
+                  "Some text about the section %d," % section,
+                  "on two lines.", ""]
+        for task in range(10):
+            lines.append("- [ ] task %d.%d" % (section, task))
+            lines.append("    - [X] subtask %d.%d.0" % (section, task))
+            lines.append("    - [ ] subtask %d.%d.1" % (section, task))
+            lines.append("        - [-] detail %d.%d.1.0" % (section, task))
+        lines.append("")
+        section += 1
+    return lines[:nb_lines]
+
+
+def mixed_lines(nb_lines):
+    """
+    A document of nb_lines lines alternating text, code and 8x20 tables
+    """
+
+    lines = []
+    section = 0
+    while len(lines) < nb_lines:
+        lines += ["## Part %d" % section, "", "A paragraph.", "",
+                  "```", "| not | a | table |", "```", ""]
+        lines += table_lines(8, 20) + [""]
+        section += 1
+    return lines[:nb_lines]
+
+
+class Case(object):
+    """
+    A benchmark: setup prepares the buffer and returns the function
+    to measure, size is the number of lines of the document
+    """
+
+    def __init__(self, name, size, setup, repeat=5):
+        self.name = name
+        self.size = size
+        self.setup = setup
+        self.repeat = repeat
+
+
+def buffer_case(lines, cursor, command, *params, **context):
+    """
+    Setup of a command running on the current buffer, called like the
+    Vimscript side does
+    """
+
+    def setup():
+        markdown_tool.INDEXES.clear()
+        markdown_tool.TASK_TREES.clear()
+        # Measure the commands themselves, never a dispatch to the worker
+        vim.setup(lines, cursor, g_mardownToolWorkerThreshold=-1)
+        return lambda: vim.run(command, *params, **context)
+    return setup
+
+
+def keystroke_case(lines, cursor):
+    """
+    Setup of the live alignment of a table already aligned, after a
+    character typed into the cursor cell
+    """
+
+    def setup():
+        markdown_tool.INDEXES.clear()
+        markdown_tool.LIVE_TABLES.clear()
+        buf = vim.setup(lines, cursor)
+        vim.run("live_align")
+        (row, col) = cursor
+        line = buf[row - 1]
+        buf[row - 1] = line[:col] + "x" + line[col:]
+        vim.current.window.cursor = (row, col + 1)
+        return lambda: vim.run("live_align")
+    return setup
+
+
+def fold_case(lines, row=0):
+    """
+    Setup of the update of the fold levels of a buffer, all of them, or
+    after the line row was edited when given
+    """
+
+    def setup():
+        markdown_tool.INDEXES.clear()
+        markdown_tool.FOLDS.clear()
+        buf = vim.setup(lines)
+        if not row:
+            return lambda: vim.run("update_folds", full=1)
+        vim.run("update_folds", full=1)
+        buf[row - 1] += " edited"
+        return lambda: vim.run("update_folds")
+    return setup
+
+
+def stats_case(lines, row=0):
+    """
+    Setup of the update of the statistics of a buffer, all of them, or
+    after the line row was edited when given
+    """
+
+    def setup():
+        markdown_tool.INDEXES.clear()
+        markdown_tool.STATS.clear()
+        buf = vim.setup(lines)
+        if row:
+            vim.run("update_stats")
+            buf[row - 1] += " edited"
+        return lambda: vim.run("update_stats")
+    return setup
+
+
+def pure_case(function, *args):
+    """
+    Setup of a function not using Vim
+    """
+
+    def setup():
+        return lambda: function(*args)
+    return setup
+
+
+def cases():
+    table_sizes = [(10, 10), (20, 1000), (20, 10000), (20, 50000)]
+
+    for (nb_cols, nb_rows) in table_sizes:
+        lines = table_lines(nb_cols, nb_rows)
+        size = "%dx%d" % (nb_cols, nb_rows)
+        repeat = 5 if nb_rows <= 1000 else 2
+        cursor = (len(lines) // 2, 3)
+
+        yield Case("grab_table/" + size, len(lines),
+                   pure_case(markdown_tool.grab_table, lines), repeat)
+
+        columns = markdown_tool.grab_table(lines).columns
+        yield Case("table_prettifier/" + size, len(lines),
+                   pure_case(markdown_tool.table_prettifier, columns), repeat)
+
+        yield Case("table_transformation/" + size, len(lines),
+                   buffer_case(lines, cursor, "table_transformation"),
+                   repeat)
+
+        yield Case("table_add_row/" + size, len(lines),
+                   buffer_case(lines, cursor, "table_transformation",
+                               "add_row"), repeat)
+
+        yield Case("table_sort/" + size, len(lines),
+                   buffer_case(lines, cursor, "sort_table", args=["2"],
+                               bang=1), repeat)
+
+        if nb_rows <= 10000:
+            wide = markdown_tool.grab_table(
+                wide_table_lines(nb_cols, nb_rows)).columns
+            yield Case("table_prettifier_wide/" + size, len(lines),
+                       pure_case(markdown_tool.table_prettifier, wide),
+                       repeat)
+
+            aligned = markdown_tool.table_prettifier(columns)
+            yield Case("live_align/" + size, len(lines),
+                       keystroke_case(aligned, cursor), repeat)
+
+    for nb_lines in (1000, 100000):
+        repeat = 5 if nb_lines <= 1000 else 2
+        size = str(nb_lines)
+
+        lines = mixed_lines(nb_lines)
+        yield Case("prettify_all/" + size, nb_lines,
+                   buffer_case(lines, (1, 0), "prettify_all"),
+                   repeat)
+
+        lines = task_lines(nb_lines)
+        yield Case("change_status/" + size, nb_lines,
+                   buffer_case(lines, (1, 0), "change_status",
+                               args=["X"], first=1, last=nb_lines),
+                   repeat)
+        yield Case("change_to_task/" + size, nb_lines,
+                   buffer_case(lines, (1, 0), "change_to_task",
+                               first=1, last=nb_lines), repeat)
+        yield Case("task_progress/" + size, nb_lines,
+                   buffer_case(lines, (1, 0), "task_progress"),
+                   repeat)
+        yield Case("fold_levels/" + size, nb_lines, fold_case(lines),
+                   repeat)
+        yield Case("fold_update/" + size, nb_lines,
+                   fold_case(lines, nb_lines // 2), repeat)
+        yield Case("stats/" + size, nb_lines, stats_case(lines), repeat)
+        yield Case("stats_update/" + size, nb_lines,
+                   stats_case(lines, nb_lines // 2), repeat)
+
+
+def measure(case):
+    """
+    Run a case, best time of case.repeat runs, then once more under
+    tracemalloc for the peak memory
+
+    Returns:
+        - a dict of time_ms, peak_kib and api_calls
+    """
+
+    best = None
+    api_calls = 0
+    for _ in range(case.repeat):
+        run = case.setup()
+        gc.collect()
+        vim.counters.reset()
+        started = time.perf_counter()
+        run()
+        elapsed = (time.perf_counter() - started) * 1000
+        api_calls = vim.counters.api_calls
+        best = elapsed if best is None else min(best, elapsed)
+
+    run = case.setup()
+    gc.collect()
+    tracemalloc.start()
+    run()
+    (_, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"time_ms": round(best, 3), "peak_kib": round(peak / 1024, 1),
+            "api_calls": api_calls}
+
+
+def regressions(name, result, baseline, tolerance):
+    """
+    Compare a result to its baseline
+
+    Returns:
+        - a list of messages, empty if the case didn't regress
+    """
+
+    found = []
+    base = baseline.get(name)
+    if base is None:
+        return found
+
+    if (result["time_ms"] > base["time_ms"] * (1 + tolerance) and
+            result["time_ms"] - base["time_ms"] > TIME_MARGIN_MS):
+        found.append("time %.1f ms, baseline %.1f ms" %
+                     (result["time_ms"], base["time_ms"]))
+    if (result["peak_kib"] > base["peak_kib"] * (1 + MEMORY_TOLERANCE) and
+            result["peak_kib"] - base["peak_kib"] > MEMORY_MARGIN_KIB):
+        found.append("peak memory %.0f KiB, baseline %.0f KiB" %
+                     (result["peak_kib"], base["peak_kib"]))
+    if result["api_calls"] > base["api_calls"]:
+        found.append("%d API calls, baseline %d" %
+                     (result["api_calls"], base["api_calls"]))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--quick", action="store_true",
+                        help="skip the documents over %d lines" % QUICK_LIMIT)
+    parser.add_argument("-k", dest="pattern", default="",
+                        help="only run the cases whose name contains this")
+    parser.add_argument("--update", action="store_true",
+                        help="store the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=TIME_TOLERANCE,
+                        help="slowdown ratio accepted, %.1f by default" %
+                        TIME_TOLERANCE)
+    options = parser.parse_args()
+
+    baseline = {}
+    if os.path.isfile(BASELINE):
+        with open(BASELINE, encoding="utf-8") as source:
+            baseline = json.load(source)
+
+    results = {}
+    failures = 0
+    print("%-34s %10s %10s %10s  %s" % ("case", "time ms", "peak KiB",
+                                        "API calls", "vs baseline"))
+
+    for case in cases():
+        if options.pattern not in case.name:
+            continue
+        if options.quick and case.size > QUICK_LIMIT:
+            continue
+
+        result = measure(case)
+        results[case.name] = result
+
+        base = baseline.get(case.name)
+        found = regressions(case.name, result, baseline, options.tolerance)
+        if found:
+            failures += 1
+            status = "REGRESSION: " + ", ".join(found)
+        elif base:
+            status = "x%.2f" % (result["time_ms"] / max(base["time_ms"],
+                                                       0.001))
+        else:
+            status = "no baseline"
+
+        print("%-34s %10.2f %10.1f %10d  %s" % (
+            case.name, result["time_ms"], result["peak_kib"],
+            result["api_calls"], status))
+
+    if options.update:
+        baseline.update(results)
+        with open(BASELINE, "w", encoding="utf-8") as target:
+            json.dump(baseline, target, indent=2, sort_keys=True)
+            target.write("\n")
+        print("Baseline updated: " + BASELINE)
+        return 0
+
+    if failures:
+        print("%d case(s) regressed" % failures)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
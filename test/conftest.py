@@ -0,0 +1,14 @@
+# coding: utf-8
+
+"""
+Run the plugin headless: the fake vim module of this directory is imported
+in place of the one embedded in Vim, and the plugin modules are loaded
+from python/
+"""
+
+import os
+import sys
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(TEST_DIR), "python"))
+sys.path.insert(0, TEST_DIR)
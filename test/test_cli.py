@@ -0,0 +1,121 @@
+# coding: utf-8
+
+"""
+Tests of the markdown-tool command line interface
+"""
+
+import os
+
+import markdown_cli
+
+TABLE = ["# Title", "", "|a|b|", "|-|-|", "|1|22|", ""]
+PRETTY = ["# Title", "", "| a | b  |", "|---|----|", "| 1 | 22 |", ""]
+
+
+def write(path, lines):
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+def read(path):
+    return path.read_text(encoding="utf-8").splitlines()
+
+
+def test_prettify_check_then_write(tmp_path, capsys):
+    doc = tmp_path / "doc.md"
+    write(doc, TABLE)
+    cache = str(tmp_path / "cache")
+
+    assert markdown_cli.main(["--cache-dir", cache, "prettify", "--check",
+                              str(tmp_path)]) == 1
+    assert "would update" in capsys.readouterr().out
+    assert read(doc) == TABLE
+
+    assert markdown_cli.main(["--cache-dir", cache, "prettify",
+                              str(tmp_path)]) == 0
+    assert read(doc) == PRETTY
+
+    assert markdown_cli.main(["--cache-dir", cache, "prettify", "--check",
+                              str(tmp_path)]) == 0
+
+
+def test_prettify_skips_clean_files(tmp_path, monkeypatch):
+    write(tmp_path / "doc.md", PRETTY)
+    cache = str(tmp_path / "cache")
+    assert markdown_cli.main(["--cache-dir", cache, "prettify",
+                              str(tmp_path)]) == 0
+
+    parsed = []
+    monkeypatch.setitem(markdown_cli.TRANSFORMATIONS, "prettify",
+                        lambda lines: parsed.append(lines) or lines)
+    assert markdown_cli.main(["--cache-dir", cache, "prettify",
+                              str(tmp_path)]) == 0
+    assert parsed == []
+
+
+def test_prettify_keeps_the_other_line_breaks(tmp_path):
+    """
+    Only "\n" ends a line: a form feed or a line separator stays in its
+    line, as in Vim
+    """
+
+    doc = tmp_path / "doc.md"
+    others = ["page one\fpage two", "first\u2028second\x85"]
+    doc.write_bytes("\n".join(others + TABLE).encode("utf-8") + b"\n")
+
+    assert markdown_cli.main(["--cache-dir", "", "prettify",
+                              str(doc)]) == 0
+    assert doc.read_bytes() == "\n".join(others + PRETTY).encode(
+        "utf-8") + b"\n"
+
+
+def test_prettify_diff_keeps_crlf(tmp_path, capsys):
+    doc = tmp_path / "doc.md"
+    doc.write_bytes("\r\n".join(TABLE).encode("utf-8") + b"\r\n")
+
+    assert markdown_cli.main(["--cache-dir", "", "prettify", "--diff",
+                              str(doc)]) == 1
+    out = capsys.readouterr().out
+    assert "-|a|b|" in out and "+| a | b  |" in out
+
+    assert markdown_cli.main(["--cache-dir", "", "prettify", str(doc)]) == 0
+    assert doc.read_bytes() == ("\r\n".join(PRETTY).encode("utf-8") +
+                                b"\r\n")
+
+
+def test_toc(tmp_path):
+    doc = tmp_path / "doc.md"
+    write(doc, ["<!-- toc -->", "<!-- /toc -->", "", "# One", "## Two"])
+
+    assert markdown_cli.main(["--cache-dir", "", "toc", str(doc)]) == 0
+    assert read(doc)[:4] == ["<!-- toc -->", "- [One](#one)",
+                             "  - [Two](#two)", "<!-- /toc -->"]
+
+
+def test_check_local_links(tmp_path, capsys):
+    write(tmp_path / "other.md", ["# Other"])
+    doc = tmp_path / "doc.md"
+    write(doc, ["# Title", "[ok](#title) [bad](#nope)",
+                "[file](other.md#other) [missing](gone.md)",
+                "[web](https://example.com)"])
+
+    assert markdown_cli.main(["--cache-dir", "", "check", str(doc)]) == 1
+    out = capsys.readouterr().out.splitlines()
+    assert out == [str(doc) + ":2:14: E No heading for anchor #nope",
+                   str(doc) + ":3:24: E File not found: gone.md"]
+
+
+def test_tasks(tmp_path, capsys):
+    os.makedirs(str(tmp_path / "ops"))
+    write(tmp_path / "ops" / "todo.md", ["- [ ] deploy", "- [X] build"])
+    # The rows are the ones of Vim, a form feed doesn't end a line
+    write(tmp_path / "notes.md", ["page\fbreak", "- [-] write the doc"])
+
+    assert markdown_cli.main(["--cache-dir", "", "tasks", "--root",
+                              str(tmp_path), "status:new,ongoing"]) == 0
+    assert capsys.readouterr().out.splitlines() == [
+        os.path.join(str(tmp_path), "notes.md") + ":2: [-] write the doc",
+        os.path.join(str(tmp_path), "ops", "todo.md") + ":1: [ ] deploy"]
+
+    assert markdown_cli.main(["--cache-dir", "", "tasks", "--root",
+                              str(tmp_path), "--summary"]) == 0
+    assert capsys.readouterr().out.startswith("1 new, 1 ongoing, 1 done")
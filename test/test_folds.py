@@ -0,0 +1,76 @@
+# coding: utf-8
+
+"""
+Tests of the fold levels of the sections, lists, fenced code and tables,
+and of their update in the buffer variable read by the foldexpr
+"""
+
+import markdown_folds
+import markdown_index
+import markdown_tool
+import vim
+
+DOCUMENT = [
+    "intro",
+    "# Title",
+    "- [ ] task",
+    "    - [ ] sub task",
+    "      continued",
+    "- [X] done",
+    "",
+    "## Code",
+    "```python",
+    "x = 1",
+    "```",
+    "",
+    "| a | b |",
+    "|---|---|",
+]
+
+
+def levels(lines):
+    folds = markdown_folds.FoldLevels()
+    folds.update(markdown_index.DocumentIndex(lines))
+    return folds.levels
+
+
+def test_fold_levels():
+    assert levels(DOCUMENT) == [
+        0, ">1", ">2", ">3", 3, 1, 1, ">2", ">3", 3, 3, 2, ">3", 3]
+
+    # After an edit, only the blocks parsed again by the index are
+    # computed again, and the ones following in the section changed
+    index = markdown_index.DocumentIndex(DOCUMENT)
+    folds = markdown_folds.FoldLevels()
+    folds.update(index)
+    index.update(7, 8, ["### Code"])
+    assert folds.update(index) == (2, 14, 14)
+    assert folds.levels == levels(index.lines)
+    index.update(3, 3, ["    - [ ] another"])
+    assert folds.update(index) == (2, 7, 8)
+    assert folds.levels == levels(index.lines)
+
+
+def test_update_folds_sends_the_lines_changed():
+    markdown_tool.FOLDS.clear()
+    buf = vim.setup(DOCUMENT)
+
+    vim.run("update_folds", full=1)
+    assert vim.variables["b:markdown_tool_folds"] == levels(DOCUMENT)
+    assert vim.variables["b:markdown_tool_fold_tick"] == buf.changedtick
+
+    buf[9] = "x = 2"
+    vim.counters.reset()
+    vim.run("update_folds")
+    # Only the levels of the fenced code, in a single command
+    assert vim.counters.command == 1
+    assert vim.commands[-1] == (
+        "let b:markdown_tool_fold_tick = %d | "
+        "call remove(b:markdown_tool_folds, 8, 11) | "
+        'call extend(b:markdown_tool_folds, [">3", 3, 3, 2], 8)' %
+        buf.changedtick)
+
+    buf[2:2] = ["# New section"]
+    vim.run("update_folds")
+    assert vim.variables["b:markdown_tool_folds"] == levels(buf.content)
+    assert vim.variables["b:markdown_tool_fold_tick"] == buf.changedtick
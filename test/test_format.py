@@ -0,0 +1,99 @@
+# coding: utf-8
+
+"""
+Tests of the formatting of the fenced code blocks, with formatters
+written for the tests
+"""
+
+import shlex
+import sys
+
+import markdown_format
+import markdown_index
+import vim
+
+# Strip the trailing spaces and upper-case the code, logging each call
+FORMATTER = """\
+import sys
+with open(sys.argv[1], "a") as log:
+    log.write("call\\n")
+for line in sys.stdin:
+    print(line.rstrip().upper())
+"""
+
+DOCUMENT = [
+    "# Code",
+    "```python",
+    "x = 1   ",
+    "```",
+    "- item",
+    "  ```python",
+    "  def f():",
+    "      pass",
+    "  ```",
+    "```sh",
+    "ls",
+    "```",
+    "```",
+    "no language",
+    "```",
+    "``` {.python}",
+    "done",
+    "```",
+]
+
+
+def formatters(tmp_path):
+    script = tmp_path / "upper.py"
+    script.write_text(FORMATTER, encoding="utf-8")
+    log = tmp_path / "calls.log"
+    command = " ".join(shlex.quote(str(arg)) for arg in
+                       (sys.executable, script, log))
+    return ({"python": command, "sh": "echo broken >&2; exit 3"}, log)
+
+
+def calls(log):
+    if not log.exists():
+        return 0
+    return len(log.read_text().splitlines())
+
+
+def test_code_blocks():
+    index = markdown_index.DocumentIndex(DOCUMENT + ["~~~python", "open"])
+    blocks = markdown_format.code_blocks(index)
+
+    assert [(block.start, block.end, block.lang, block.indent)
+            for block in blocks] == [(1, 3, "python", 0), (5, 8, "python", 2),
+                                     (9, 11, "sh", 0), (15, 17, "python", 0)]
+    assert blocks[1].code == ["def f():", "    pass"]
+
+
+def test_format_code(tmp_path):
+    (commands, log) = formatters(tmp_path)
+    buf = vim.setup(DOCUMENT, g_mardownToolCodeFormatters=commands,
+                    g_mardownToolCacheDir=str(tmp_path / "cache"))
+
+    vim.counters.reset()
+    vim.run("format_code")
+    assert buf.content == DOCUMENT[:2] + ["X = 1"] + DOCUMENT[3:6] + [
+        "  DEF F():", "      PASS"] + DOCUMENT[8:16] + ["DONE", "```"]
+    # The three blocks formatted, only their lines changed written back
+    assert calls(log) == 3
+    assert vim.counters.lines_written == 4
+    assert vim.messages[-1] == (
+        "MarkdownTool: 3 code block(s) formatted, 0 already formatted, "
+        "1 failed")
+
+    # Only the block changed is formatted again
+    buf[2] = "y = 2"
+    vim.run("format_code")
+    assert buf[2] == "Y = 2"
+    assert calls(log) == 4
+    assert vim.messages[-1] == (
+        "MarkdownTool: 1 code block(s) formatted, 2 already formatted, "
+        "1 failed")
+
+    # A bang formats them all again
+    vim.run("format_code", bang=1)
+    assert calls(log) == 7
+    assert buf.content[2] == "Y = 2"
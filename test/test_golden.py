@@ -0,0 +1,265 @@
+# coding: utf-8
+
+"""
+Golden file tests: each command runs on golden/<case>.in.md and the buffer
+must then match golden/<case>.out.md. Set GOLDEN_UPDATE=1 to write the
+outputs again after an intended change, then review their diff.
+"""
+
+import os
+import unicodedata
+
+import pytest
+
+import vim
+import markdown_core
+import markdown_table
+import markdown_tool
+import markdown_width
+
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          "golden")
+
+# Case name: (command, parameters, cursor, arguments given by the Vim
+# function calling it)
+CASES = {
+    "prettify": ("table_transformation", (), (5, 3), {}),
+    "prettify_align": ("table_transformation", (), (1, 0), {}),
+    "prettify_wide": ("table_transformation", (), (3, 2), {}),
+    "add_column": ("table_transformation", ("add_column",), (5, 9), {}),
+    "add_row": ("table_transformation", ("add_row",), (5, 3), {}),
+    "swap_column": ("table_transformation", ("swap_column",), (5, 9), {}),
+    "swap_row": ("table_transformation", ("swap_row",), (5, 3), {}),
+    "prettify_all": ("prettify_all", (), (1, 0), {}),
+    "change_to_task": ("change_to_task", (), (1, 0),
+                       {"first": 3, "last": 8}),
+    "status_done": ("change_status", (), (1, 0),
+                    {"args": ["X"], "first": 1, "last": 4}),
+    "task_progress": ("task_progress", (), (1, 0), {}),
+    "toc": ("insert_toc", (), (1, 0), {}),
+    "toc_update": ("update_toc", (), (1, 0), {}),
+    "add_table": ("add_table", (), (1, 0), {"args": [""]}),
+    "live_align": ("live_align", (), (6, 9), {}),
+    "sort_table": ("sort_table", (), (5, 9), {"args": ["r"], "bang": 0}),
+    "filter_table": ("filter_table", (), (5, 0),
+                     {"args": "owner ^(bob|carol)$", "bang": 1}),
+}
+
+
+def read_lines(path):
+    with open(path, encoding="utf-8") as source:
+        return source.read().splitlines()
+
+
+@pytest.fixture(autouse=True)
+def fresh_state():
+    """
+    Forget the indexes built by the previous tests
+    """
+    markdown_tool.INDEXES.clear()
+    markdown_tool.TASK_TREES.clear()
+    markdown_tool.LIVE_TABLES.clear()
+    yield
+
+
+@pytest.mark.parametrize("case", sorted(CASES))
+def test_golden(case):
+    (command, params, cursor, context) = CASES[case]
+    base = os.path.join(GOLDEN_DIR, case)
+
+    buf = vim.setup(read_lines(base + ".in.md"), cursor)
+    vim.run(command, *params, **context)
+    result = buf.content
+
+    if os.environ.get("GOLDEN_UPDATE"):
+        with open(base + ".out.md", "w", encoding="utf-8") as target:
+            target.write("\n".join(result) + "\n")
+
+    assert result == read_lines(base + ".out.md")
+
+
+def test_single_write_per_transformation():
+    """
+    A table transformation writes the table back in a single update: one
+    read for the document index, one for the table, one write
+    """
+
+    vim.setup(read_lines(os.path.join(GOLDEN_DIR, "prettify.in.md")), (5, 3))
+    vim.run("table_transformation", "add_row")
+    assert vim.counters.lines_written == 5
+    assert vim.counters.buffer == 3
+
+
+def test_interactive_commands_round_trips():
+    """
+    The editor state comes with the command: an interactive command only
+    reads and writes the lines it edits, and moves the cursor. The
+    clipboard is read only when no link is given.
+    """
+
+    buf = vim.setup(["- [ ] deploy", ""], (1, 0))
+    vim.run("add_sub_task", args=["test"])
+    assert buf.content[1] == "    - [ ] test"
+    assert vim.counters.as_dict() == {
+        "eval": 0, "command": 0, "buffer": 2, "cursor": 1,
+        "lines_read": 1, "lines_written": 1}
+
+    vim.setup(["text "], (1, 4))
+    vim.run("add_link", args=["https://example.com"])
+    assert (vim.counters.eval, vim.counters.api_calls) == (0, 3)
+
+    buf = vim.setup(["text "], (1, 4), **{"@+": "https://example.com"})
+    vim.run("add_link", args=[""])
+    assert buf.content == ["text [](https://example.com)"]
+    assert vim.counters.eval == 1
+
+
+def test_sort_numbers_not_finite_last():
+    """
+    NaN, the infinities and the underscored numbers are sorted as text,
+    after the numbers, and the empty cells don't count in the guess
+    """
+
+    table = markdown_table.Table([["n", "3", "NaN", "1", "2"]])
+    assert markdown_core.sort_table(table, 0) == markdown_core.NUMERIC_SORT
+    assert table.columns[0] == ["n", "1", "2", "3", "NaN"]
+
+    table = markdown_table.Table([["n", "-inf", "3", "1_0", "1e1", "inf"]])
+    markdown_core.sort_table(table, 0, markdown_core.NUMERIC_SORT, True)
+    assert table.columns[0] == ["n", "1e1", "3", "-inf", "1_0", "inf"]
+
+    cells = ["", "", "1", "", "a", "2", "", "3"] * 100
+    assert markdown_core.column_sort_kind(cells) == markdown_core.NUMERIC_SORT
+
+
+def test_add_column_after_wide_cells():
+    """
+    The cursor column is a byte index, the cell under the cursor is found
+    after the multibyte characters
+    """
+
+    buf = vim.setup(["| éééé | b | c |", "|------|---|---|"], (1, 11))
+    vim.run("table_transformation", "add_column")
+    assert buf.content == ["| éééé | b |       | c |",
+                           "|------|---|-------|---|"]
+
+
+def test_status_progress_updates_parents():
+    """
+    Once the progress is annotated, a status change updates the parents
+    """
+
+    lines = read_lines(os.path.join(GOLDEN_DIR, "task_progress.in.md"))
+    buf = vim.setup(lines, (1, 0))
+    vim.run("task_progress")
+    assert buf.content[2] == "- [ ] deploy (3/4)"
+
+    vim.run("change_status", args=["X"], first=5, last=5)
+    assert buf.content[4] == "    - [X] test (1/1)"
+    assert buf.content[2] == "- [ ] deploy (4/4)"
+
+
+def test_status_of_a_task_in_code_after_progress():
+    """
+    A task-looking line in a code block changes status without
+    updating the progress annotated
+    """
+
+    buf = vim.setup(["- [ ] parent", "    - [ ] child", "", "```",
+                     "- [ ] not a task", "```"], (1, 0))
+    vim.run("task_progress")
+    vim.run("change_status", args=["X"], first=1, last=6)
+    assert buf.content == ["- [X] parent (1/1)", "    - [X] child", "",
+                           "```", "- [X] not a task", "```"]
+
+
+def test_live_align_rewrites_the_row_typed():
+    """
+    Typing into an aligned table rewrites only the row edited, until a
+    column gets wider, and the cursor stays at its place in the cell
+    """
+
+    lines = ["| name | size |", "|------|------|", "| a    | 1    |",
+             "| b    | 2    |"]
+    buf = vim.setup(lines, (3, 3))
+    vim.run("live_align")
+    assert vim.counters.lines_written == 0
+
+    # "a" becomes "ax", the cursor after the x
+    buf[2] = "| ax    | 1    |"
+    vim.current.window.cursor = (3, 4)
+    vim.counters.reset()
+    vim.run("live_align")
+    assert buf.content[2] == "| ax   | 1    |"
+    assert vim.counters.lines_written == 1
+    assert vim.current.window.cursor == (3, 4)
+
+    # Typing in the second column makes it wider
+    buf[3] = "| b    | 2 MiB   |"
+    vim.current.window.cursor = (4, 14)
+    vim.run("live_align")
+    assert buf.content == ["| name | size  |", "|------|-------|",
+                           "| ax   | 1     |", "| b    | 2 MiB |"]
+    assert vim.current.window.cursor == (4, 14)
+
+    # And narrower again
+    buf[3] = "| b    | 2 |"
+    vim.run("live_align")
+    assert buf.content[1:] == ["|------|------|", "| ax   | 1    |",
+                               "| b    | 2    |"]
+
+    # A new pipe typed in a row: left as is until the column is added
+    buf[3] = "| b    | 2 | MiB |"
+    vim.run("live_align")
+    assert buf.content[3] == "| b    | 2 | MiB |"
+
+
+def test_cells_and_justification_kept_while_resizing():
+    """
+    The rows already rendered are padded on the side of their
+    justification when a column gets wider or narrower
+    """
+
+    table = markdown_tool.grab_table([
+        "| a | `x|y` | c \\| d |", "|---|--:|:-:|", "|| 1 | 2 |"])
+    assert table.columns == [["a", ""], ["`x|y`", "1"], ["c \\| d", "2"]]
+
+    table.render()
+    for (col, value) in ((1, "12345678"), (1, "1"), (2, "wide cell"),
+                         (0, "abc")):
+        table.set_cell(col, 1, value)
+        assert table.render() == markdown_tool.table_prettifier(
+            markdown_table.Table(table.columns, table.align))
+    assert table.render() == ["| a   | `x|y` |  c \\| d   |",
+                              "|-----|------:|:---------:|",
+                              "| abc |     1 | wide cell |"]
+
+
+def test_display_width():
+    """
+    Wide characters count for two columns, combining ones for none, and
+    the rows holding them are padded to their display width
+    """
+
+    assert [markdown_width.display_width(text) for text in (
+        "abc", "東京", "e\u0301", "👍", "한국어", "ａ", "a\u200bb")] == [
+        3, 4, 1, 2, 6, 2, 2]
+
+    table = markdown_tool.grab_table(["| a | b |", "|---|--:|",
+                                      "| 東京 | 1 |", "| x | y |"])
+    table.render()
+    for (col, row, value) in ((0, 2, "Zoe\u0308 👍 ok"), (1, 2, "サ"),
+                              (1, 1, "10000")):
+        table.set_cell(col, row, value)
+        assert table.render() == markdown_tool.table_prettifier(
+            markdown_table.Table(table.columns, table.align))
+    lines = table.render()
+    assert lines[2] == "| 東京      | 10000 |"
+    assert {markdown_width.display_width(line) for line in lines} == {21}
+
+
+@pytest.mark.skipif(unicodedata.unidata_version != "14.0.0",
+                    reason="width table generated from Unicode 14.0")
+def test_width_table_matches_unicode_database():
+    assert markdown_width.WIDTH_RANGES == tuple(
+        value for item in markdown_width.width_ranges() for value in item)
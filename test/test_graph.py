@@ -0,0 +1,117 @@
+# coding: utf-8
+
+"""
+Tests of the link graph of a project, the backlinks and the renaming
+of a note
+"""
+
+import os
+import pickle
+
+import markdown_graph
+import markdown_tasks
+import vim
+
+
+def write(path, lines):
+    os.makedirs(str(path.parent), exist_ok=True)
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+def read(path):
+    return path.read_text(encoding="utf-8").splitlines()
+
+
+def test_refresh_backlinks_and_reload(tmp_path):
+    write(tmp_path / "a.md", ["[b](b.md) [web](https://example.com)",
+                              "`[code](b.md)` [self](#top)"])
+    write(tmp_path / "sub" / "c.md", ["![img](../b.md#part)"])
+    write(tmp_path / "b.md", ["# B"])
+
+    graph = markdown_graph.LinkGraph(str(tmp_path))
+    assert graph.refresh() == 3
+    assert graph.backlinks("b.md") == [("a.md", 0),
+                                       (os.path.join("sub", "c.md"), 0)]
+
+    write(tmp_path / "a.md", ["no more link"])
+    assert graph.refresh() == 1
+    assert [link[0] for link in graph.backlinks("b.md")] == [
+        os.path.join("sub", "c.md")]
+
+    cache = str(tmp_path / "cache")
+    markdown_graph.save_graph(cache, graph)
+    loaded = markdown_graph.load_graph(cache, str(tmp_path))
+    assert loaded.refresh() == 0
+    assert loaded.files == graph.files
+    assert loaded.incoming == graph.incoming
+
+
+def test_rename_links():
+    lines = ["See [b](./b.md#part), [b](b.md) and [x](x%20y.md)",
+             "[outer](../out.md)"]
+
+    (renamed, count) = markdown_graph.rename_links(lines, "a.md", "b.md",
+                                                   "archive/old b.md")
+    assert count == 2
+    assert renamed[0] == ("See [b](./archive/old%20b.md#part), "
+                          "[b](archive/old%20b.md) and [x](x%20y.md)")
+
+    # The note moved rewrites its own relative links
+    (renamed, count) = markdown_graph.rename_links(lines, "a.md", "a.md",
+                                                   "sub/a.md")
+    assert count == 4
+    assert renamed == ["See [b](../b.md#part), [b](../b.md) and "
+                       "[x](../x%20y.md)", "[outer](../../out.md)"]
+
+
+def test_rename_note(tmp_path):
+    write(tmp_path / "notes" / "a.md", ["[b](../b.md)"])
+    write(tmp_path / "b.md", ["[a](notes/a.md#top)"])
+    write(tmp_path / "c.md", ["[a](notes/a.md)"])
+
+    # c.md is open in a buffer, the note renamed is the current one
+    other = vim.setup(["[a](notes/a.md)"])
+    other.name = str(tmp_path / "c.md")
+    buf = vim.setup(["[b](../b.md)", "new line"],
+                    g_mardownToolCacheDir=str(tmp_path / "cache"),
+                    **{"getcwd()": str(tmp_path)})
+    buf.name = str(tmp_path / "notes" / "a.md")
+
+    vim.run("rename_note", args=["../archive/a2"])
+
+    assert not (tmp_path / "notes" / "a.md").exists()
+    assert buf.name == str(tmp_path / "archive" / "a2.md")
+    assert read(tmp_path / "archive" / "a2.md") == ["[b](../b.md)",
+                                                    "new line"]
+    assert read(tmp_path / "b.md") == ["[a](archive/a2.md#top)"]
+    assert other.content == ["[a](archive/a2.md)"]
+    assert read(tmp_path / "c.md") == ["[a](notes/a.md)"]
+    assert vim.messages[-1].endswith("2 link(s) rewritten in 2 file(s)")
+
+    vim.run("backlinks")
+    assert [entry["filename"] for entry in vim.quickfix] == [
+        str(tmp_path / "b.md")]
+
+
+def test_load_foreign_pickles(tmp_path):
+    cache = str(tmp_path / "cache")
+    root = str(tmp_path)
+    os.makedirs(cache)
+    pickles = [
+        b"not a pickle", pickle.dumps((1, 2, 3))[:-3],
+        # Classes moved or renamed since the pickle was written
+        b"cno_such_module\nLinkGraph\n.", b"cmarkdown_graph\nNoSuchClass\n.",
+        # Other layouts of the file
+        pickle.dumps(42), pickle.dumps((1, 2, 3)),
+        pickle.dumps((markdown_graph.GRAPH_VERSION, "graph"))]
+
+    for data in pickles:
+        for path in (markdown_graph.graph_path(cache, root),
+                     markdown_tasks.index_path(cache, root)):
+            with open(path, "wb") as target:
+                target.write(data)
+        graph = markdown_graph.load_graph(cache, root)
+        assert (graph.root, graph.files) == (root, {})
+        index = markdown_tasks.load_index(cache, root)
+        assert isinstance(index, markdown_tasks.TaskIndex)
+        assert index.root == root
@@ -0,0 +1,101 @@
+# coding: utf-8
+
+"""
+Tests of the HTML export and of the live preview
+"""
+
+import http.client
+import json
+import urllib.request
+
+import markdown_html
+import markdown_index
+import markdown_preview
+import vim
+
+DOCUMENT = [
+    "# Notes *draft*", "",
+    "Some **bold**, `a|b` and [a link](http://example.com).", "",
+    "| name | size |", "|:-----|-----:|", "| a \\| b | 2 |", "",
+    "- [X] done", "- [ ] todo", "    1. nested", "",
+    "```python", "if a < b:", "```",
+]
+
+
+def render(lines):
+    return [text for (_, text) in
+            markdown_html.HtmlRenderer().render(
+                markdown_index.DocumentIndex(lines))]
+
+
+def test_render_blocks():
+    blocks = render(DOCUMENT)
+    assert blocks[0] == '<h1 id="notes-draft">Notes <em>draft</em></h1>'
+    assert blocks[1] == ('<p>Some <strong>bold</strong>, <code>a|b</code> '
+                         'and <a href="http://example.com">a link</a>.</p>')
+    assert ('<th style="text-align: left">name</th>'
+            '<th style="text-align: right">size</th>') in blocks[2]
+    assert "<td style=\"text-align: left\">a | b</td>" in blocks[2]
+    assert '<li class="task"><input type="checkbox" disabled checked> ' \
+        'done' in blocks[3]
+    assert "<ol>\n<li>nested" in blocks[3]
+    assert blocks[4] == ('<pre><code class="language-python">'
+                         'if a &lt; b:\n</code></pre>')
+
+
+def test_only_changed_blocks_rendered():
+    lines = []
+    for i in range(2000):
+        lines += ["## Part %d" % i, "", "Text of part %d." % i, ""]
+    index = markdown_index.DocumentIndex(lines)
+    renderer = markdown_html.HtmlRenderer()
+    old = renderer.render(index)
+    assert renderer.rendered == 4000
+
+    index.update(1002, 1003, ["Text *changed*."])
+    new = renderer.render(index)
+    assert renderer.rendered == 1
+    assert markdown_html.block_diff([digest for (digest, _) in old],
+                                    [digest for (digest, _) in new]) == \
+        (501, 502, 502)
+
+
+def test_to_html(tmp_path):
+    path = tmp_path / "notes.html"
+    vim.setup(DOCUMENT)
+    vim.run("to_html", args=[str(path)])
+
+    text = path.read_text(encoding="utf-8")
+    assert "<title>Notes draft</title>" in text
+    assert '<main id="content">\n<h1 id="notes-draft">' in text
+
+
+def test_preview_streams_block_changes():
+    server = markdown_preview.PreviewServer("Notes")
+    url = server.start()
+    try:
+        index = markdown_index.DocumentIndex(DOCUMENT)
+        renderer = markdown_html.HtmlRenderer()
+        server.update(renderer.render(index))
+
+        with urllib.request.urlopen(url, timeout=5) as response:
+            page = response.read().decode("utf-8")
+        assert 'new EventSource("/events?since=1")' in page
+        assert "<strong>bold</strong>" in page
+
+        connection = http.client.HTTPConnection(
+            "127.0.0.1", int(url.split(":")[2].strip("/")), timeout=5)
+        connection.request("GET", "/events?since=1")
+        response = connection.getresponse()
+
+        index.update(2, 3, ["Some *other* text."])
+        assert server.update(renderer.render(index))
+
+        assert response.fp.readline() == b"id: 2\n"
+        data = response.fp.readline().decode("utf-8")
+        change = json.loads(data[len("data: "):])
+        assert change == {"start": 1, "end": 2,
+                          "html": ["<p>Some <em>other</em> text.</p>"]}
+        connection.close()
+    finally:
+        server.stop()
@@ -0,0 +1,166 @@
+# coding: utf-8
+
+"""
+Tests of the links checker: the links found in the document, the local
+files and anchors, and the web links requested from a local HTTP server
+"""
+
+import asyncio
+import http.server
+import threading
+import time
+
+import pytest
+
+import markdown_index
+import markdown_links
+
+DOCUMENT = [
+    "# Title",
+    "",
+    "[top](#) [title](#title) [nowhere](#nowhere)",
+    "[file](other.md) [heading](other.md#usage) [bad](other.md#nope)",
+    "![missing](images/missing.png) `[code](code.md)` [empty]()",
+    "<!-- [comment](comment.md) --> <img src=\"other.md\">",
+    "```",
+    "[fence](fence.md)",
+    "```",
+    "[web](https://example.com/page) [mail](mailto:me@example.com)",
+]
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    """
+    Handler of the test server, answering depending on the path:
+    /missing is not found, /nohead refuses HEAD requests, /slow answers
+    HEAD then GET after a delay, and the other paths are found
+    """
+
+    def reply(self):
+        server = self.server
+        with server.lock:
+            server.requests.append(self.path)
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        try:
+            if self.path.startswith("/slow"):
+                time.sleep(0.8)
+            elif self.path.startswith("/busy"):
+                time.sleep(0.2)
+            if self.path == "/missing":
+                self.send_response(404)
+            elif self.path.startswith(("/nohead", "/slow")) and (
+                    self.command == "HEAD"):
+                self.send_response(405)
+            else:
+                self.send_response(200)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    do_HEAD = do_GET = reply
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.requests = []
+    server.active = server.max_active = 0
+    server.url = "http://127.0.0.1:%d/" % server.server_port
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def check_urls(urls, cache, **options):
+    return asyncio.run(markdown_links.check_urls(urls, cache, **options))
+
+
+def test_local_links(tmp_path):
+    (tmp_path / "other.md").write_text("# Usage\n\ntext\n", encoding="utf-8")
+    index = markdown_index.DocumentIndex(DOCUMENT)
+    links = markdown_links.extract_links(index)
+
+    assert [(link.target, link.row, link.col, link.is_image)
+            for link in links] == [
+        ("#", 2, 0, False), ("#title", 2, 9, False),
+        ("#nowhere", 2, 25, False), ("other.md", 3, 0, False),
+        ("other.md#usage", 3, 17, False), ("other.md#nope", 3, 43, False),
+        ("images/missing.png", 4, 0, True), ("", 4, 49, False),
+        ("other.md", 5, 41, False), ("https://example.com/page", 9, 0, False),
+        ("mailto:me@example.com", 9, 32, False)]
+
+    (problems, web_links) = markdown_links.local_problems(
+        links, index.anchors(), str(tmp_path))
+    assert [(problem.row, problem.col, problem.severity, problem.message)
+            for problem in problems] == [
+        (2, 25, "E", "No heading for anchor #nowhere"),
+        (3, 43, "E", "No heading for anchor #nope in other.md#nope"),
+        (4, 0, "E", "File not found: images/missing.png"),
+        (4, 49, "W", "Empty link")]
+    assert [link.target for link in web_links] == ["https://example.com/page"]
+
+
+def test_check_urls(server):
+    cache = markdown_links.LinkCache(None, 60)
+    urls = [server.url + path for path in ("found", "missing", "nohead")]
+
+    results = check_urls(urls, cache)
+    assert results == dict(zip(urls, (200, 404, 200)))
+    # HEAD refused, the URL is requested again with GET
+    assert sorted(server.requests) == ["/found", "/missing", "/nohead",
+                                       "/nohead"]
+
+
+def test_check_urls_cache_ttl(server, tmp_path):
+    path = str(tmp_path / "links.json")
+    cache = markdown_links.LinkCache(path, 60)
+    (found, missing) = (server.url + "found", server.url + "missing")
+
+    check_urls([found, missing], cache)
+    cache.save()
+    assert len(server.requests) == 2
+
+    # The statuses of the cache are not requested again
+    cache = markdown_links.LinkCache(path, 60)
+    assert check_urls([found, missing], cache) == {found: 200, missing: 404}
+    assert len(server.requests) == 2
+
+    # Expired, they are
+    cache.entries[found][1] -= 61
+    assert check_urls([found, missing], cache) == {found: 200, missing: 404}
+    assert server.requests[2:] == ["/found"]
+    cache.entries[missing][1] -= 61
+    cache.save()
+    assert list(markdown_links.LinkCache(path, 60).entries) == [found]
+
+
+def test_check_urls_per_host(server):
+    cache = markdown_links.LinkCache(None, 60)
+    urls = [server.url + "busy/" + str(k) for k in range(6)]
+
+    results = check_urls(urls, cache, workers=8, per_host=2)
+    assert results == dict.fromkeys(urls, 200)
+    assert server.max_active == 2
+
+
+def test_check_urls_timeout(server):
+    cache = markdown_links.LinkCache(None, 60)
+    (slow, found) = (server.url + "slow", server.url + "found")
+
+    # HEAD refused after 0.8 s, the GET request only gets what's left of
+    # the timeout, and its thread is not waited for
+    start = time.monotonic()
+    results = check_urls([slow, found], cache, timeout=1)
+    assert time.monotonic() - start < 1.5
+    assert results == {slow: "Timeout", found: 200}
+    assert cache.get(slow) is None
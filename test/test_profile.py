@@ -0,0 +1,98 @@
+# coding: utf-8
+
+"""
+Tests of MdProfile: the latency of the commands, their round-trips with
+Vim, the cProfile stats, and of the cost of the logger when debug is off
+"""
+
+import pstats
+
+import pytest
+
+import markdown_profile
+import markdown_tool
+import vim
+
+
+@pytest.fixture
+def profiler():
+    vim.setup(["", "text"])
+    vim.run("profile", args=["reset"])
+    yield markdown_tool.PROFILER
+    vim.run("profile", args=["stop"])
+    vim.run("profile", args=["reset"])
+
+
+def test_profile_report(profiler):
+    vim.run("profile", args=["start"])
+    assert isinstance(markdown_tool.vim, markdown_profile.CountingVim)
+    vim.run("add_task", cursor=[1, 0])
+    vim.run("add_task", cursor=[2, 0], args=["write tests"])
+    vim.run("profile", args=["stop"])
+    assert markdown_tool.vim is markdown_tool.VIM
+    # Not profiled anymore
+    vim.run("add_task", cursor=[1, 0])
+
+    del vim.messages[:]
+    vim.run("profile")
+    report = [message[len("MarkdownTool: "):] for message in vim.messages]
+    assert report[0].split() == ["command", "calls", "mean", "ms", "p50",
+                                 "ms", "p90", "ms", "max", "ms"]
+    assert report[1].split()[:2] == ["add_task", "2"]
+    assert report[2].startswith("histogram (ms): <=1 <=2 <=5")
+    buckets = report[3].split()
+    assert buckets[0] == "add_task"
+    assert len(buckets) == len(markdown_profile.BUCKETS) + 1
+    assert sum(int(count) for count in buckets[1:]) == 2
+    assert report[4].startswith("api_calls: ")
+    assert profiler.counters["lines_written"] == 2
+
+    vim.run("profile", args=["reset"])
+    assert profiler.commands == {}
+
+
+def test_profile_pstats(profiler, tmp_path):
+    path = str(tmp_path / "markdown.prof")
+    vim.run("profile", args=["start", path])
+    vim.run("add_task", cursor=[1, 0])
+    vim.run("profile", args=["stop"])
+
+    assert vim.messages[-1] == (
+        "MarkdownTool: cProfile stats written to " + path)
+    functions = [function for (_, _, function) in pstats.Stats(path).stats]
+    assert "add_task" in functions
+
+
+def test_profile_command_raising(profiler, monkeypatch):
+    def broken():
+        raise ValueError("broken")
+
+    monkeypatch.setattr(markdown_tool, "broken",
+                        markdown_tool.command(broken), raising=False)
+    vim.run("profile", args=["start"])
+    with pytest.raises(ValueError):
+        vim.run("broken")
+    # Timed all the same, and the next commands are not nested in it
+    assert profiler.commands["broken"].calls == 1
+    assert profiler.depth == 0
+    vim.run("add_task", cursor=[1, 0])
+    assert profiler.commands["add_task"].calls == 1
+
+    vim.run("profile", args=["stop"])
+    assert markdown_tool.vim is markdown_tool.VIM
+    with pytest.raises(ValueError):
+        vim.run("broken")
+    assert profiler.commands["broken"].calls == 1
+
+
+def test_logger_without_debug():
+    vim.setup([""])
+    vim.run("add_task")
+    # Neither the debug level nor the messages cross over to Vim
+    assert vim.counters.eval == 0
+    assert not [cmd for cmd in vim.commands if cmd.startswith("echo")]
+
+    vim.setup([""], g_mardownToolDebug=1)
+    vim.run("add_task")
+    assert vim.counters.eval == 0
+    assert "DEBUG: MarkdownTool: Line is empty" in vim.messages
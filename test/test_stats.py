@@ -0,0 +1,72 @@
+# coding: utf-8
+
+"""
+Tests of the statistics of the document shown in the statusline, and of
+their update after an edit
+"""
+
+import markdown_index
+import markdown_stats
+import markdown_tool
+import vim
+
+DOCUMENT = [
+    "# Release notes",
+    "",
+    "See [the guide](https://example.com/guide-v2) before upgrading.",
+    "",
+    "- [X] write the changelog",
+    "- [ ] tag the release",
+    "    - [-] build the packages",
+    "- [C] announce it",
+    "",
+    "```sh",
+    "make release words in code",
+    "```",
+]
+
+
+def stats(lines):
+    counts = markdown_stats.DocumentStats()
+    counts.update(markdown_index.DocumentIndex(lines))
+    return counts.summary()
+
+
+def test_document_stats():
+    assert stats(DOCUMENT) == {
+        "words": 18, "minutes": 1, "tasks": 4, "done": 1,
+        "text": "18 words, 1 min, 1/4 tasks"}
+    assert stats(["a " * 401])["minutes"] == 3
+    assert stats([]) == {"words": 0, "minutes": 0, "tasks": 0, "done": 0,
+                         "text": "0 words, 0 min"}
+
+    # Only the blocks parsed again by the index are counted again
+    index = markdown_index.DocumentIndex(DOCUMENT)
+    counts = markdown_stats.DocumentStats()
+    assert counts.update(index) == 4
+    index.update(5, 6, ["- [X] tag the release, now"])
+    assert counts.update(index) == 1
+    assert counts.summary() == stats(index.lines)
+    # The heading removed, the blocks following it are only shifted
+    index.update(0, 2, [])
+    assert counts.update(index) == 0
+    assert counts.summary() == stats(index.lines)
+    assert counts.words == 17
+
+
+def test_update_stats_once_per_change():
+    markdown_tool.STATS.clear()
+    buf = vim.setup(DOCUMENT)
+
+    vim.run("update_stats")
+    assert vim.variables["b:markdown_tool_stats"]["text"] == (
+        "18 words, 1 min, 1/4 tasks")
+    assert vim.variables["b:markdown_tool_stats_tick"] == buf.changedtick
+
+    buf[5] = "- [X] tag the release"
+    vim.counters.reset()
+    vim.run("update_stats")
+    # A single command sets the statistics and their version
+    assert vim.counters.command == 1
+    assert vim.variables["b:markdown_tool_stats"]["done"] == 2
+    assert vim.variables["b:markdown_tool_stats_tick"] == buf.changedtick
@@ -0,0 +1,211 @@
+# coding: utf-8
+
+"""
+Tests of the background worker, its protocol and the commands it runs
+"""
+
+import io
+import json
+import os
+import time
+
+import pytest
+
+import markdown_tool
+import markdown_worker
+import vim
+from conftest import TEST_DIR
+
+GOLDEN_DIR = os.path.join(TEST_DIR, "golden")
+
+TABLE = ["# Title", "", "|a|b|", "|-|-|", "|1|22|", ""]
+PRETTY = ["| a | b  |", "|---|----|", "| 1 | 22 |"]
+
+
+def read_lines(name):
+    with open(os.path.join(GOLDEN_DIR, name), encoding="utf-8") as source:
+        return source.read().splitlines()
+
+
+def request(worker, method, **params):
+    return worker.handle({"jsonrpc": "2.0", "id": 1, "method": method,
+                          "params": params})
+
+
+def test_prettify_incremental_document():
+    worker = markdown_worker.Worker()
+    response = request(worker, "prettify", bufnr=1, changedtick=1,
+                       lines=TABLE)
+    assert response["result"]["start"] == 2
+    assert response["result"]["lines"] == PRETTY
+
+    # Only the changed line is sent, based on version 1
+    response = request(worker, "prettify", bufnr=1, changedtick=2, base=1,
+                       first=4, last=5, lines=["|1|333|"])
+    assert response["result"]["lines"][2] == "| 1 | 333 |"
+
+    response = request(worker, "toc", bufnr=1, changedtick=3, base=1,
+                       first=0, last=0, lines=[])
+    assert response["error"]["code"] == markdown_worker.OUT_OF_SYNC
+
+
+def test_serve_errors():
+    source = io.StringIO("not json\n" + json.dumps(
+        {"jsonrpc": "2.0", "id": 7, "method": "document"}) + "\n")
+    target = io.StringIO()
+    markdown_worker.serve(source, target)
+
+    responses = [json.loads(line) for line in target.getvalue().splitlines()]
+    assert responses[0]["error"]["code"] == -32700
+    assert responses[1]["id"] == 7
+    assert responses[1]["error"]["code"] == markdown_worker.METHOD_NOT_FOUND
+
+
+@pytest.fixture
+def worker():
+    yield
+    if markdown_tool.WORKER["client"] is not None:
+        markdown_tool.WORKER["client"].stop()
+    markdown_tool.WORKER.update(client=None, timer=None)
+    markdown_tool.WORKER_DOCS.clear()
+
+
+def wait_worker():
+    deadline = time.monotonic() + 10
+    while markdown_tool.WORKER["timer"] is not None:
+        assert time.monotonic() < deadline, "worker didn't answer"
+        time.sleep(0.01)
+        markdown_tool.worker_poll()
+
+
+def test_prettify_all_in_worker(worker, monkeypatch):
+    buf = vim.setup(read_lines("prettify_all.in.md"),
+                    g_mardownToolWorkerThreshold=0)
+    vim.run("prettify_all")
+    assert buf.content == read_lines("prettify_all.in.md")
+
+    wait_worker()
+    assert buf.content == read_lines("prettify_all.out.md")
+    (changedtick, _) = markdown_tool.WORKER_DOCS[buf.number]
+
+    # The next request only sends the lines changed since the version the
+    # worker holds: the new table and the one prettified
+    sent = []
+    send = markdown_worker.WorkerClient.request
+    monkeypatch.setattr(markdown_worker.WorkerClient, "request",
+                        lambda client, method, params, *args: sent.append(
+                            params) or send(client, method, params, *args))
+    buf[0:0] = ["|c|d|", "|-|-|"]
+    vim.run("prettify_all")
+    assert (sent[0]["base"], sent[0]["first"]) == (changedtick, 0)
+    assert sent[0]["lines"][:2] == ["|c|d|", "|-|-|"]
+    wait_worker()
+    assert buf.content[:2] == ["| c | d |", "|---|---|"]
+
+
+def test_stale_result_discarded(worker):
+    buf = vim.setup(TABLE, g_mardownToolWorkerThreshold=0)
+    vim.run("prettify_all")
+    buf[0] = "# Changed"
+
+    wait_worker()
+    assert buf.content == ["# Changed"] + TABLE[1:]
+
+
+def write_csv(tmp_path):
+    path = tmp_path / "data.csv"
+    path.write_text("name,size\na,1\nb,22\nc,333\n", encoding="utf-8")
+    return str(path)
+
+
+def test_import_csv_sent_in_batches(tmp_path):
+    notifications = []
+    worker = markdown_worker.Worker(
+        lambda method, params: notifications.append((method, params)))
+    response = request(worker, "import_csv", path=write_csv(tmp_path),
+                       delimiter=",", batch=2)
+
+    assert response["result"] == {"lines": 5}
+    assert [len(params["lines"]) for (_, params) in notifications] == [
+        2, 2, 1]
+    assert all(method == "lines" and params["id"] == 1
+               for (method, params) in notifications)
+
+
+def test_import_csv_in_worker(worker, tmp_path, monkeypatch):
+    path = write_csv(tmp_path)
+    buf = vim.setup(["before", "after"], (1, 0),
+                    g_mardownToolWorkerThreshold=-1)
+    vim.run("import_csv", args=[path])
+    expected = buf.content
+
+    # The batches are appended one after the other, each one changing
+    # the buffer the next one is appended to
+    monkeypatch.setattr(markdown_tool, "APPEND_BATCH", 2)
+    buf = vim.setup(["before", "after"], (1, 0),
+                    g_mardownToolWorkerThreshold=0)
+    vim.run("import_csv", args=[path])
+    wait_worker()
+    assert buf.content == expected
+
+
+def test_worker_duration_updates_the_estimate(worker, monkeypatch):
+    """
+    The duration measured by the worker updates the estimate the next
+    command is routed on, so a command fast again leaves the worker
+    """
+
+    monkeypatch.setitem(markdown_tool.LATENCY, "prettify_all", 1000.0)
+    buf = vim.setup(TABLE)
+    vim.run("prettify_all")
+    assert buf.content == TABLE
+    wait_worker()
+
+    assert buf.content[2:5] == PRETTY
+    assert markdown_tool.LATENCY["prettify_all"] < 1000.0
+    assert "MdPrettifyAll" not in markdown_tool.LATENCY
+
+
+def test_import_csv_streamed_as_one_undo_step(worker, tmp_path,
+                                              monkeypatch):
+    """
+    The worker waits once the editor holds QUEUE_SIZE messages, and the
+    batches appended are joined into a single undo step
+    """
+
+    path = tmp_path / "big.csv"
+    path.write_text("n,square\n" + "".join(
+        "%d,%d\n" % (n, n * n) for n in range(60)), encoding="utf-8")
+    monkeypatch.setattr(markdown_worker, "QUEUE_SIZE", 2)
+    monkeypatch.setattr(markdown_tool, "APPEND_BATCH", 4)
+    buf = vim.setup(["before"], (1, 0), g_mardownToolWorkerThreshold=0)
+    joined = vim.commands.count("silent! undojoin")
+
+    vim.run("import_csv", args=[str(path)])
+    client = markdown_tool.WORKER["client"]
+    deadline = time.monotonic() + 10
+    while markdown_tool.WORKER["timer"] is not None:
+        assert time.monotonic() < deadline, "worker didn't answer"
+        assert client.responses.qsize() <= 2
+        time.sleep(0.01)
+        markdown_tool.worker_poll()
+
+    # 62 lines appended in 16 batches
+    assert len(buf.content) == 63
+    assert buf.content[1:3] == ["| n  | square |", "|----|--------|"]
+    assert buf.content[-1] == "| 59 | 3481   |"
+    assert vim.commands.count("silent! undojoin") - joined == 15
+
+
+def test_out_of_sync_sends_the_document_again(worker):
+    buf = vim.setup(TABLE, g_mardownToolWorkerThreshold=0)
+    vim.run("prettify_all")
+    wait_worker()
+
+    # The change sent is based on a version the worker doesn't hold
+    (changedtick, lines) = markdown_tool.WORKER_DOCS[buf.number]
+    markdown_tool.WORKER_DOCS[buf.number] = (changedtick + 100, lines)
+    buf[0:0] = ["|c|d|", "|-|-|"]
+    vim.run("prettify_all")
+    wait_worker()
+    assert buf.content[:2] == ["| c | d |", "|---|---|"]
@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Plugin:      https://github.com/dpretet/vim-markdow-tool
+Description: In-memory stand-in of the vim module, to run the plugin headless
+Maintainer:  Damien Pretet https://github.com/dpretet
+
+Emulates the parts of the Vim Python API the plugin uses: the buffers, the
+current window, eval and command. Each round-trip with Vim is counted,
+with the lines read and written, so the tests and the benchmarks can
+measure them. run() calls a command like the Vimscript side does.
+
+Usage:
+
+    import vim
+    vim.setup(["| a | b |"], cursor=(1, 0))
+    vim.run("export_csv", args=["file.csv"])
+    vim.current.buffer[:]
+"""
+
+import json
+import os
+import re
+import sys
+
+# Values of the plugin options, as set by plugin/markdown_tool.vim
+DEFAULTS = {
+    "g:mardownToolNewStatus": " ",
+    "g:mardownToolOngoingStatus": "-",
+    "g:mardownToolDoneStatus": "X",
+    "g:mardownToolCancelStatus": "C",
+    "g:mardownToolDebug": 0,
+    "g:mardownToolTaskAutoComplete": 0,
+    "g:mardownToolTaskWorkers": 0,
+    "g:mardownToolCacheDir": "~/.cache/vim-markdown-tool",
+    "g:mardownToolLinkTTL": 86400,
+    "g:mardownToolLinkWorkers": 16,
+    "g:mardownToolLinkPerHost": 2,
+    "g:mardownToolLinkTimeout": 10,
+    "g:mardownToolWorkerThreshold": 200,
+    "g:mardownToolWorkerPython": sys.executable,
+    "g:mardownToolLiveAlign": 0,
+    "g:mardownToolLiveAlignDelay": 150,
+    "g:mardownToolPreviewPort": 0,
+    "g:mardownToolPreviewOpen": 0,
+    "g:mardownToolFolding": 0,
+    "g:mardownToolReadingSpeed": 200,
+    "g:mardownToolCodeFormatters": {},
+    "g:mardownToolCodeWorkers": 4,
+    "g:mardownToolCodeTimeout": 10,
+    "has('nvim')": 0,
+    "shiftwidth()": 4,
+    "&expandtab": 1,
+    "&tabstop": 8,
+    "@+": "",
+}
+
+
+class error(Exception):
+    pass
+
+
+class Counters(object):
+    """
+    Round-trips with Vim, by kind, and lines transferred
+    """
+
+    __slots__ = ("eval", "command", "buffer", "cursor", "lines_read",
+                 "lines_written")
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.eval = 0
+        self.command = 0
+        self.buffer = 0
+        self.cursor = 0
+        self.lines_read = 0
+        self.lines_written = 0
+
+    @property
+    def api_calls(self):
+        return self.eval + self.command + self.buffer + self.cursor
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+counters = Counters()
+
+
+class Buffer(object):
+    """
+    A buffer, a list of strings indexed from 0 like the Vim one
+    """
+
+    def __init__(self, lines, number):
+        self._lines = list(lines) or [""]
+        self.number = number
+        self.changedtick = 1
+        self.name = ""
+
+    def _changed(self):
+        self.changedtick += 1
+        if not self._lines:
+            self._lines = [""]
+
+    def __len__(self):
+        counters.buffer += 1
+        return len(self._lines)
+
+    def __iter__(self):
+        counters.buffer += 1
+        counters.lines_read += len(self._lines)
+        return iter(list(self._lines))
+
+    def __getitem__(self, key):
+        counters.buffer += 1
+        if isinstance(key, slice):
+            lines = self._lines[key]
+            counters.lines_read += len(lines)
+            return lines
+        counters.lines_read += 1
+        return self._lines[key]
+
+    def __setitem__(self, key, value):
+        counters.buffer += 1
+        if value is None:
+            del self._lines[key]
+        elif isinstance(key, slice):
+            value = list(value)
+            self._check(value)
+            self._lines[key] = value
+            counters.lines_written += len(value)
+        else:
+            self._check([value])
+            self._lines[key] = value
+            counters.lines_written += 1
+        self._changed()
+
+    def __delitem__(self, key):
+        counters.buffer += 1
+        del self._lines[key]
+        self._changed()
+
+    def append(self, lines, nr=None):
+        counters.buffer += 1
+        if isinstance(lines, str):
+            lines = [lines]
+        lines = list(lines)
+        self._check(lines)
+        if nr is None:
+            nr = len(self._lines)
+        self._lines[nr:nr] = lines
+        counters.lines_written += len(lines)
+        self._changed()
+
+    @staticmethod
+    def _check(lines):
+        for line in lines:
+            if not isinstance(line, str) or "\n" in line:
+                raise error("string cannot contain newlines")
+
+    @property
+    def content(self):
+        """
+        The lines of the buffer, not counted as a round-trip
+        """
+        return list(self._lines)
+
+
+class Window(object):
+    """
+    A window, whose cursor is (row from 1, byte column from 0)
+    """
+
+    def __init__(self, cursor=(1, 0)):
+        self._cursor = cursor
+
+    @property
+    def cursor(self):
+        counters.cursor += 1
+        return self._cursor
+
+    @cursor.setter
+    def cursor(self, cursor):
+        counters.cursor += 1
+        (row, col) = cursor
+        if not 1 <= row <= len(current.buffer.content):
+            raise error("cursor position outside buffer")
+        self._cursor = (row, col)
+
+
+class Current(object):
+
+    def __init__(self):
+        self.buffer = Buffer([""], 1)
+        self.window = Window()
+
+    @property
+    def line(self):
+        counters.buffer += 1
+        counters.lines_read += 1
+        return self.buffer.content[self.window._cursor[0] - 1]
+
+    @line.setter
+    def line(self, value):
+        self.buffer[self.window._cursor[0] - 1] = value
+
+
+current = Current()
+
+# The buffers opened, by number
+buffers = {current.buffer.number: current.buffer}
+
+# Variables and expressions eval can answer, reset by setup
+variables = dict(DEFAULTS)
+
+# The commands executed, the messages echoed and the quickfix list
+commands = []
+messages = []
+quickfix = []
+loclist = []
+
+_next_buffer = [1]
+_next_timer = [1]
+
+
+def setup(lines, cursor=(1, 0), **names):
+    """
+    Open a new buffer with lines, put the cursor at (row, col) and define
+    the variables the plugin functions read, like args or task_status.
+    The plugin options are reset to their default values, which can be
+    overridden as well, g_mardownToolDebug for g:mardownToolDebug.
+
+    Returns:
+        - the buffer
+    """
+
+    _next_buffer[0] += 1
+    current.buffer = Buffer(lines, _next_buffer[0])
+    buffers[current.buffer.number] = current.buffer
+    current.window = Window(cursor)
+
+    variables.clear()
+    variables.update(DEFAULTS)
+    variables["getcwd()"] = os.getcwd()
+    variables["expand('%:p:h')"] = os.getcwd()
+    for (name, value) in names.items():
+        if name.startswith(("g_", "b_")):
+            name = name[0] + ":" + name[2:]
+        variables[name] = value
+
+    del commands[:]
+    del messages[:]
+    del quickfix[:]
+    del loclist[:]
+    counters.reset()
+    return current.buffer
+
+
+def run(command, *params, **context):
+    """
+    Call a command of the plugin like s:Run of autoload/markdown_tool.vim:
+    with its arguments and a snapshot of the editor state, in JSON. The
+    snapshot is not counted as a round-trip, it's sent with the call.
+
+    Arguments:
+        - command: the function of markdown_tool to call
+        - params: its positional arguments
+        - context: the arguments of the Vim command, args, bang, first and
+          last, or values replacing the ones of the snapshot
+    """
+
+    import markdown_tool
+
+    (row, col) = current.window._cursor
+    request = {
+        "command": command,
+        "params": list(params),
+        "args": [],
+        "bang": 0,
+        "cursor": [row, col],
+        "line": current.buffer.content[row - 1],
+        "changedtick": current.buffer.changedtick,
+        "path": current.buffer.name,
+        "cwd": variables["getcwd()"],
+        "shiftwidth": variables["shiftwidth()"],
+        "expandtab": variables["&expandtab"],
+        "tabstop": variables["&tabstop"],
+        "options": {name[2:]: value for (name, value) in variables.items()
+                    if name.startswith("g:mardownTool")},
+    }
+    request.update(context)
+    return markdown_tool.dispatch(json.dumps(request))
+
+
+def to_vim(value):
+    """
+    Convert a Python value the way vim.eval returns it: numbers as strings
+    """
+
+    if isinstance(value, (list, tuple)):
+        return [to_vim(item) for item in value]
+    if isinstance(value, dict):
+        return {key: to_vim(item) for (key, item) in value.items()}
+    return str(value)
+
+
+def split_list(expr):
+    """
+    Split the items of a list expression [a, f(b, c), 'd']
+    """
+
+    items = []
+    depth = 0
+    quote = None
+    escaped = False
+    start = 0
+    for (i, char) in enumerate(expr):
+        if quote:
+            if escaped:
+                escaped = False
+            elif char == "\\" and quote == '"':
+                escaped = True
+            elif char == quote:
+                quote = None
+        elif char in "'\"":
+            quote = char
+        elif char in "([{":
+            depth += 1
+        elif char in ")]}":
+            depth -= 1
+        elif char == "," and depth == 0:
+            items.append(expr[start:i].strip())
+            start = i + 1
+    items.append(expr[start:].strip())
+    return [item for item in items if item]
+
+
+def evaluate(expr):
+    expr = expr.strip()
+
+    if expr.startswith("[") and expr.endswith("]"):
+        return [evaluate(item) for item in split_list(expr[1:-1])]
+
+    if expr == "b:changedtick":
+        return current.buffer.changedtick
+
+    match = re.match(r"getbufvar\((\d+), 'changedtick'\)$", expr)
+    if match:
+        buf = buffers.get(int(match.group(1)))
+        return buf.changedtick if buf is not None else ""
+
+    if expr == "expand('%:p')":
+        return current.buffer.name
+
+    if expr.startswith("map(getbufinfo("):
+        return [[number, buf.name] for (number, buf) in buffers.items()]
+
+    if expr.startswith("timer_start("):
+        _next_timer[0] += 1
+        return _next_timer[0]
+
+    if expr in variables:
+        return variables[expr]
+
+    raise error("E121: Undefined variable: " + expr)
+
+
+def eval(expr):
+    counters.eval += 1
+    return to_vim(evaluate(expr))
+
+
+def vim_string(literal):
+    """
+    Read a Vim string literal, double quoted (JSON compatible)
+    or single quoted
+    """
+
+    literal = literal.strip()
+    if literal.startswith('"'):
+        return json.loads(literal)
+    if literal.startswith("'"):
+        return literal[1:-1].replace("''", "'")
+    return literal
+
+
+def command(cmd):
+    counters.command += 1
+    commands.append(cmd)
+
+    (name, _, arg) = cmd.strip().partition(" ")
+
+    if name in ("echo", "echomsg"):
+        messages.append(vim_string(arg))
+    elif name == "echoerr":
+        raise error(vim_string(arg))
+    elif name == "call" and arg.startswith(("setqflist(", "setloclist(")):
+        target = quickfix if arg.startswith("setqflist(") else loclist
+        items = split_list(arg[arg.index("(") + 1:-1])
+        entries = items[1] if target is loclist else items[0]
+        target[:] = json.loads(entries)
+    elif name == "execute" and "saveas" in arg:
+        # Write the buffer under its new name
+        path = json.loads(arg[arg.index("fnameescape(") + 12:-1])
+        with open(path, "w", encoding="utf-8") as target:
+            target.write("\n".join(current.buffer.content) + "\n")
+        current.buffer.name = path
+    elif name == "let" and arg.startswith("b:"):
+        # let b:name = value, chained with updates of the lists
+        for part in cmd.split(" | "):
+            (name, _, arg) = part.strip().partition(" ")
+            args = split_list(arg[arg.find("(") + 1:-1])
+            if name == "let":
+                (var, _, value) = arg.partition(" = ")
+                variables[var] = json.loads(value)
+            elif arg.startswith("remove("):
+                del variables[args[0]][int(args[1]):int(args[2]) + 1]
+            elif arg.startswith("extend("):
+                index = int(args[2])
+                variables[args[0]][index:index] = json.loads(args[1])